@@ -0,0 +1,63 @@
+'''Management command to fill the devsite with synthetic data
+
+see ``devsite.seed``
+'''
+
+from __future__ import print_function
+
+import time
+from textwrap import dedent
+
+from django.core.management.base import BaseCommand
+
+from figures.helpers import as_date
+
+from devsite import seed
+
+
+class Command(BaseCommand):
+    '''Seed the devsite with synthetic users, courses and enrollments
+    '''
+    help = dedent(__doc__).strip()
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users',
+                            type=int,
+                            default=seed.DEFAULT_USERS,
+                            help='number of users to create')
+        parser.add_argument('--courses',
+                            type=int,
+                            default=seed.DEFAULT_COURSES,
+                            help='number of courses to create')
+        parser.add_argument('--enrollments',
+                            type=int,
+                            default=seed.DEFAULT_ENROLLMENTS,
+                            help='number of enrollments to create over all the courses')
+        parser.add_argument('--days',
+                            type=int,
+                            default=seed.DEFAULT_DAYS,
+                            help='number of days of history to spread the data over')
+        parser.add_argument('--end-date',
+                            help='last date of the history in yyyy-mm-dd format. Defaults to today')
+        parser.add_argument('--seed',
+                            type=int,
+                            help='random seed. The same seed creates the same data')
+        parser.add_argument('--batch-size',
+                            type=int,
+                            default=seed.DEFAULT_BATCH_SIZE,
+                            help='number of rows buffered for each bulk insert')
+
+    def handle(self, *args, **options):
+        print('seeding the devsite...')
+        start_time = time.time()
+        counts = seed.seed_data(
+            users=options['users'],
+            courses=options['courses'],
+            enrollments=options['enrollments'],
+            days=options['days'],
+            end_date=as_date(options['end_date']) if options['end_date'] else None,
+            seed=options['seed'],
+            batch_size=options['batch_size'])
+        for name, count in sorted(counts.items()):
+            print('{}: {}'.format(name, count))
+        print('Done in {:.1f} seconds.'.format(time.time() - start_time))
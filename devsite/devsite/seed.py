@@ -0,0 +1,319 @@
+'''Generates synthetic edx-platform data for the devsite
+
+The tests create objects one at a time with the factories, which is far too
+slow to fill the devsite with data at production scale. ``seed_data`` writes
+the data with ``bulk_create`` instead, and draws the volumes and dates from
+distributions that look like a real site:
+
+* Users sign up over the whole history, more of them recently, as on a growing
+  site. Each user has a profile
+* Course sizes follow a power law. A few courses hold most of the enrollments
+* Learners enroll soon after they join or the course opens, whichever is
+  later. Most enrollments are audit and a few are inactive
+* Most learners have some courseware activity after they enroll. Their last
+  activity trails off over the following weeks, so any day has some active
+  learners
+* A course's completion rate is between 2 and 20 percent. Only active learners
+  earn certificates
+* Each course has one to three staff or instructor access roles
+
+The data are the same for the same ``seed`` on an empty database. The ids of
+the new users start after the largest existing user id.
+
+Use the ``seed_figures_data`` management command to run it.
+'''
+
+from __future__ import absolute_import, division
+
+import datetime
+import itertools
+import random
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.db.models import Max
+from django.utils.timezone import utc
+
+from opaque_keys.edx.keys import CourseKey
+
+from certificates.models import GeneratedCertificate
+from courseware.models import StudentModule
+from openedx.core.djangoapps.content.course_overviews.models import (
+    CourseOverview,
+)
+from student.models import CourseAccessRole, CourseEnrollment, UserProfile
+
+
+DEFAULT_USERS = 1000
+DEFAULT_COURSES = 20
+DEFAULT_ENROLLMENTS = 5000
+DEFAULT_DAYS = 365
+DEFAULT_BATCH_SIZE = 5000
+
+# Shape of the course size power law. Smaller is more skewed
+COURSE_SIZE_ALPHA = 1.2
+
+ORGS = ['FigX', 'AlphaU', 'BetaInst', 'GammaOrg', 'DeltaCollege']
+
+# (value, weight) pairs
+COUNTRIES = [('US', 30), ('IN', 15), ('CN', 8), ('BR', 6), ('GB', 5),
+             ('MX', 4), ('DE', 4), ('EG', 3), ('NG', 3), ('', 22)]
+GENDERS = [('m', 45), ('f', 40), ('o', 5), (None, 10)]
+LEVELS_OF_EDUCATION = [('b', 30), ('m', 20), ('hs', 20), ('a', 8), ('p', 4),
+                       ('jhs', 3), ('none', 2), ('other', 3), (None, 10)]
+ENROLLMENT_MODES = [('audit', 80), ('verified', 18), ('honor', 2)]
+ACCESS_ROLES = [('staff', 70), ('instructor', 30)]
+
+# Chance that an enrollment is active
+ENROLLMENT_ACTIVE_RATE = 0.95
+
+# Mean days from joining or the course opening to enrolling
+MEAN_DAYS_TO_ENROLL = 14
+
+# Chance that a learner has any courseware activity in the course
+LEARNER_ACTIVITY_RATE = 0.7
+
+# Mean number of StudentModule rows for a learner with activity
+MEAN_MODULES_PER_LEARNER = 3
+
+# Mean days from enrolling to a module's last activity
+MEAN_DAYS_ACTIVE = 30
+
+# Mean days from enrolling to earning a certificate
+MEAN_DAYS_TO_COMPLETE = 45
+
+
+def weighted_choice(rng, choices):
+    '''Returns a value from a list of ``(value, weight)`` pairs
+    '''
+    total = sum(weight for value, weight in choices)
+    point = rng.uniform(0, total)
+    for value, weight in choices:
+        point -= weight
+        if point <= 0:
+            return value
+    return choices[-1][0]
+
+
+def chunks(iterable, size):
+    '''Yields lists of up to ``size`` items from the iterable
+    '''
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class BulkCreator(object):
+    '''Buffers new objects for a model and writes them with ``bulk_create``
+    every ``batch_size`` objects
+    '''
+    def __init__(self, model, batch_size=DEFAULT_BATCH_SIZE):
+        self.model = model
+        self.batch_size = batch_size
+        self.objects = []
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def add(self, obj):
+        self.objects.append(obj)
+        if len(self.objects) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.objects:
+            # The database backend splits the objects into statements it can take
+            self.model.objects.bulk_create(self.objects)
+            self.count += len(self.objects)
+            self.objects = []
+
+
+def course_sizes(rng, courses, enrollments, users):
+    '''Splits the enrollments over the courses by a power law
+
+    No course has more enrollments than there are users
+    '''
+    weights = [rng.paretovariate(COURSE_SIZE_ALPHA) for i in range(courses)]
+    total = sum(weights)
+    sizes = [min(users, int(enrollments * weight / total)) for weight in weights]
+    # Give the enrollments lost to rounding down to the largest courses
+    largest_first = sorted(range(courses), key=lambda i: -weights[i])
+    for i in itertools.islice(itertools.cycle(largest_first),
+                              max(enrollments - sum(sizes), 0)):
+        if sizes[i] < users:
+            sizes[i] += 1
+    return sizes
+
+
+class DataSeeder(object):
+    '''Generates the data. See ``seed_data``
+    '''
+    def __init__(self, end_date, days, seed, batch_size):
+        self.rng = random.Random(seed)
+        self.end = datetime.datetime.combine(
+            end_date, datetime.time()).replace(tzinfo=utc)
+        self.start = self.end - datetime.timedelta(days=days)
+        self.days = days
+        self.batch_size = batch_size
+
+    def at(self, days):
+        '''Returns the datetime ``days`` after the start, at most the end
+        '''
+        return min(self.start + datetime.timedelta(days=days), self.end)
+
+    def later(self, days, mean_days):
+        '''Returns a number of days after ``days``, drawn from an exponential
+        distribution
+        '''
+        return days + self.rng.expovariate(1.0 / mean_days)
+
+    def create_users(self, count):
+        '''Creates the users and their profiles
+
+        Returns a list of ``(user_id, days_joined)`` tuples
+        '''
+        rng = self.rng
+        first_id = (get_user_model().objects.aggregate(Max('id'))['id__max'] or 0) + 1
+        # Hashing is slow, so all the users share the one password
+        password = make_password('password')
+        this_year = self.end.year
+        users = []
+        with BulkCreator(get_user_model(), self.batch_size) as user_creator, \
+                BulkCreator(UserProfile, self.batch_size) as profile_creator:
+            for user_id in range(first_id, first_id + count):
+                # More users join later in the history
+                days_joined = self.days * rng.random() ** 0.5
+                users.append((user_id, days_joined))
+                username = 'learner{}'.format(user_id)
+                user_creator.add(get_user_model()(
+                    id=user_id,
+                    username=username,
+                    email='{}@example.com'.format(username),
+                    password=password,
+                    is_active=rng.random() < 0.97,
+                    date_joined=self.at(days_joined)))
+            # The profiles are written after the users they refer to
+            user_creator.flush()
+            for user_id, days_joined in users:
+                year_of_birth = int(rng.gauss(this_year - 30, 12))
+                profile_creator.add(UserProfile(
+                    user_id=user_id,
+                    name='Learner {}'.format(user_id),
+                    country=weighted_choice(rng, COUNTRIES),
+                    year_of_birth=min(year_of_birth, this_year - 13),
+                    gender=weighted_choice(rng, GENDERS),
+                    level_of_education=weighted_choice(rng, LEVELS_OF_EDUCATION)))
+        return users
+
+    def create_courses(self, count):
+        '''Creates the courses
+
+        Returns a list of ``(course_overview, days_created)`` tuples
+        '''
+        rng = self.rng
+        existing = CourseOverview.objects.count()
+        courses = []
+        for i in range(existing, existing + count):
+            org = ORGS[i % len(ORGS)]
+            number = 'SD{:04d}'.format(i)
+            run = '{}_T{}'.format(self.end.year, 1 + i % 4)
+            # Courses open over the first four fifths of the history, so the
+            # latest have some time to gather enrollments
+            days_created = rng.uniform(0, self.days * 0.8)
+            courses.append((CourseOverview(
+                id=CourseKey.from_string('course-v1:{}+{}+{}'.format(org, number, run)),
+                display_name='Seeded Course {}'.format(i),
+                org=org,
+                display_org_with_default=org,
+                number=number,
+                created=self.at(days_created),
+                enrollment_start=self.at(days_created),
+                self_paced=rng.random() < 0.3), days_created))
+        for chunk in chunks(courses, self.batch_size):
+            CourseOverview.objects.bulk_create([course for course, days in chunk])
+        return courses
+
+    def create_enrollments(self, users, courses, enrollments):
+        '''Creates the enrollments with their courseware activity,
+        certificates and the course access roles
+
+        Returns the counts created for each model
+        '''
+        rng = self.rng
+        sizes = course_sizes(rng, len(courses), enrollments, len(users))
+        with BulkCreator(CourseEnrollment, self.batch_size) as enrollment_creator, \
+                BulkCreator(StudentModule, self.batch_size) as module_creator, \
+                BulkCreator(GeneratedCertificate, self.batch_size) as cert_creator, \
+                BulkCreator(CourseAccessRole, self.batch_size) as role_creator:
+            for (course, days_created), size in zip(courses, sizes):
+                completion_rate = rng.uniform(0.02, 0.2)
+                for user_id, days_joined in (users[i] for i in rng.sample(
+                        range(len(users)), size)):
+                    days_enrolled = self.later(
+                        max(days_joined, days_created), MEAN_DAYS_TO_ENROLL)
+                    enrollment_creator.add(CourseEnrollment(
+                        user_id=user_id,
+                        course_id=course.id,
+                        course_overview=course,
+                        created=self.at(days_enrolled),
+                        is_active=rng.random() < ENROLLMENT_ACTIVE_RATE,
+                        mode=weighted_choice(rng, ENROLLMENT_MODES)))
+                    if rng.random() >= LEARNER_ACTIVITY_RATE:
+                        continue
+                    modules = 1 + int(rng.expovariate(
+                        1.0 / (MEAN_MODULES_PER_LEARNER - 1)))
+                    for i in range(modules):
+                        module_creator.add(StudentModule(
+                            student_id=user_id,
+                            course_id=course.id,
+                            created=self.at(days_enrolled),
+                            modified=self.at(self.later(days_enrolled, MEAN_DAYS_ACTIVE))))
+                    if rng.random() < completion_rate:
+                        days_completed = self.later(days_enrolled, MEAN_DAYS_TO_COMPLETE)
+                        if days_completed < self.days:
+                            cert_creator.add(GeneratedCertificate(
+                                user_id=user_id,
+                                course_id=course.id,
+                                created_date=self.at(days_completed)))
+                for user_id, days_joined in rng.sample(users, min(len(users), rng.randint(1, 3))):
+                    role_creator.add(CourseAccessRole(
+                        user_id=user_id,
+                        org=course.org,
+                        course_id=course.id,
+                        role=weighted_choice(rng, ACCESS_ROLES)))
+        return dict(
+            course_enrollments=enrollment_creator.count,
+            student_modules=module_creator.count,
+            certificates=cert_creator.count,
+            course_access_roles=role_creator.count)
+
+
+def seed_data(users=DEFAULT_USERS, courses=DEFAULT_COURSES,
+              enrollments=DEFAULT_ENROLLMENTS, days=DEFAULT_DAYS, end_date=None,
+              seed=None, batch_size=DEFAULT_BATCH_SIZE):
+    '''Creates the users, courses and enrollments, with the enrollments'
+    courseware activity and certificates and the courses' access roles
+
+    The dates are in the ``days`` before ``end_date``, which defaults to
+    today. ``enrollments`` is the target. Fewer are created if a course would
+    have more enrollments than there are users. Returns the counts created for
+    each model
+    '''
+    if not end_date:
+        end_date = datetime.datetime.utcnow().replace(tzinfo=utc).date()
+    seeder = DataSeeder(end_date, days, seed, batch_size)
+    with transaction.atomic():
+        user_list = seeder.create_users(users)
+        course_list = seeder.create_courses(courses)
+        counts = dict(users=len(user_list), courses=len(course_list))
+        counts.update(seeder.create_enrollments(user_list, course_list, enrollments))
+    return counts
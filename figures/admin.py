@@ -12,7 +12,7 @@ class CourseDailyMetricsAdmin(admin.ModelAdmin):
     """
     list_display = ('id', 'date_for', 'course_id', 'enrollment_count',
                     'average_progress', 'average_days_to_complete',
-                    'num_learners_completed',)
+                    'num_learners_completed', 'partial',)
 
 
 @admin.register(figures.models.SiteDailyMetrics)
@@ -24,6 +24,14 @@ class SiteDailyMetricsAdmin(admin.ModelAdmin):
                     'course_count', 'total_enrollment_count',)
 
 
+@admin.register(figures.models.CourseDaysToCompleteAggregate)
+class CourseDaysToCompleteAggregateAdmin(admin.ModelAdmin):
+    """Defines the admin interface for the CourseDaysToCompleteAggregate model
+    """
+    list_display = ('id', 'course_id', 'date_for', 'certificate_count',
+                    'days_sum',)
+
+
 @admin.register(figures.models.LearnerCourseGradeMetrics)
 class LearnerCourseGradeMetricsAdmin(admin.ModelAdmin):
     """Defines the admin interface for the LearnerCourseGradeMetrics model
@@ -39,3 +47,17 @@ class PipelineErrorAdmin(admin.ModelAdmin):
     """
     list_display = ('id', 'created', 'error_type', 'error_data', 'course_id',
                     'user')
+
+
+@admin.register(figures.models.PipelineRun)
+class PipelineRunAdmin(admin.ModelAdmin):
+    """Defines the admin interface for the PipelineRun model
+    """
+    list_display = ('id', 'created', 'date_for', 'status', 'force_update')
+
+
+@admin.register(figures.models.PipelineCourseRun)
+class PipelineCourseRunAdmin(admin.ModelAdmin):
+    """Defines the admin interface for the PipelineCourseRun model
+    """
+    list_display = ('id', 'run', 'course_id', 'status', 'attempts', 'error')
@@ -0,0 +1,100 @@
+'''Caches the general site metrics responses
+
+The general site metrics only change when the pipeline writes metrics, so
+``GeneralSiteMetricsView`` caches them. An entry is keyed by ``date_for`` and
+a data version token. The pipeline calls ``bump_data_version`` whenever it
+writes site or course metrics, which makes a new token, so a cached entry is
+never stale and entries do not need a timeout.
+
+The history for a ``date_for`` before the current month only covers closed
+months. Those entries are keyed by a separate token that is only bumped when
+the pipeline writes metrics for a day in a closed month, for example with a
+backfill, so they are kept across the nightly runs.
+
+The tokens are kept in the cache itself. If they are evicted, new tokens are
+made and the entries are computed again. The cache must be shared by the web
+and pipeline processes, so local memory caches only work for development.
+Set ``figures.settings.metrics_cache()`` to the cache alias, or None to turn
+the cache off.
+'''
+
+import datetime
+import uuid
+
+from django.core.cache import caches
+
+from figures import settings
+from figures.helpers import as_date
+
+DATA_VERSION_KEY = 'figures:metrics:data-version'
+CLOSED_DATA_VERSION_KEY = 'figures:metrics:closed-data-version'
+SITE_METRICS_KEY = 'figures:metrics:site:{date_for}:{version}'
+
+
+def get_cache():
+    '''Returns the metrics cache, or None if it is turned off
+    '''
+    alias = settings.metrics_cache()
+    return caches[alias] if alias else None
+
+
+def today():
+    return datetime.datetime.utcnow().date()
+
+
+def is_closed_month(date_for):
+    '''Returns True if ``date_for`` is before the current month
+    '''
+    return as_date(date_for) < today().replace(day=1)
+
+
+def get_data_version(cache, key=DATA_VERSION_KEY):
+    '''Returns the data version token, making one if there is none
+    '''
+    version = cache.get(key)
+    if version is None:
+        # Another process may have made the token first
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def bump_data_version(date_for=None):
+    '''Makes a new data version token, so the cached metrics are computed
+    again
+
+    Call it after writing metrics for ``date_for``. If ``date_for`` is in a
+    closed month, the entries for closed months are also computed again
+    '''
+    cache = get_cache()
+    if cache is None:
+        return
+    cache.set(DATA_VERSION_KEY, uuid.uuid4().hex, None)
+    if date_for and is_closed_month(date_for):
+        cache.set(CLOSED_DATA_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def site_metrics_key(cache, date_for):
+    if is_closed_month(date_for):
+        version = 'closed-' + get_data_version(cache, CLOSED_DATA_VERSION_KEY)
+    else:
+        version = get_data_version(cache)
+    return SITE_METRICS_KEY.format(date_for=date_for.isoformat(), version=version)
+
+
+def cached_site_metrics(metrics_method, date_for=None):
+    '''Returns ``metrics_method(date_for=date_for)``, from the cache if it
+    is there
+
+    ``date_for`` defaults to today. Empty results are not cached
+    '''
+    cache = get_cache()
+    if cache is None:
+        return metrics_method(date_for=date_for)
+    key = site_metrics_key(cache, as_date(date_for) if date_for else today())
+    data = cache.get(key)
+    if data is None:
+        data = metrics_method(date_for=date_for)
+        if data:
+            cache.set(key, data, None)
+    return data
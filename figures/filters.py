@@ -12,7 +12,7 @@ from openedx.core.djangoapps.content.course_overviews.models import (
 )
 from student.models import CourseEnrollment
 
-from figures.models import CourseDailyMetrics, SiteDailyMetrics
+from figures.models import CourseDailyMetrics, PipelineRun, SiteDailyMetrics
 
 
 class CourseOverviewFilter(django_filters.FilterSet):
@@ -157,3 +157,16 @@ class SiteDailyMetricsFilter(django_filters.FilterSet):
     class Meta:
         model = SiteDailyMetrics
         fields = ['date_for', 'date']
+
+
+class PipelineRunFilter(django_filters.FilterSet):
+    '''Provides filtering for the PipelineRun model objects
+
+    Use ``date_for`` for runs for a specific date
+    Use ``date_0`` and ``date_1`` for runs for a date range, inclusive
+    '''
+    date = django_filters.DateFromToRangeFilter(name='date_for')
+
+    class Meta:
+        model = PipelineRun
+        fields = ['date_for', 'date', 'status', 'mode', ]
@@ -0,0 +1,53 @@
+'''Management command to backfill Figures daily metrics for a range of dates
+
+see ``figures.pipeline.backfill``
+'''
+
+from __future__ import print_function
+
+import datetime
+from textwrap import dedent
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import utc
+
+from figures.helpers import as_date, prev_day
+from figures.pipeline.backfill import backfill_daily_metrics
+
+
+class Command(BaseCommand):
+    '''Backfill Figures daily metrics from the start date through the end date
+    '''
+    help = dedent(__doc__).strip()
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start',
+                            required=True,
+                            help='first date to backfill in yyyy-mm-dd format')
+        parser.add_argument('--end',
+                            help=('last date to backfill in yyyy-mm-dd format. '
+                                  'Defaults to yesterday'))
+        parser.add_argument('--force-update',
+                            action='store_true',
+                            default=False,
+                            help='Overwrite metrics records if they exist for the dates')
+
+    def handle(self, *args, **options):
+        start_date = as_date(options['start'])
+        if options['end']:
+            end_date = as_date(options['end'])
+        else:
+            end_date = prev_day(datetime.datetime.utcnow().replace(tzinfo=utc).date())
+        if end_date < start_date:
+            raise CommandError('--end must not be before --start')
+
+        print('backfilling Figures metrics from {} through {}...'.format(
+            start_date, end_date))
+        results = backfill_daily_metrics(
+            start_date, end_date, force_update=options['force_update'])
+        print('Wrote {course_daily_metrics} course and {site_daily_metrics} '
+              'site metrics records, {active_users_sketches} active users '
+              'sketches and {course_monthly_metrics} course and '
+              '{site_monthly_metrics} site monthly metrics '
+              'records'.format(**results))
+        print('Done.')
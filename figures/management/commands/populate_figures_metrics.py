@@ -7,11 +7,16 @@ from __future__ import print_function
 
 from textwrap import dedent
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
+from figures.pipeline.profiling import (
+    DEFAULT_PROFILE_TOP,
+    PipelineProfiler,
+    profiling,
+)
 from figures.tasks import (
     populate_daily_metrics,
-    experimental_populate_daily_metrics,
+    parallel_populate_daily_metrics,
 )
 
 
@@ -34,11 +39,29 @@ class Command(BaseCommand):
                             action='store_true',
                             default=False,
                             help='Overwrite metrics records if they exist for the given date')
+        parser.add_argument('--parallel',
+                            action='store_true',
+                            default=False,
+                            help='Populate the course metrics with a Celery task per course')
         parser.add_argument('--experimental',
                             action='store_true',
                             default=False,
-                            help=('Run with Celery workflows (Warning: This is still under' +
-                                  ' development and likely to get stuck/hung jobs'))
+                            help='Deprecated. Same as --parallel')
+        parser.add_argument('--profile',
+                            action='store_true',
+                            default=False,
+                            help=('Run each course under cProfile. Requires --report, '
+                                  'next to which the profiles are written. Runs the '
+                                  'serial pipeline in this process'))
+        parser.add_argument('--report',
+                            help=('Write a JSON report ranking the courses by time, '
+                                  'queries and learners to this path. Profiles of '
+                                  'the slowest courses are written next to it. '
+                                  'Runs the serial pipeline in this process'))
+        parser.add_argument('--profile-top',
+                            type=int,
+                            default=DEFAULT_PROFILE_TOP,
+                            help='Number of the slowest courses to write profiles for')
 
     def handle(self, *args, **options):
         '''
@@ -52,14 +75,19 @@ class Command(BaseCommand):
             force_update=options['force_update'],
             )
 
-        experimental = options['experimental']
-        options.pop('experimental')
-
-        if experimental:
+        if options['profile'] or options['report']:
+            if options['parallel'] or options['experimental']:
+                raise CommandError(
+                    '--profile and --report cannot be used with --parallel')
+            if options['profile'] and not options['report']:
+                # The profiles are written next to the report
+                raise CommandError('--profile requires --report')
+            self.profile(options, **kwargs)
+        elif options['parallel'] or options['experimental']:
             if options['no_delay']:
-                experimental_populate_daily_metrics(**kwargs)
+                parallel_populate_daily_metrics(delay=False, **kwargs)
             else:
-                experimental_populate_daily_metrics.delay(**kwargs)  # pragma: no cover
+                parallel_populate_daily_metrics.delay(**kwargs)  # pragma: no cover
         else:
             if options['no_delay']:
                 populate_daily_metrics(**kwargs)
@@ -70,3 +98,28 @@ class Command(BaseCommand):
         print('Management command populate_figures_metrics complete. date_for: {}'.format(
             options['date']))
         print('Done.')
+
+    def profile(self, options, **kwargs):
+        '''Runs the serial pipeline with a profiler and reports the slowest
+        courses
+        '''
+        profiler = PipelineProfiler(use_cprofile=options['profile'])
+        with profiling(profiler):
+            run_id = populate_daily_metrics(**kwargs)
+        if run_id is None:
+            raise CommandError(
+                'The metrics for the date are already populated, so nothing was '
+                'profiled. Use --force-update to profile them again')
+
+        report = profiler.write_report(
+            options['report'],
+            profile_top=options['profile_top'],
+            date_for=options['date'],
+            run_id=run_id)
+        print('Wrote report to {}'.format(options['report']))
+
+        print('{course_count} courses, {duration:.2f} seconds, {query_count} queries, '
+              '{learners_processed} learners'.format(**report))
+        for course in report['courses'][:options['profile_top']]:
+            print('{duration:10.2f}s {query_count:8} queries {learners_processed:8} '
+                  'learners  {course_id}'.format(**course))
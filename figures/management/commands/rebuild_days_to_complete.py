@@ -0,0 +1,51 @@
+'''Management command to rebuild the running days to complete aggregates
+
+see the model ``figures.models.CourseDaysToCompleteAggregate``
+'''
+
+from __future__ import print_function
+
+import datetime
+from textwrap import dedent
+
+from django.core.management.base import BaseCommand
+from django.utils.timezone import utc
+
+from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
+
+from figures.helpers import as_date
+from figures.pipeline.course_daily_metrics import update_days_to_complete_aggregate
+
+
+class Command(BaseCommand):
+    '''Rebuild the Figures days to complete aggregates from all certificates
+    '''
+    help = dedent(__doc__).strip()
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date',
+                            help=('date through which to rebuild the aggregates '
+                                  'in yyyy-mm-dd format. Defaults to today'))
+        parser.add_argument('--course-id',
+                            help='rebuild the aggregate for this course only')
+
+    def handle(self, *args, **options):
+        print('rebuilding Figures days to complete aggregates...')
+
+        if options['date']:
+            date_for = as_date(options['date'])
+        else:
+            date_for = datetime.datetime.utcnow().replace(tzinfo=utc).date()
+
+        if options['course_id']:
+            course_ids = [options['course_id']]
+        else:
+            course_ids = [course.id for course in CourseOverview.objects.all()]
+
+        for course_id in course_ids:
+            aggregate = update_days_to_complete_aggregate(
+                course_id, date_for, rebuild=True)
+            print('{}: {} certificates'.format(
+                course_id, aggregate.certificate_count))
+
+        print('Done.')
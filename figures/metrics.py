@@ -21,12 +21,14 @@ parameter to support multi-tenancy
 
 """
 
+from collections import OrderedDict
 import datetime
 from decimal import Decimal
 import math
 
+from dateutil.relativedelta import relativedelta
 from django.contrib.auth import get_user_model
-from django.db.models import Avg, Max
+from django.db.models import Avg, Case, Count, F, Max, When
 
 from certificates.models import GeneratedCertificate
 from courseware.courses import get_course_by_id
@@ -42,7 +44,14 @@ from figures.helpers import (
     prev_day,
     previous_months_iterator,
 )
-from figures.models import CourseDailyMetrics, SiteDailyMetrics
+from figures.models import (
+    ActiveUsersSketch,
+    CourseDailyMetrics,
+    SiteDailyMetrics,
+    SiteMonthlyMetrics,
+)
+from figures.pipeline.site_extractors import get_active_user_ids_for_dates
+from figures.timeseries import AggregateMetric, as_periods, evaluate_metrics
 
 
 #
@@ -61,6 +70,20 @@ def period_str(month_tuple, format='%Y/%m'):
 #
 
 
+def get_course_for_grading(course_id):
+    """Loads the course descriptor and prepares it for grading
+
+    This is the expensive part of setting up ``CourseGradeFactory``. Callers
+    grading many learners in the same course should call this once and pass
+    the returned course to ``LearnerCourseGrades`` (see
+    ``CourseGradingSession``)
+    """
+    course = get_course_by_id(course_key=as_course_key(course_id))
+    course._field_data_cache = {}  # pylint: disable=protected-access
+    course.set_grading_policy(course.grading_policy)
+    return course
+
+
 class LearnerCourseGrades(object):
     """
     TODO: create lazy method to get the CourseOverview object
@@ -80,15 +103,22 @@ class LearnerCourseGrades(object):
     def __init__(self, user_id, course_id, **kwargs):
         """
 
+        Optional kwargs:
+
+        ``course``: a course descriptor already prepared with
+        ``get_course_for_grading``. When provided, the course is not reloaded
+        from the modulestore
+        ``learner``: the user object for ``user_id``. When provided, the user
+        is not queried again
+
         If CourseGradeFactory is unable to retrieve the course blocks, raises
 
             django.core.exceptions.PermissionDenied(
                 "User does not have access to this course")
         """
-        self.learner = get_user_model().objects.get(id=user_id)
-        self.course = get_course_by_id(course_key=as_course_key(course_id))
-        self.course._field_data_cache = {}  # pylint: disable=protected-access
-        self.course.set_grading_policy(self.course.grading_policy)
+        self.learner = kwargs.get('learner') or get_user_model().objects.get(
+            id=user_id)
+        self.course = kwargs.get('course') or get_course_for_grading(course_id)
         self.course_grade = CourseGradeFactory().create(self.learner, self.course)
 
     def __str__(self):
@@ -185,10 +215,17 @@ class LearnerCourseGrades(object):
                 progress_details['count'])
 
     @staticmethod
-    def course_progress(course_enrollment):
+    def course_progress(course_enrollment, course=None):
+        """Returns the progress details and percent for the course enrollment
+
+        ``course`` is an optional, already loaded course descriptor. See
+        ``CourseGradingSession``
+        """
         lcg = LearnerCourseGrades(
                 user_id=course_enrollment.user.id,
                 course_id=course_enrollment.course_id,
+                course=course,
+                learner=course_enrollment.user,
         )
         course_progress_details = lcg.progress()
         return dict(
@@ -196,6 +233,36 @@ class LearnerCourseGrades(object):
             progress_percent=lcg.progress_percent(course_progress_details))
 
 
+class CourseGradingSession(object):
+    """Grades learners in a single course against one loaded course
+
+    ``LearnerCourseGrades`` loads the course from the modulestore and resets
+    the grading policy each time it is created. When grading every enrollment
+    in a course, that means loading the same course structure once per
+    learner. A grading session loads the course and grading policy once and
+    reuses it for every learner graded in the session::
+
+        session = CourseGradingSession(course_id)
+        for ce in course_enrollments:
+            course_progress = session.course_progress(ce)
+
+    """
+    def __init__(self, course_id):
+        self.course_id = as_course_key(course_id)
+        self.course = get_course_for_grading(self.course_id)
+
+    def learner_course_grades(self, course_enrollment):
+        return LearnerCourseGrades(
+            user_id=course_enrollment.user.id,
+            course_id=self.course_id,
+            course=self.course,
+            learner=course_enrollment.user)
+
+    def course_progress(self, course_enrollment):
+        return LearnerCourseGrades.course_progress(
+            course_enrollment, course=self.course)
+
+
 """
 Support methods for Course and Sitewide aggregate metrics
 
@@ -207,25 +274,128 @@ The metrics model may not be populated in devstack, but we want to exercize
 the code.
 Retrieving from the Figures metrics models should be much faster
 
-We may refactor these into a base class with the contructor params of
-start_date, end_date, site
+The metrics from the Figures metrics models are defined as
+``figures.timeseries`` metrics, so a history of many periods is evaluated with
+one query. The ``*_for_time_period`` functions evaluate a single period
 """
 
 
-def get_active_users_for_time_period(start_date, end_date, site=None, course_ids=None):
+def as_progress(value):
+    """Returns an average progress rounded to two places, as a float
     """
-    Returns the number of users active in the time period.
+    return float(Decimal(value).quantize(Decimal('.00')))
+
+
+def as_days(value):
+    """Returns an average number of days, rounded up
+    """
+    return int(math.ceil(value))
+
+
+class ActiveUsersMetric(object):
+    """The number of users active in each period
 
-    This is determined by finding the unique user ids for StudentModule records
-    modified in a time period
+    The count is estimated from the pipeline's daily active users sketches
+    for the period, merged. Only the site's sketches are read, or the
+    sketches for ``course_ids`` if given. See ``figures.hll``
+
+    A day is covered by the sketches if it has a site sketch. The learners
+    active on the days in a period that are not covered are found from the
+    StudentModule records the way the pipeline finds them, and added to the
+    merged sketch, so a user active on both kinds of day is counted once.
+    See ``figures.pipeline.site_extractors.get_active_user_ids_for_dates``
+
+    For the periods with no covered days, or all of the periods if
+    ``calc_raw`` is True, the count is the unique user ids for StudentModule
+    records modified in the period. Either way, each source is read with one
+    query
+    """
+    monthly_field = 'active_user_count'
+
+    def evaluate(self, periods, course_ids=None, calc_raw=False, **kwargs):
+        periods = as_periods(periods)
+        if calc_raw:
+            return self.evaluate_raw(periods, course_ids)
+        merged = ActiveUsersSketch.objects.merged_for_periods(periods, course_ids)
+        uncovered = set()
+        for sketch, uncovered_dates in merged:
+            if sketch is not None:
+                uncovered.update(uncovered_dates)
+        user_ids = get_active_user_ids_for_dates(uncovered, course_ids)
+        values = []
+        for sketch, uncovered_dates in merged:
+            if sketch is not None:
+                for date_for in uncovered_dates:
+                    sketch.update(user_ids[date_for])
+                sketch = sketch.count()
+            values.append(sketch)
+        raw_periods = [period for period, value in zip(periods, values)
+                       if value is None]
+        if raw_periods:
+            raw_values = iter(self.evaluate_raw(raw_periods, course_ids))
+            values = [value if value is not None else next(raw_values)
+                      for value in values]
+        return values
+
+    def evaluate_raw(self, periods, course_ids=None):
+        def conditions(start_date, end_date):
+            return dict(created__gt=as_datetime(prev_day(start_date)),
+                        modified__lt=as_datetime(next_day(end_date)))
+
+        expressions = dict(
+            ('p{}'.format(index), Count(Case(When(
+                then=F('student_id'), **conditions(start_date, end_date))),
+                distinct=True))
+            for index, (start_date, end_date) in enumerate(periods))
+        qs = StudentModule.objects.filter(**conditions(
+            min(start_date for start_date, end_date in periods),
+            max(end_date for start_date, end_date in periods)))
+        if course_ids:
+            qs = qs.filter(course_id__in=[as_course_key(course_id)
+                                          for course_id in course_ids])
+        row = qs.aggregate(**expressions)
+        return [row['p{}'.format(index)] for index in range(len(periods))]
+
+
+ACTIVE_USERS = ActiveUsersMetric()
+
+TOTAL_SITE_USERS = AggregateMetric(
+    SiteDailyMetrics, 'total_user_count', Max, monthly_field='total_user_count')
+TOTAL_SITE_COURSES = AggregateMetric(
+    SiteDailyMetrics, 'course_count', Max, monthly_field='course_count')
+TOTAL_ENROLLMENTS = AggregateMetric(
+    SiteDailyMetrics, 'total_enrollment_count', Max,
+    monthly_field='total_enrollment_count')
+# This metric is not currently captured in SiteDailyMetrics, so retrieving
+# from course dailies instead
+TOTAL_COURSE_COMPLETIONS = AggregateMetric(
+    CourseDailyMetrics, 'num_learners_completed', Max,
+    monthly_field='num_learners_completed')
+
+# Course metrics. Evaluate them with the ``course_id`` filter
+COURSE_ENROLLED_USERS = AggregateMetric(
+    CourseDailyMetrics, 'enrollment_count', Max, monthly_field='enrollment_count')
+COURSE_AVERAGE_PROGRESS = AggregateMetric(
+    CourseDailyMetrics, 'average_progress', Avg, value=as_progress,
+    default=0.0, monthly_field='average_progress')
+COURSE_AVERAGE_DAYS_TO_COMPLETE = AggregateMetric(
+    CourseDailyMetrics, 'average_days_to_complete', Avg, value=as_days,
+    monthly_field='average_days_to_complete')
+COURSE_NUM_LEARNERS_COMPLETED = AggregateMetric(
+    CourseDailyMetrics, 'num_learners_completed', Max,
+    monthly_field='num_learners_completed')
+
+
+def get_active_users_for_time_period(start_date, end_date, site=None,
+                                     course_ids=None, **kwargs):
     """
-    filter_args = dict(
-        created__gt=as_datetime(prev_day(start_date)),
-        modified__lt=as_datetime(next_day(end_date)))
-    if course_ids:
-        filter_args['course_ids__in'] = course_ids
+    Returns the number of users active in the time period.
 
-    return StudentModule.objects.filter(**filter_args).values('student__id').distinct().count()
+    See ``ActiveUsersMetric``
+    """
+    return ACTIVE_USERS.evaluate(
+        [(start_date, end_date)], course_ids=course_ids,
+        calc_raw=kwargs.get('calc_raw', False))[0]
 
 
 def get_total_site_users_for_time_period(start_date, end_date, site=None, **kwargs):
@@ -245,20 +415,10 @@ def get_total_site_users_for_time_period(start_date, end_date, site=None, **kwar
         )
         return get_user_model().objects.filter(**filter_args).count()
 
-    def calc_from_site_daily_metrics():
-        filter_args = dict(
-            date_for__gt=prev_day(start_date),
-            date_for__lt=next_day(end_date))
-        qs = SiteDailyMetrics.objects.filter(**filter_args)
-        if qs:
-            return qs.aggregate(maxval=Max('total_user_count'))['maxval']
-        else:
-            return 0
-
     if kwargs.get('calc_raw'):
         return calc_from_user_model()
     else:
-        return calc_from_site_daily_metrics()
+        return TOTAL_SITE_USERS.evaluate([(start_date, end_date)])[0]
 
 
 def get_total_site_users_joined_for_time_period(start_date, end_date, site=None, course_ids=None):
@@ -285,16 +445,7 @@ def get_total_enrollments_for_time_period(start_date, end_date, site=None, cours
 
     This returns the count of unique enrollments, not unique learners
     """
-    filter_args = dict(
-        date_for__gt=prev_day(start_date),
-        date_for__lt=next_day(end_date),
-    )
-
-    qs = SiteDailyMetrics.objects.filter(**filter_args)
-    if qs:
-        return qs.aggregate(maxval=Max('total_enrollment_count'))['maxval']
-    else:
-        return 0
+    return TOTAL_ENROLLMENTS.evaluate([(start_date, end_date)])[0]
 
 
 def get_total_site_courses_for_time_period(start_date, end_date, site=None,
@@ -303,17 +454,6 @@ def get_total_site_courses_for_time_period(start_date, end_date, site=None,
     Potential fix:
     get unique course ids from CourseEnrollment
     """
-    def calc_from_site_daily_metrics():
-        filter_args = dict(
-            date_for__gt=prev_day(start_date),
-            date_for__lt=next_day(end_date),
-        )
-        qs = SiteDailyMetrics.objects.filter(**filter_args)
-        if qs:
-            return qs.aggregate(maxval=Max('course_count'))['maxval']
-        else:
-            return 0
-
     def calc_from_course_enrollments():
         filter_args = dict(
             created__gt=prev_day(start_date),
@@ -325,7 +465,7 @@ def get_total_site_courses_for_time_period(start_date, end_date, site=None,
     if kwargs.get('calc_raw'):
         return calc_from_course_enrollments()
     else:
-        return calc_from_site_daily_metrics()
+        return TOTAL_SITE_COURSES.evaluate([(start_date, end_date)])[0]
 
 
 def get_total_course_completions_for_time_period(start_date, end_date, site=None, course_ids=None):
@@ -333,100 +473,123 @@ def get_total_course_completions_for_time_period(start_date, end_date, site=None
     This metric is not currently captured in SiteDailyMetrics, so retrieving from
     course dailies instead
     """
-    def calc_from_course_daily_metrics():
-        filter_args = dict(
-            date_for__gt=prev_day(start_date),
-            date_for__lt=next_day(end_date),
-        )
-        qs = CourseDailyMetrics.objects.filter(**filter_args)
-        if qs:
-            return qs.aggregate(maxval=Max('num_learners_completed'))['maxval']
-        else:
-            return 0
-
-    return calc_from_course_daily_metrics()
-
-
-# TODO: Consider moving these aggregate queries to the
-# CourseDailyMetricsManager class (not yet created)
+    return TOTAL_COURSE_COMPLETIONS.evaluate([(start_date, end_date)])[0]
 
 
 def get_course_enrolled_users_for_time_period(start_date, end_date, course_id):
     """
 
     """
-    filter_args = dict(
-        date_for__gt=prev_day(start_date),
-        date_for__lt=next_day(end_date),
-        course_id=course_id
-    )
-
-    qs = CourseDailyMetrics.objects.filter(**filter_args)
-    if qs:
-        return qs.aggregate(maxval=Max('enrollment_count'))['maxval']
-    else:
-        return 0
+    return COURSE_ENROLLED_USERS.evaluate(
+        [(start_date, end_date)], course_id=course_id)[0]
 
 
 def get_course_average_progress_for_time_period(start_date, end_date, course_id):
-    filter_args = dict(
-        date_for__gt=prev_day(start_date),
-        date_for__lt=next_day(end_date),
-        course_id=course_id
-    )
-
-    qs = CourseDailyMetrics.objects.filter(**filter_args)
-    if qs:
-        value = qs.aggregate(average=Avg('average_progress'))['average']
-        return float(Decimal(value).quantize(Decimal('.00')))
-    else:
-        return 0.0
+    return COURSE_AVERAGE_PROGRESS.evaluate(
+        [(start_date, end_date)], course_id=course_id)[0]
 
 
 def get_course_average_days_to_complete_for_time_period(start_date, end_date, course_id):
-    filter_args = dict(
-        date_for__gt=prev_day(start_date),
-        date_for__lt=next_day(end_date),
-        course_id=course_id
-    )
-
-    qs = CourseDailyMetrics.objects.filter(**filter_args)
-    if qs:
-        return int(math.ceil(
-            qs.aggregate(average=Avg('average_days_to_complete'))['average']
-        ))
-    else:
-        return 0
+    return COURSE_AVERAGE_DAYS_TO_COMPLETE.evaluate(
+        [(start_date, end_date)], course_id=course_id)[0]
 
 
 def get_course_num_learners_completed_for_time_period(start_date, end_date, course_id):
+    return COURSE_NUM_LEARNERS_COMPLETED.evaluate(
+        [(start_date, end_date)], course_id=course_id)[0]
+
+
+def history_start_date(date_for, months_back):
+    """Returns the first day of the earliest month in the history for
+    ``date_for``
     """
-    We're duplicating some code.
-    """
-    filter_args = dict(
-        date_for__gt=prev_day(start_date),
-        date_for__lt=next_day(end_date),
-        course_id=course_id
-    )
+    return (as_date(date_for) - relativedelta(months=months_back)).replace(day=1)
 
-    qs = CourseDailyMetrics.objects.filter(**filter_args)
-    if qs:
-        return qs.aggregate(max=Max('num_learners_completed'))['max']
-    else:
-        return 0
+
+def get_monthly_history_metrics(metrics, date_for, months_back, monthly=None,
+                                **filters):
+    """Returns the current month and history for each of the metrics
+
+    :param metrics: a dict of ``figures.timeseries`` metrics keyed by name
+    :param date_for: The most recent date for which we generate data. This is
+    the "current month"
+    :param months_back: How many months back to retrieve data
+    :param monthly: optional dict of monthly metrics records keyed by the
+    first day of the month, as ``MonthlyMetricsManager.for_months`` returns.
+    A metric's value for a month with a record is the record's
+    ``monthly_field``
+    :param filters: passed to each metric's evaluation, for example
+    ``course_id``
+    :returns: a dict keyed by name of the ``get_monthly_history_metric``
+    results
+
+    The metrics are evaluated for all of the months without a record
+    together. See ``figures.timeseries.evaluate_metrics``
+    """
+    date_for = as_date(date_for)
+    monthly = monthly or {}
+    months = [
+        (period_str(month),
+         datetime.date(month[0], month[1], 1),
+         datetime.date(month[0], month[1], month[2]))
+        for month in previous_months_iterator(month_for=date_for, months_back=months_back,)
+    ]
+
+    def rolled_up(metric, month_for):
+        return bool(getattr(metric, 'monthly_field', None)) and month_for in monthly
+
+    # Group the metrics by the months they need evaluated for
+    pending = OrderedDict()
+    for name, metric in metrics.items():
+        periods = tuple((start_date, end_date) for period, start_date, end_date in months
+                        if not rolled_up(metric, start_date))
+        pending.setdefault(periods, []).append(name)
+    evaluated = {}
+    for periods, names in pending.items():
+        results = evaluate_metrics([metrics[name] for name in names], periods, **filters)
+        for name, values in zip(names, results):
+            evaluated[name] = iter(values)
+
+    results = {}
+    for name, metric in metrics.items():
+        history = []
+        for period, start_date, end_date in months:
+            if rolled_up(metric, start_date):
+                value = getattr(monthly[start_date], metric.monthly_field)
+            else:
+                value = next(evaluated[name])
+            history.append(dict(period=period, value=value,))
+        if history:
+            # use the last entry
+            current_month = history[-1]['value']
+        else:
+            # This should work for float too since '0 == 0.0' resolves to True
+            current_month = 0
+        results[name] = dict(
+            current_month=current_month,
+            history=history,)
+    return results
 
 
 def get_monthly_history_metric(func, date_for, months_back,
-                               include_current_in_history=True):
+                               include_current_in_history=True,
+                               monthly=None, **filters):
     """Convenience method to retrieve current and historic data
 
     Convenience function to populate monthly metrics data with history. Purpose
     is to provide a time series list of values for a particular metrics going
     back N months
-    :param func: the function we call for each time point
+    :param func: the function we call for each time point, with the month's
+    ``start_date`` and ``end_date`` and the ``filters``. It can also be a
+    ``figures.timeseries`` metric, which is evaluated for all of the months
+    with one query
     :param date_for: The most recent date for which we generate data. This is
     the "current month"
     :param months_back: How many months back to retrieve data
+    :param include_current_in_history: if False, the current month is left out
+    of ``history``. It is still in ``current_month``
+    :param monthly: optional monthly metrics records for a ``figures.timeseries``
+    metric. See ``get_monthly_history_metrics``
     :returns: a dict with two keys. ``current_month`` contains the monthly
     metrics for the month in ``date_for``. ``history`` contains a list of metrics
     for the current period and perids going back ``months_back``
@@ -435,16 +598,20 @@ def get_monthly_history_metric(func, date_for, months_back,
     for the data and ``value`` containing the numeric value of the data
 
     """
-    date_for = as_date(date_for)
-    history = []
-
-    for month in previous_months_iterator(month_for=date_for, months_back=months_back,):
-        period = period_str(month)
-        value = func(
-            start_date=datetime.date(month[0], month[1], 1),
-            end_date=datetime.date(month[0], month[1], month[2]),
-        )
-        history.append(dict(period=period, value=value,))
+    if hasattr(func, 'evaluate'):
+        history = get_monthly_history_metrics(
+            dict(metric=func), date_for, months_back, monthly=monthly,
+            **filters)['metric']['history']
+    else:
+        history = []
+        for month in previous_months_iterator(month_for=as_date(date_for),
+                                              months_back=months_back,):
+            value = func(
+                start_date=datetime.date(month[0], month[1], 1),
+                end_date=datetime.date(month[0], month[1], month[2]),
+                **filters
+            )
+            history.append(dict(period=period_str(month), value=value,))
 
     if history:
         # use the last entry
@@ -452,6 +619,8 @@ def get_monthly_history_metric(func, date_for, months_back,
     else:
         # This should work for float too since '0 == 0.0' resolves to True
         current_month = 0
+    if not include_current_in_history:
+        history = history[:-1]
     return dict(
         current_month=current_month,
         history=history,)
@@ -532,45 +701,21 @@ def get_monthly_site_metrics(date_for=None, **kwargs):
 
     months_back = kwargs.get('months_back', 6)  # Warning: magic number
 
-    ##
-    # Brute force this for now. Later, refactor to define getters externally,
-    # and rely more on the serializers to stitch data together to respond
-    ##
-    # Then, we can put the method calls into a dict, load the dict from
-    # settings, for example, or a Django model
-
-    # We are retrieving data here in series before constructing the return dict
-    # This makes it easier to inspect
-    monthly_active_users = get_monthly_history_metric(
-        func=get_active_users_for_time_period,
+    # The months the pipeline has rolled up are read with a single query. The
+    # metrics are evaluated for the other months together, so there is at
+    # most one more query for each metrics model
+    monthly = SiteMonthlyMetrics.objects.for_months(
+        history_start_date(date_for, months_back), date_for)
+
+    return get_monthly_history_metrics(
+        OrderedDict([
+            ('monthly_active_users', ACTIVE_USERS),
+            ('total_site_users', TOTAL_SITE_USERS),
+            ('total_site_coures', TOTAL_SITE_COURSES),
+            ('total_course_enrollments', TOTAL_ENROLLMENTS),
+            ('total_course_completions', TOTAL_COURSE_COMPLETIONS),
+        ]),
         date_for=date_for,
         months_back=months_back,
-    )
-    total_site_users = get_monthly_history_metric(
-        func=get_total_site_users_for_time_period,
-        date_for=date_for,
-        months_back=months_back,
-    )
-    total_site_coures = get_monthly_history_metric(
-        func=get_total_site_courses_for_time_period,
-        date_for=date_for,
-        months_back=months_back,
-    )
-    total_course_enrollments = get_monthly_history_metric(
-        func=get_total_enrollments_for_time_period,
-        date_for=date_for,
-        months_back=months_back,
-    )
-    total_course_completions = get_monthly_history_metric(
-        func=get_total_course_completions_for_time_period,
-        date_for=date_for,
-        months_back=months_back,
-    )
-
-    return dict(
-        monthly_active_users=monthly_active_users,
-        total_site_users=total_site_users,
-        total_site_coures=total_site_coures,
-        total_course_enrollments=total_course_enrollments,
-        total_course_completions=total_course_completions,
+        monthly=monthly,
     )
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('figures', '0004_learner_course_grade_metrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coursedailymetrics',
+            name='days_to_complete_histogram',
+            field=jsonfield.fields.JSONField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='coursedailymetrics',
+            name='days_to_complete_median',
+            field=models.IntegerField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='coursedailymetrics',
+            name='days_to_complete_p90',
+            field=models.IntegerField(null=True, blank=True),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+import jsonfield.fields
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('figures', '0005_course_daily_metrics_days_to_complete_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseDaysToCompleteAggregate',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, verbose_name='created', editable=False)),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, verbose_name='modified', editable=False)),
+                ('course_id', models.CharField(unique=True, max_length=255)),
+                ('date_for', models.DateField()),
+                ('certificate_count', models.IntegerField(default=0)),
+                ('days_sum', models.BigIntegerField(default=0)),
+                ('day_counts', jsonfield.fields.JSONField(default=dict)),
+            ],
+            options={
+                'ordering': ('course_id',),
+            },
+        ),
+    ]
@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('figures', '0006_course_days_to_complete_aggregate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PipelineCourseRun',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, verbose_name='created', editable=False)),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, verbose_name='modified', editable=False)),
+                ('course_id', models.CharField(max_length=255)),
+                ('status', models.CharField(default=b'pending', max_length=20, choices=[(b'pending', b'Pending'), (b'running', b'Running'), (b'complete', b'Complete'), (b'failed', b'Failed')])),
+                ('attempts', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True)),
+            ],
+            options={
+                'ordering': ('run', 'course_id'),
+            },
+        ),
+        migrations.CreateModel(
+            name='PipelineRun',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, verbose_name='created', editable=False)),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, verbose_name='modified', editable=False)),
+                ('date_for', models.DateField()),
+                ('force_update', models.BooleanField(default=False)),
+                ('status', models.CharField(default=b'running', max_length=20, choices=[(b'running', b'Running'), (b'finalizing', b'Populating site metrics'), (b'complete', b'Complete'), (b'failed', b'Failed')])),
+            ],
+            options={
+                'ordering': ['-created'],
+            },
+        ),
+        migrations.AddField(
+            model_name='pipelinecourserun',
+            name='run',
+            field=models.ForeignKey(related_name='course_runs', to='figures.PipelineRun'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='pipelinecourserun',
+            unique_together=set([('run', 'course_id')]),
+        ),
+    ]
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+import jsonfield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('figures', '0007_pipeline_runs'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pipelinecourserun',
+            name='error_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pipelinecourserun',
+            name='finished',
+            field=models.DateTimeField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='pipelinecourserun',
+            name='learners_processed',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pipelinecourserun',
+            name='query_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pipelinecourserun',
+            name='stage_durations',
+            field=jsonfield.fields.JSONField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='pipelinecourserun',
+            name='started',
+            field=models.DateTimeField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='pipelinerun',
+            name='finished',
+            field=models.DateTimeField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='pipelinerun',
+            name='mode',
+            field=models.CharField(default=b'parallel', max_length=20, choices=[(b'serial', b'Serial'), (b'parallel', b'Parallel')]),
+        ),
+        migrations.AddField(
+            model_name='pipelinerun',
+            name='query_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pipelinerun',
+            name='stage_durations',
+            field=jsonfield.fields.JSONField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='pipelinerun',
+            name='started',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
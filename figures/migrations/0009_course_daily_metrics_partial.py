@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('figures', '0008_pipeline_run_ledger'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coursedailymetrics',
+            name='learners_graded',
+            field=models.IntegerField(null=True, blank=True),
+        ),
+        migrations.AddField(
+            model_name='coursedailymetrics',
+            name='partial',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='pipelinecourserun',
+            name='partial',
+            field=models.BooleanField(default=False),
+        ),
+    ]
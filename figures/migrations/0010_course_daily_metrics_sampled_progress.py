@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('figures', '0009_course_daily_metrics_partial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coursedailymetrics',
+            name='average_progress_lower',
+            field=models.DecimalField(null=True, max_digits=3, decimal_places=2, blank=True),
+        ),
+        migrations.AddField(
+            model_name='coursedailymetrics',
+            name='average_progress_upper',
+            field=models.DecimalField(null=True, max_digits=3, decimal_places=2, blank=True),
+        ),
+        migrations.AddField(
+            model_name='coursedailymetrics',
+            name='progress_sample_size',
+            field=models.IntegerField(null=True, blank=True),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('figures', '0010_course_daily_metrics_sampled_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ActiveUsersSketch',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, verbose_name='created', editable=False)),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, verbose_name='modified', editable=False)),
+                ('date_for', models.DateField()),
+                ('course_id', models.CharField(max_length=255, blank=True)),
+                ('sketch', models.BinaryField()),
+                ('user_count', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ('-date_for', 'course_id'),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='activeuserssketch',
+            unique_together=set([('course_id', 'date_for')]),
+        ),
+    ]
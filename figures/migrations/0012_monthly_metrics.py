@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('figures', '0011_active_users_sketch'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseMonthlyMetrics',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, verbose_name='created', editable=False)),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, verbose_name='modified', editable=False)),
+                ('month_for', models.DateField()),
+                ('course_id', models.CharField(max_length=255)),
+                ('enrollment_count', models.IntegerField(default=0)),
+                ('average_progress', models.FloatField(default=0.0)),
+                ('average_days_to_complete', models.IntegerField(default=0)),
+                ('num_learners_completed', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ('month_for', 'course_id'),
+            },
+        ),
+        migrations.CreateModel(
+            name='SiteMonthlyMetrics',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, verbose_name='created', editable=False)),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, verbose_name='modified', editable=False)),
+                ('month_for', models.DateField(unique=True)),
+                ('active_user_count', models.IntegerField(default=0)),
+                ('total_user_count', models.IntegerField(default=0)),
+                ('course_count', models.IntegerField(default=0)),
+                ('total_enrollment_count', models.IntegerField(default=0)),
+                ('num_learners_completed', models.IntegerField(default=0)),
+            ],
+            options={
+                'ordering': ('month_for',),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='coursemonthlymetrics',
+            unique_together=set([('course_id', 'month_for')]),
+        ),
+    ]
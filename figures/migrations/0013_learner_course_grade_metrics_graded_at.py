@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('figures', '0012_monthly_metrics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='learnercoursegrademetrics',
+            name='graded_at',
+            field=models.DateTimeField(null=True, blank=True),
+        ),
+    ]
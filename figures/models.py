@@ -2,14 +2,21 @@
 
 """
 
+import datetime
+
 from django.conf import settings
 from django.db import models
+from django.db.models import Q
+from django.utils import timezone
 from django.utils.encoding import python_2_unicode_compatible
 
 from jsonfield import JSONField
 
 from model_utils.models import TimeStampedModel
 
+from figures.helpers import as_date
+from figures.hll import HyperLogLog
+
 
 @python_2_unicode_compatible
 class CourseDailyMetrics(TimeStampedModel):
@@ -30,7 +37,23 @@ class CourseDailyMetrics(TimeStampedModel):
     average_progress = models.DecimalField(
         max_digits=2, decimal_places=2, blank=True, null=True)
     average_days_to_complete = models.IntegerField(blank=True, null=True)
+    # Distribution of days to complete. The histogram is a dict with 'bins',
+    # the lower bound of each bin in days, and 'counts'
+    days_to_complete_median = models.IntegerField(blank=True, null=True)
+    days_to_complete_p90 = models.IntegerField(blank=True, null=True)
+    days_to_complete_histogram = JSONField(blank=True, null=True)
     num_learners_completed = models.IntegerField()
+    # Set when grading ran out of its time budget and the average progress
+    # uses carried forward grades for the learners not graded
+    partial = models.BooleanField(default=False)
+    learners_graded = models.IntegerField(blank=True, null=True)
+    # Set when the average progress is estimated from a sample of learners.
+    # The bounds are the estimate's 95% confidence interval
+    average_progress_lower = models.DecimalField(
+        max_digits=3, decimal_places=2, blank=True, null=True)
+    average_progress_upper = models.DecimalField(
+        max_digits=3, decimal_places=2, blank=True, null=True)
+    progress_sample_size = models.IntegerField(blank=True, null=True)
 
     class Meta:
         unique_together = ('course_id', 'date_for',)
@@ -68,6 +91,182 @@ class SiteDailyMetrics(TimeStampedModel):
         return "{} {}".format(self.id, self.date_for)
 
 
+@python_2_unicode_compatible
+class CourseDaysToCompleteAggregate(TimeStampedModel):
+    """Running days to complete aggregate for a course
+
+    Holds the days to complete for the course's certificates created through
+    ``date_for``. The pipeline advances the aggregate with the certificates
+    created after ``date_for`` so it does not have to rescan all of the
+    course's certificates each day.
+
+    ``day_counts`` maps the number of days to complete, as a string since it
+    is stored as JSON, to the number of certificates. Aggregates can be merged
+    by adding their counts
+    """
+    course_id = models.CharField(max_length=255, unique=True)
+    date_for = models.DateField()
+    certificate_count = models.IntegerField(default=0)
+    days_sum = models.BigIntegerField(default=0)
+    day_counts = JSONField(default=dict)
+
+    class Meta:
+        ordering = ('course_id',)
+
+    def __str__(self):
+        return "id:{}, date_for:{}, course_id:{}".format(
+            self.id, self.date_for, self.course_id)
+
+
+class ActiveUsersSketchManager(models.Manager):
+    """Custom model manager for the ActiveUsersSketch model
+    """
+    def merged(self, start_date, end_date, course_ids=None):
+        """Returns the sketch merged from the daily sketches from
+        ``start_date`` through ``end_date``, or None if there are none
+
+        Merges the site sketches, or the sketches for ``course_ids`` if given.
+        Only the days the sketches cover are merged. See ``merged_for_periods``
+        """
+        return self.merged_for_periods([(start_date, end_date)], course_ids)[0][0]
+
+    def merged_for_periods(self, periods, course_ids=None):
+        """Returns ``(sketch, uncovered_dates)`` for each ``(start_date,
+        end_date)`` period, with a single query
+
+        The pipeline writes the site sketch every day it runs, even when no one
+        is active, so the days with a site sketch are the days the sketches
+        cover, for the site and for each course. ``sketch`` is merged from the
+        sketches for the covered days in the period, or is None if no day in
+        the period is covered. ``uncovered_dates`` is the sorted list of the
+        other days in the period
+        """
+        if not periods:
+            return []
+        periods = [(as_date(start_date), as_date(end_date))
+                   for start_date, end_date in periods]
+        course_ids = [str(course_id) for course_id in course_ids or []]
+        data = self.filter(
+            Q(course_id='') | Q(course_id__in=course_ids),
+            date_for__gte=min(start_date for start_date, end_date in periods),
+            date_for__lte=max(end_date for start_date, end_date in periods),
+        ).values_list('date_for', 'course_id', 'sketch')
+        covered = set()
+        sketches = []
+        for date_for, course_id, sketch in data:
+            if not course_id:
+                covered.add(date_for)
+            if bool(course_id) == bool(course_ids):
+                sketches.append((date_for, HyperLogLog.from_bytes(sketch)))
+        merged = []
+        for start_date, end_date in periods:
+            dates = [start_date + datetime.timedelta(days=day)
+                     for day in range((end_date - start_date).days + 1)]
+            uncovered = [date_for for date_for in dates if date_for not in covered]
+            if len(uncovered) == len(dates):
+                merged.append((None, uncovered))
+                continue
+            in_period = [sketch for date_for, sketch in sketches
+                         if start_date <= date_for <= end_date]
+            merged.append((HyperLogLog.union(
+                in_period, precision=in_period[0].precision)
+                if in_period else HyperLogLog(), uncovered))
+        return merged
+
+
+@python_2_unicode_compatible
+class ActiveUsersSketch(TimeStampedModel):
+    """HyperLogLog sketch of the users active on a day in a course, or in the
+    site if ``course_id`` is blank
+
+    The pipeline writes the sketches. The number of users active over a range
+    of days is the count of the merged sketches for the days. See
+    ``figures.hll``
+
+    ``user_count`` is the exact number of users active on the day
+    """
+    date_for = models.DateField()
+    course_id = models.CharField(max_length=255, blank=True)
+    sketch = models.BinaryField()
+    user_count = models.IntegerField(default=0)
+
+    objects = ActiveUsersSketchManager()
+
+    class Meta:
+        unique_together = ('course_id', 'date_for',)
+        ordering = ('-date_for', 'course_id',)
+
+    def __str__(self):
+        return "id:{}, date_for:{}, course_id:{}".format(
+            self.id, self.date_for, self.course_id or 'site')
+
+
+class MonthlyMetricsManager(models.Manager):
+    """Custom model manager for the monthly metrics models
+    """
+    def for_months(self, start_date, end_date, **filters):
+        """Returns a dict of the records for the months from ``start_date``
+        through ``end_date``, keyed by ``month_for``, with a single query
+        """
+        qs = self.filter(
+            month_for__gte=start_date.replace(day=1),
+            month_for__lte=end_date,
+            **filters)
+        return dict((rec.month_for, rec) for rec in qs)
+
+
+@python_2_unicode_compatible
+class SiteMonthlyMetrics(TimeStampedModel):
+    """Site metrics for a month, rolled up from the daily metrics
+
+    The pipeline updates the month's record whenever it writes daily metrics
+    for a day in the month. Each value is what the matching
+    ``figures.metrics`` time period function returns for the month, so the
+    site history reads a series from these records
+
+    ``month_for`` is the first day of the month
+    """
+    month_for = models.DateField(unique=True)
+    active_user_count = models.IntegerField(default=0)
+    total_user_count = models.IntegerField(default=0)
+    course_count = models.IntegerField(default=0)
+    total_enrollment_count = models.IntegerField(default=0)
+    num_learners_completed = models.IntegerField(default=0)
+
+    objects = MonthlyMetricsManager()
+
+    class Meta:
+        ordering = ('month_for',)
+
+    def __str__(self):
+        return "id:{}, month_for:{}".format(self.id, self.month_for)
+
+
+@python_2_unicode_compatible
+class CourseMonthlyMetrics(TimeStampedModel):
+    """Course metrics for a month, rolled up from the course daily metrics
+
+    The pipeline updates the month's record whenever it writes the course's
+    daily metrics for a day in the month. See ``SiteMonthlyMetrics``
+    """
+    month_for = models.DateField()
+    course_id = models.CharField(max_length=255)
+    enrollment_count = models.IntegerField(default=0)
+    average_progress = models.FloatField(default=0.0)
+    average_days_to_complete = models.IntegerField(default=0)
+    num_learners_completed = models.IntegerField(default=0)
+
+    objects = MonthlyMetricsManager()
+
+    class Meta:
+        unique_together = ('course_id', 'month_for',)
+        ordering = ('month_for', 'course_id',)
+
+    def __str__(self):
+        return "id:{}, month_for:{}, course_id:{}".format(
+            self.id, self.month_for, self.course_id)
+
+
 class LearnerCourseGradeMetricsManager(models.Manager):
     """Custom model manager for LearnerCourseGrades model
     """
@@ -110,6 +309,11 @@ class LearnerCourseGradeMetrics(TimeStampedModel):
     sections_worked = models.IntegerField()
     sections_possible = models.IntegerField()
 
+    # When the grades were computed. Rows carried forward keep the time the
+    # grades were computed, not when the row was written. Null for rows
+    # written before this was recorded
+    graded_at = models.DateTimeField(blank=True, null=True)
+
     objects = LearnerCourseGradeMetricsManager()
 
     class Meta:
@@ -176,3 +380,97 @@ class PipelineError(TimeStampedModel):
 
     def __str__(self):
         return "{}, {}, {}".format(self.id, self.created, self.error_type)
+
+
+@python_2_unicode_compatible
+class PipelineRun(TimeStampedModel):
+    """A run of the daily metrics pipeline for a date
+
+    This is the ledger for the run. It has a ``PipelineCourseRun`` for each
+    course, which records how the course went. The site metrics step is
+    recorded in the run itself.
+
+    For the parallel pipeline, the course runs are also the barrier for the
+    run. ``SiteDailyMetrics`` are populated once every course run has
+    finished, either complete or failed. The serial pipeline uses the course
+    runs to resume a run that did not finish. See ``figures.pipeline.runs``
+    """
+    SERIAL = 'serial'
+    PARALLEL = 'parallel'
+
+    MODE_CHOICES = (
+        (SERIAL, 'Serial'),
+        (PARALLEL, 'Parallel'),
+        )
+
+    RUNNING = 'running'
+    FINALIZING = 'finalizing'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = (
+        (RUNNING, 'Running'),
+        (FINALIZING, 'Populating site metrics'),
+        (COMPLETE, 'Complete'),
+        (FAILED, 'Failed'),
+        )
+    date_for = models.DateField()
+    force_update = models.BooleanField(default=False)
+    mode = models.CharField(
+        max_length=20, choices=MODE_CHOICES, default=PARALLEL)
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default=RUNNING)
+    started = models.DateTimeField(default=timezone.now)
+    finished = models.DateTimeField(blank=True, null=True)
+    # Seconds by stage name and query count for the site metrics step
+    stage_durations = JSONField(blank=True, null=True)
+    query_count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['-created']
+
+    def __str__(self):
+        return "{}, {}, {}".format(self.id, self.date_for, self.status)
+
+
+@python_2_unicode_compatible
+class PipelineCourseRun(TimeStampedModel):
+    """Tracks populating the ``CourseDailyMetrics`` for a course in a
+    ``PipelineRun``
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    COMPLETE = 'complete'
+    FAILED = 'failed'
+
+    STATUS_CHOICES = (
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (COMPLETE, 'Complete'),
+        (FAILED, 'Failed'),
+        )
+    FINISHED_STATUSES = (COMPLETE, FAILED)
+
+    run = models.ForeignKey(PipelineRun, related_name='course_runs')
+    course_id = models.CharField(max_length=255)
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True)
+    # These are for the last attempt
+    started = models.DateTimeField(blank=True, null=True)
+    finished = models.DateTimeField(blank=True, null=True)
+    # Seconds by stage name
+    stage_durations = JSONField(blank=True, null=True)
+    query_count = models.IntegerField(default=0)
+    learners_processed = models.IntegerField(default=0)
+    error_count = models.IntegerField(default=0)
+    # Set when the course grades ran out of their time budget
+    partial = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ('run', 'course_id',)
+        ordering = ('run', 'course_id',)
+
+    def __str__(self):
+        return "{}, {}, {}".format(self.id, self.course_id, self.status)
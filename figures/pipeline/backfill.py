@@ -0,0 +1,302 @@
+'''Backfills the daily metrics for a range of dates
+
+Running ``populate_daily_metrics`` for each day in a range rescans the
+enrollments, certificates, users and courses for every day. The backfill
+instead reads each source's timestamps once, sorted, and sweeps through them
+a day at a time, keeping running counts. Each day's ``CourseDailyMetrics``
+and ``SiteDailyMetrics`` are built from the running counts and written in
+bulk.
+
+The enrollment and active learner counts leave out the course staff, the
+same as ``figures.pipeline.site_extractors``.
+
+The daily active users sketches are written for every day in the range,
+whether or not the day's metrics records exist. See
+``figures.pipeline.sketches``. Then the monthly metrics are rolled up for each
+month in the range. See ``figures.pipeline.monthly_metrics``. The cached
+general site metrics are computed again after a backfill. See
+``figures.cache``.
+
+The course metrics are built for the courses created by the day. Grades are
+not computed. ``average_progress`` is the average of the learners'
+``LearnerCourseGradeMetrics`` progress for the course and day and is left
+empty where there are no such records.
+
+Usage::
+
+    backfill_daily_metrics(start_date, end_date)
+
+'''
+
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db.models import F
+
+from certificates.models import GeneratedCertificate
+from courseware.models import StudentModule
+from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
+from student.models import CourseEnrollment
+
+from figures.cache import bump_data_version
+from figures.helpers import as_datetime, next_day
+from figures.models import (
+    ActiveUsersSketch,
+    CourseDailyMetrics,
+    LearnerCourseGradeMetrics,
+    SiteDailyMetrics,
+)
+from figures.pipeline.bulk import BulkUpserter
+from figures.pipeline.course_daily_metrics import calc_day_counts_stats
+from figures.pipeline.monthly_metrics import update_monthly_metrics
+from figures.pipeline.site_daily_metrics import (
+    get_previous_cumulative_active_user_count,
+)
+from figures.pipeline.site_extractors import CourseStaffIndex
+from figures.pipeline.sketches import add_active_user_sketches
+
+
+def days_in_range(start_date, end_date):
+    '''Yields each date from ``start_date`` through ``end_date``
+    '''
+    date_for = start_date
+    while date_for <= end_date:
+        yield date_for
+        date_for = next_day(date_for)
+
+
+def sweep(events, start_date, end_date, add):
+    '''Sweeps through time ordered events a day at a time
+
+    ``events`` is an iterable of tuples sorted by their first item, a
+    timestamp. For each day from ``start_date`` through ``end_date``, calls
+    ``add`` with each event up to the end of the day that has not been added
+    yet, then yields the day. The first day also adds all the events before
+    ``start_date``
+    '''
+    events = iter(events)
+    pending = next(events, None)
+    for date_for in days_in_range(start_date, end_date):
+        day_end = as_datetime(next_day(date_for))
+        while pending is not None and pending[0] < day_end:
+            add(pending)
+            pending = next(events, None)
+        yield date_for
+
+
+def enrollment_events(end_date):
+    return CourseEnrollment.objects.filter(
+        created__lt=as_datetime(next_day(end_date)),
+    ).order_by('created').values_list('created', 'course_id', 'user_id').iterator()
+
+
+def certificate_events(end_date):
+    return GeneratedCertificate.objects.filter(
+        created_date__lt=as_datetime(next_day(end_date)),
+    ).order_by('created_date').values_list('created_date', 'course_id').iterator()
+
+
+def days_to_complete_events(end_date):
+    '''Returns the certificate date, course id, user id and enrollment date
+    for each certificate with an enrollment in the course
+
+    A learner with more than one enrollment in the course has a row for each.
+    The rows are ordered so the earliest enrollment comes first, the same as
+    ``figures.pipeline.course_daily_metrics.get_days_to_complete``
+    '''
+    return GeneratedCertificate.objects.filter(
+        created_date__lt=as_datetime(next_day(end_date)),
+        user__courseenrollment__course_id=F('course_id'),
+    ).order_by(
+        'created_date', 'course_id', 'user_id', 'user__courseenrollment__created',
+    ).values_list(
+        'created_date', 'course_id', 'user_id', 'user__courseenrollment__created',
+    ).iterator()
+
+
+def user_events(end_date):
+    return get_user_model().objects.filter(
+        date_joined__lt=as_datetime(next_day(end_date)),
+    ).order_by('date_joined').values_list('date_joined', 'id').iterator()
+
+
+def course_events(end_date):
+    return CourseOverview.objects.filter(
+        created__lt=as_datetime(next_day(end_date)),
+    ).order_by('created').values_list('created', 'id').iterator()
+
+
+def activity_events(start_date, end_date):
+    return StudentModule.objects.filter(
+        modified__gte=as_datetime(start_date),
+        modified__lt=as_datetime(next_day(end_date)),
+    ).order_by('modified').values_list(
+        'modified', 'course_id', 'student_id').iterator()
+
+
+def get_progress_by_course_day(start_date, end_date):
+    '''Returns the average ``LearnerCourseGradeMetrics`` progress for each
+    course and day in the range that has records, keyed by
+    ``(course_id, date_for)``
+    '''
+    totals = defaultdict(lambda: [0.0, 0])
+    recs = LearnerCourseGradeMetrics.objects.filter(
+        date_for__gte=start_date,
+        date_for__lte=end_date,
+    ).values_list('course_id', 'date_for', 'sections_worked', 'sections_possible')
+    for course_id, date_for, sections_worked, sections_possible in recs.iterator():
+        total = totals[(course_id, date_for)]
+        if sections_possible:
+            total[0] += float(sections_worked) / float(sections_possible)
+        total[1] += 1
+    return dict((key, total[0] / total[1]) for key, total in totals.items())
+
+
+class DailyMetricsSweep(object):
+    '''Holds the running counts for the backfill sweep
+
+    Call ``days`` to sweep through the range. After each day is yielded, the
+    running counts are through the end of that day
+    '''
+    def __init__(self, start_date, end_date, staff_index=None):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.staff_index = staff_index or CourseStaffIndex()
+        self.enrollment_counts = defaultdict(int)
+        self.certificate_counts = defaultdict(int)
+        self.day_counts = defaultdict(lambda: defaultdict(int))
+        self.user_count = 0
+        self.course_ids = []
+        self.active_learners = defaultdict(set)
+        self.site_active_learners = set()
+        self._last_certificate = None
+
+    def add_enrollment(self, event):
+        if not self.staff_index.is_staff(event[1], event[2]):
+            self.enrollment_counts[str(event[1])] += 1
+
+    def add_certificate(self, event):
+        self.certificate_counts[str(event[1])] += 1
+
+    def add_days_to_complete(self, event):
+        cert_created, course_id, user_id, enrollment_created = event
+        # Skip the later enrollments for learners enrolled more than once
+        if (course_id, user_id) == self._last_certificate:
+            return
+        self._last_certificate = (course_id, user_id)
+        self.day_counts[str(course_id)][(cert_created - enrollment_created).days] += 1
+
+    def add_user(self, event):
+        self.user_count += 1
+
+    def add_course(self, event):
+        self.course_ids.append(str(event[1]))
+
+    def add_activity(self, event):
+        if self.staff_index.is_staff(event[1], event[2]):
+            return
+        self.active_learners[str(event[1])].add(event[2])
+        self.site_active_learners.add(event[2])
+
+    def days(self):
+        '''Yields each day in the range after the day's events are added
+        '''
+        start_date, end_date = self.start_date, self.end_date
+        sweeps = [
+            sweep(enrollment_events(end_date), start_date, end_date,
+                  self.add_enrollment),
+            sweep(certificate_events(end_date), start_date, end_date,
+                  self.add_certificate),
+            sweep(days_to_complete_events(end_date), start_date, end_date,
+                  self.add_days_to_complete),
+            sweep(user_events(end_date), start_date, end_date, self.add_user),
+            sweep(course_events(end_date), start_date, end_date, self.add_course),
+            sweep(activity_events(start_date, end_date), start_date, end_date,
+                  self.add_activity),
+        ]
+        for date_for in days_in_range(start_date, end_date):
+            for day_sweep in sweeps:
+                next(day_sweep)
+            yield date_for
+            # Activity is counted per day, not cumulatively
+            self.active_learners = defaultdict(set)
+            self.site_active_learners = set()
+
+
+def backfill_daily_metrics(start_date, end_date, force_update=False):
+    '''Populates CourseDailyMetrics and SiteDailyMetrics for each day from
+    ``start_date`` through ``end_date``
+
+    Existing records are kept unless ``force_update`` is True. Returns a dict
+    with the number of course and site records, sketches and monthly records
+    written
+    '''
+    existing_cdm = set()
+    existing_sdm = {}
+    if not force_update:
+        existing_cdm = set(CourseDailyMetrics.objects.filter(
+            date_for__gte=start_date, date_for__lte=end_date,
+        ).values_list('course_id', 'date_for'))
+        existing_sdm = dict(SiteDailyMetrics.objects.filter(
+            date_for__gte=start_date, date_for__lte=end_date,
+        ).values_list('date_for', 'cumulative_active_user_count'))
+
+    progress = get_progress_by_course_day(start_date, end_date)
+    cumulative_active_user_count = get_previous_cumulative_active_user_count(
+        start_date)
+    course_stats = {}
+    state = DailyMetricsSweep(start_date, end_date)
+    cdm_writer = BulkUpserter(CourseDailyMetrics)
+    sdm_writer = BulkUpserter(SiteDailyMetrics, unique_fields=('date_for',))
+    sketch_writer = BulkUpserter(ActiveUsersSketch)
+
+    for date_for in state.days():
+        add_active_user_sketches(sketch_writer, date_for,
+                                 state.active_learners, state.site_active_learners)
+        for course_id in state.course_ids:
+            if (course_id, date_for) in existing_cdm:
+                continue
+            stats = course_stats.get(course_id)
+            certificate_count = sum(state.day_counts[course_id].values())
+            if not stats or stats[0] != certificate_count:
+                stats = (certificate_count,
+                         calc_day_counts_stats(state.day_counts[course_id]))
+                course_stats[course_id] = stats
+            cdm_writer.add(
+                course_id=course_id,
+                date_for=date_for,
+                enrollment_count=state.enrollment_counts[course_id],
+                active_learners_today=len(state.active_learners[course_id]),
+                average_progress=progress.get((course_id, date_for)),
+                average_days_to_complete=stats[1]['average'],
+                days_to_complete_median=stats[1]['median'],
+                days_to_complete_p90=stats[1]['p90'],
+                days_to_complete_histogram=stats[1]['histogram'],
+                num_learners_completed=state.certificate_counts[course_id],
+            )
+
+        todays_active_user_count = len(state.site_active_learners)
+        if date_for in existing_sdm:
+            cumulative_active_user_count = existing_sdm[date_for] or 0
+            continue
+        cumulative_active_user_count += todays_active_user_count
+        sdm_writer.add(
+            date_for=date_for,
+            cumulative_active_user_count=cumulative_active_user_count,
+            todays_active_user_count=todays_active_user_count,
+            total_user_count=state.user_count,
+            course_count=len(state.course_ids),
+            total_enrollment_count=sum(
+                state.enrollment_counts[course_id]
+                for course_id in state.course_ids),
+        )
+
+    cdm_writer.flush()
+    sdm_writer.flush()
+    sketch_writer.flush()
+    results = dict(course_daily_metrics=cdm_writer.rows_written,
+                   site_daily_metrics=sdm_writer.rows_written,
+                   active_users_sketches=sketch_writer.rows_written)
+    results.update(update_monthly_metrics(start_date, end_date))
+    bump_data_version(start_date)
+    return results
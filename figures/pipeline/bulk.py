@@ -0,0 +1,207 @@
+'''Bulk writes for the Figures pipeline
+
+The pipeline writes one metrics row per learner per course per day. Writing
+those rows one at a time with ``update_or_create`` costs at least two round
+trips per row. ``BulkUpserter`` buffers rows and writes them in chunks.
+
+On databases that support it, each chunk is written with a single native
+upsert statement:
+
+* MySQL: ``INSERT ... ON DUPLICATE KEY UPDATE``
+* PostgreSQL 9.5+ and SQLite 3.24+: ``INSERT ... ON CONFLICT ... DO UPDATE``
+
+Elsewhere, each chunk selects the rows that already exist, inserts the new
+rows with ``bulk_create`` and updates the existing rows. Django 1.8 does not
+provide ``bulk_update``, so existing rows are updated one at a time, but
+inside the chunk's transaction.
+
+Rows are identified by the model's first ``unique_together`` constraint
+unless ``unique_fields`` is given. Rows added more than once with the same
+unique key are collapsed so that the last one added wins, the same result as
+calling ``update_or_create`` for each of them in order.
+
+Usage::
+
+    with BulkUpserter(LearnerCourseGradeMetrics) as writer:
+        for ce in course_enrollments:
+            writer.add(user=ce.user, course_id=str(ce.course_id), ...)
+
+'''
+
+from collections import OrderedDict
+
+from django.db import connections, router, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from model_utils.fields import AutoCreatedField, AutoLastModifiedField
+
+from figures import settings
+
+
+def supports_native_upsert(connection):
+    '''Returns True if we know how to write an upsert statement for the
+    database backend
+    '''
+    if connection.vendor == 'mysql':
+        return True
+    elif connection.vendor == 'postgresql':
+        return connection.pg_version >= 90500
+    elif connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 24, 0)
+    else:
+        return False
+
+
+class BulkUpserter(object):
+    '''Buffers rows for a Figures model and upserts them in chunks
+
+    ``batch_size`` is the number of rows written per statement.
+    ``transaction_size`` is the number of rows buffered before they are
+    flushed. Each flush is committed in its own transaction
+
+    Both default to the Figures settings. See
+    ``figures.settings.bulk_write_batch_size`` and
+    ``figures.settings.bulk_write_transaction_size``
+    '''
+    def __init__(self, model, unique_fields=None, batch_size=None,
+                 transaction_size=None, using=None):
+        self.model = model
+        self.using = using or router.db_for_write(model)
+        self.batch_size = batch_size or settings.bulk_write_batch_size()
+        self.transaction_size = (
+            transaction_size or settings.bulk_write_transaction_size())
+        if not unique_fields:
+            unique_fields = model._meta.unique_together[0]
+        self.unique_fields = [model._meta.get_field(name) for name in unique_fields]
+        self.fields = [field for field in model._meta.concrete_fields
+                       if not field.primary_key]
+        # Keep the original 'created' timestamp when a row is updated. Note
+        # that AutoLastModifiedField is a subclass of AutoCreatedField
+        self.update_fields = [
+            field for field in self.fields
+            if field not in self.unique_fields and (
+                isinstance(field, AutoLastModifiedField) or
+                not isinstance(field, AutoCreatedField))]
+        self._rows = OrderedDict()
+        self.rows_written = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, **values):
+        '''Adds a row to the buffer. Flushes when the buffer is full
+
+        ``values`` are model field values by field name, the same as we would
+        pass to the model constructor. They must include the unique fields
+        '''
+        obj = self.model(**values)
+        key = tuple(getattr(obj, field.attname) for field in self.unique_fields)
+        # Re-adding a key moves it to the end so the last one wins
+        self._rows.pop(key, None)
+        self._rows[key] = obj
+        if len(self._rows) >= self.transaction_size:
+            self.flush()
+
+    def flush(self):
+        '''Writes all the buffered rows in one transaction
+        '''
+        if not self._rows:
+            return
+        objs = list(self._rows.values())
+        self._rows = OrderedDict()
+        connection = connections[self.using]
+        now = timezone.now()
+        with transaction.atomic(using=self.using):
+            for i in range(0, len(objs), self.batch_size):
+                batch = objs[i:i + self.batch_size]
+                if supports_native_upsert(connection):
+                    self._native_upsert(connection, batch, now)
+                else:
+                    self._select_then_write(batch, now)
+        self.rows_written += len(objs)
+
+    def _prepare(self, obj, now):
+        '''Sets the values the ORM would set when saving a new row
+        '''
+        for field in self.fields:
+            if isinstance(field, (AutoCreatedField, AutoLastModifiedField)):
+                setattr(obj, field.attname, now)
+            else:
+                field.pre_save(obj, add=True)
+        return obj
+
+    def _native_upsert(self, connection, batch, now):
+        qn = connection.ops.quote_name
+        columns = [field.column for field in self.fields]
+        row_sql = '({})'.format(', '.join(['%s'] * len(columns)))
+        params = []
+        for obj in batch:
+            self._prepare(obj, now)
+            params.extend([
+                field.get_db_prep_save(getattr(obj, field.attname), connection)
+                for field in self.fields])
+
+        sql = 'INSERT INTO {table} ({columns}) VALUES {rows}'.format(
+            table=qn(self.model._meta.db_table),
+            columns=', '.join(qn(column) for column in columns),
+            rows=', '.join([row_sql] * len(batch)))
+
+        if connection.vendor == 'mysql':
+            sql += ' ON DUPLICATE KEY UPDATE {}'.format(', '.join(
+                '{col} = VALUES({col})'.format(col=qn(field.column))
+                for field in self.update_fields))
+        else:
+            sql += ' ON CONFLICT ({}) DO UPDATE SET {}'.format(
+                ', '.join(qn(field.column) for field in self.unique_fields),
+                ', '.join('{col} = excluded.{col}'.format(col=qn(field.column))
+                          for field in self.update_fields))
+
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def _select_then_write(self, batch, now):
+        manager = self.model._default_manager.db_manager(self.using)
+        unique_attnames = [field.attname for field in self.unique_fields]
+
+        def lookup(obj):
+            return dict((attname, getattr(obj, attname)) for attname in unique_attnames)
+
+        query = Q()
+        for obj in batch:
+            query |= Q(**lookup(obj))
+        existing = dict(
+            (tuple(rec[attname] for attname in unique_attnames), rec['pk'])
+            for rec in manager.filter(query).values('pk', *unique_attnames))
+
+        new_objs = []
+        for obj in batch:
+            self._prepare(obj, now)
+            pk = existing.get(tuple(getattr(obj, attname) for attname in unique_attnames))
+            if pk is None:
+                new_objs.append(obj)
+            else:
+                manager.filter(pk=pk).update(**dict(
+                    (field.attname, getattr(obj, field.attname))
+                    for field in self.update_fields))
+        if new_objs:
+            manager.bulk_create(new_objs)
+
+
+def upsert(model, rows, **kwargs):
+    '''Convenience function to upsert a list of row dicts immediately
+
+    Returns the number of rows written
+    '''
+    writer = BulkUpserter(model, **kwargs)
+    for row in rows:
+        writer.add(**row)
+    writer.flush()
+    return writer.rows_written
@@ -9,7 +9,13 @@ This module performs the following:
 
 
 # These are needed for the extractors
+import bisect
+from collections import defaultdict
 import datetime
+import math
+import time
+
+from django.db.models import Max
 from django.utils.timezone import utc
 
 from certificates.models import GeneratedCertificate
@@ -18,13 +24,28 @@ from openedx.core.djangoapps.content.course_overviews.models import CourseOvervi
 from student.models import CourseEnrollment
 from student.roles import CourseCcxCoachRole, CourseInstructorRole, CourseStaffRole
 
+from figures import settings
+from figures.cache import bump_data_version
 from figures.helpers import as_course_key, as_datetime, next_day, prev_day
 import figures.metrics
-from figures.models import CourseDailyMetrics, PipelineError
-from figures.pipeline.logger import log_error
+from figures.models import (
+    CourseDailyMetrics,
+    CourseDaysToCompleteAggregate,
+    LearnerCourseGradeMetrics,
+    PipelineError,
+)
+import figures.pipeline.grades
+from figures.pipeline.instrumentation import PipelineStats
+from figures.pipeline.logger import buffered_errors, log_error
 import figures.pipeline.loaders
+import figures.pipeline.monthly_metrics
+import figures.pipeline.sampling
+from figures.pipeline.site_extractors import CourseStaffIndex
 from figures.serializers import CourseIndexSerializer
 
+# Lower bounds, in days, of the days to complete histogram bins
+DAYS_TO_COMPLETE_HISTOGRAM_BINS = (0, 7, 14, 30, 60, 90, 180, 365)
+
 # TODO: Move extractors to figures.pipeline.extract module
 
 # The extractors work locally on the LMS
@@ -45,6 +66,24 @@ def get_course_enrollments(course_id, date_for):
     )
 
 
+def get_course_ids_to_populate(date_for, force_update=False):
+    """Returns the ids of the courses to populate ``CourseDailyMetrics`` for,
+    as strings
+
+    Unless ``force_update`` is True, the courses that already have a record
+    for ``date_for`` are left out. The existing keys are read with one query,
+    so the pipeline does not check each course on its own. We cannot use a
+    subquery because ``CourseKeyField`` lookups evaluate querysets
+    """
+    course_ids = [str(course_id) for course_id in
+                  CourseOverview.objects.values_list('id', flat=True)]
+    if force_update:
+        return course_ids
+    existing = set(CourseDailyMetrics.objects.filter(
+        date_for=date_for).values_list('course_id', flat=True))
+    return [course_id for course_id in course_ids if course_id not in existing]
+
+
 def get_num_enrolled_in_exclude_admins(course_id, date_for):
     """
     Copied over from CourseEnrollmentManager.num_enrolled_in_exclude_admins method
@@ -67,56 +106,348 @@ def get_num_enrolled_in_exclude_admins(course_id, date_for):
     ).exclude(user__in=staff).exclude(user__in=admins).exclude(user__in=coaches).count()
 
 
+def get_course_staff_user_ids(course_id):
+    """Returns the ids of the users with a course staff role in the course
+
+    See ``figures.pipeline.site_extractors.CourseStaffIndex``
+    """
+    return CourseStaffIndex([course_id]).users_for(course_id)
+
+
+def get_learner_enrollment_count(course_id, date_for):
+    """Returns the number of enrollments through ``date_for`` for learners,
+    leaving out the course staff
+    """
+    return get_course_enrollments(course_id, date_for).exclude(
+        user_id__in=get_course_staff_user_ids(course_id)).count()
+
+
 def get_active_learner_ids_today(course_id, date_for):
     """Get unique user ids for learners who are active today for the given
-    course and date
+    course and date. The course staff are left out
 
+    The pipeline gets the counts for all courses at once with
+    ``figures.pipeline.site_extractors.get_active_learners_for_date``. This
+    function is used when a single course is processed on its own
     """
     return StudentModule.objects.filter(
         course_id=as_course_key(course_id),
-        modified=as_datetime(date_for)).values_list('student__id', flat=True).distinct()
+        modified__gte=as_datetime(date_for),
+        modified__lt=as_datetime(next_day(date_for)),
+    ).exclude(
+        student_id__in=get_course_staff_user_ids(course_id),
+    ).values_list('student__id', flat=True).distinct()
+
+
+def get_latest_learner_course_grades(course_id, date_for):
+    """Returns the most recent ``LearnerCourseGradeMetrics`` record on or
+    before ``date_for`` for each learner in the course, as a dict keyed by
+    user id
+
+    We find each learner's latest snapshot date with one grouped query, then
+    fetch the snapshot rows one date at a time. Because the incremental pass
+    writes a snapshot for every enrollment every day, there are usually only
+    one or two distinct dates
+    """
+    course_lcgm = LearnerCourseGradeMetrics.objects.filter(
+        course_id=str(course_id),
+        date_for__lte=date_for)
+    latest_dates = course_lcgm.values('user_id').annotate(
+        latest=Max('date_for')).order_by()
+
+    user_ids_for_date = defaultdict(set)
+    for rec in latest_dates:
+        user_ids_for_date[rec['latest']].add(rec['user_id'])
+
+    snapshots = dict()
+    for snapshot_date, user_ids in user_ids_for_date.items():
+        for lcgm in course_lcgm.filter(date_for=snapshot_date):
+            if lcgm.user_id in user_ids:
+                snapshots[lcgm.user_id] = lcgm
+    return snapshots
+
+
+def get_learner_last_activity(course_id, date_for):
+    """Returns the most recent ``StudentModule.modified`` timestamp up to the
+    end of ``date_for`` for each learner in the course, as a dict keyed by
+    user id
+    """
+    recs = StudentModule.objects.filter(
+        course_id=as_course_key(course_id),
+        modified__lt=as_datetime(next_day(date_for)),
+    ).values('student_id').annotate(last_modified=Max('modified')).order_by()
+    return {rec['student_id']: rec['last_modified'] for rec in recs}
+
+
+def learner_needs_regrade(snapshot, last_activity):
+    """Returns True if the learner has courseware activity that is not
+    reflected in their grades snapshot
+
+    We compare against the snapshot's ``graded_at``, which is when the grades
+    were computed. Carried forward snapshots keep it, so activity after the
+    grades were computed is never hidden by a later carry forward. Snapshots
+    with no ``graded_at`` are regraded
+    """
+    if not snapshot or not snapshot.graded_at:
+        return True
+    return bool(last_activity and last_activity > snapshot.graded_at)
+
+
+def grade_learners(course_id, date_for, course_enrollments, lcg_writer):
+    """Grades the course enrollments and adds a ``LearnerCourseGradeMetrics``
+    row for each learner graded to ``lcg_writer``
+
+    Yields a ``(course_enrollment, grade_result)`` tuple for each learner as
+    they are graded. Learners who cannot be graded are logged and yielded
+    with the error in their ``GradeResult``. Close the generator to stop
+    grading. Raises if the course cannot be graded
+
+    The rows' ``graded_at`` is when grading started, so activity while the
+    course is graded is regraded in the next incremental pass
+    """
+    if not course_enrollments:
+        return
+    graded_at = datetime.datetime.utcnow().replace(tzinfo=utc)
+    if figures.pipeline.grades.use_grades_pool(len(course_enrollments)):
+        grade_results = figures.pipeline.grades.grade_enrollments_in_pool(
+            course_id, course_enrollments)
+    else:
+        grade_results = figures.pipeline.grades.grade_enrollments(
+            figures.metrics.CourseGradingSession(course_id), course_enrollments)
+
+    enrollments = {ce.id: ce for ce in course_enrollments}
+    try:
+        for result in grade_results:
+            ce = enrollments[result.enrollment_id]
+            if result.error:
+                error_data = dict(
+                    msg='Unable to get course blocks',
+                    username=ce.user.username,
+                    course_id=str(ce.course_id),
+                    exception=result.error,
+                    exception_class=result.error_class,
+                    )
+                log_error(
+                    error_data=error_data,
+                    error_type=PipelineError.GRADES_DATA,
+                    user=ce.user,
+                    course_id=ce.course_id,
+                    )
+            else:
+                lcg_writer.add_course_progress(
+                    date_for=date_for,
+                    course_enrollment=ce,
+                    course_progress_details=(
+                        figures.pipeline.grades.course_progress_details(result)),
+                    graded_at=graded_at)
+            yield ce, result
+    finally:
+        # Terminates a grades pool if we were closed early
+        grade_results.close()
+
+
+def log_course_grades_error(course_id, exception):
+    error_data = dict(
+        msg='Unable to grade course',
+        course_id=str(course_id),
+        exception=str(exception),
+        exception_class=type(exception).__name__,
+        )
+    log_error(
+        error_data=error_data,
+        error_type=PipelineError.COURSE_DATA,
+        course_id=course_id,
+        )
 
 
-def get_average_progress(course_id, date_for, course_enrollments):
+def get_average_progress(course_id, date_for, course_enrollments, **kwargs):
     """Collects and aggregates raw course grades data
+
+    The course is loaded once in a ``CourseGradingSession`` and shared by all
+    the learners graded here. ``LearnerCourseGradeMetrics`` rows are written
+    in bulk
+
+    If ``incremental`` is true, learners are only regraded if they have
+    ``StudentModule`` activity newer than their latest
+    ``LearnerCourseGradeMetrics`` snapshot. Everyone else has their snapshot
+    carried forward to ``date_for``. The average is still computed over all
+    of ``course_enrollments``
+
+    ``incremental`` defaults to ``figures.settings.incremental_grades()``
+
+    If grading takes longer than ``time_budget`` seconds, exact grading stops
+    and the learners not graded yet have their latest snapshot carried
+    forward. Learners with no snapshot count as no progress, the same as a
+    learner who cannot be graded. They are mostly recent enrollments, so
+    leaving them out would raise the average of partial courses. The
+    budget is checked after each learner, or after each chunk when grading in
+    a pool. ``time_budget`` defaults to
+    ``figures.settings.pipeline_grades_time_budget()``. Zero means no budget
+
+    If ``stats`` is given, the number of learners and errors are added to it,
+    along with the number of learners graded and whether the budget ran out
+
+    Large courses can be graded in a pool of worker processes. See
+    ``figures.pipeline.grades``
     """
+    incremental = kwargs.get('incremental', settings.incremental_grades())
+    snapshots = None
+    if incremental:
+        snapshots = get_latest_learner_course_grades(course_id, date_for)
+        last_activity = get_learner_last_activity(course_id, date_for)
+
+    time_budget = kwargs.get('time_budget', settings.pipeline_grades_time_budget())
+    deadline = time.time() + time_budget if time_budget else None
+
+    stats = kwargs.get('stats') or PipelineStats()
+    error_count = 0
+    learners_graded = 0
     progress = []
+    to_grade = []
+    lcg_writer = figures.pipeline.loaders.LearnerCourseGradesWriter()
 
     for ce in course_enrollments:
-        try:
-            course_progress = figures.metrics.LearnerCourseGrades.course_progress(ce)
-            figures.pipeline.loaders.save_learner_course_grades(
-                date_for=date_for,
-                course_enrollment=ce,
-                course_progress_details=course_progress['course_progress_details'])
-        except Exception as e:
-            error_data = dict(
-                msg='Unable to get course blocks',
-                username=ce.user.username,
-                course_id=str(ce.course_id),
-                exception=str(e),
-                )
-            log_error(
-                error_data=error_data,
-                error_type=PipelineError.GRADES_DATA,
-                user=ce.user,
-                course_id=ce.course_id,
-                )
-            course_progress = dict(
-                progress_percent=0.0,
-                course_progress_details=None)
-        if course_progress:
-            progress.append(course_progress)
+        if incremental:
+            snapshot = snapshots.get(ce.user_id)
+            if not learner_needs_regrade(snapshot, last_activity.get(ce.user_id)):
+                lcg_writer.carry_forward(
+                    date_for=date_for,
+                    learner_course_grades=snapshot)
+                progress.append(snapshot.progress_percent)
+                continue
+        to_grade.append(ce)
+
+    try:
+        grades = grade_learners(course_id, date_for, to_grade, lcg_writer)
+        remaining = {ce.id: ce for ce in to_grade}
+        for ce, result in grades:
+            del remaining[ce.id]
+            learners_graded += 1
+            if result.error:
+                error_count += 1
+            progress.append(result.progress_percent)
+            if deadline and remaining and time.time() > deadline:
+                # Stops the grading. This also terminates a grades pool
+                grades.close()
+                stats.partial = True
+                break
+
+        if stats.partial:
+            if snapshots is None:
+                snapshots = get_latest_learner_course_grades(course_id, date_for)
+            for ce in remaining.values():
+                snapshot = snapshots.get(ce.user_id)
+                if snapshot:
+                    lcg_writer.carry_forward(
+                        date_for=date_for,
+                        learner_course_grades=snapshot)
+                    progress.append(snapshot.progress_percent)
+                else:
+                    progress.append(0.0)
+    except Exception as e:
+        log_course_grades_error(course_id, e)
+        lcg_writer.flush()
+        stats.error_count += 1
+        return 0.0
+
+    lcg_writer.flush()
+    stats.learners_processed += len(progress)
+    stats.learners_graded += learners_graded
+    stats.error_count += error_count
+
     if len(progress):
-        progress_percent = [rec['progress_percent'] for rec in progress]
-        average_progress = float(sum(progress_percent)) / float(len(progress_percent))
+        average_progress = float(sum(progress)) / float(len(progress))
     else:
         average_progress = 0.0
 
     return average_progress
 
 
-def get_days_to_complete(course_id, date_for):
+def use_sampled_progress(enrollment_count):
+    """Returns True if the course is large enough to estimate its average
+    progress from a sample
+
+    See ``figures.settings.sampled_progress_min_enrollments``
+    """
+    min_enrollments = settings.sampled_progress_min_enrollments()
+    return bool(min_enrollments) and enrollment_count >= min_enrollments
+
+
+def get_sampled_average_progress(course_id, date_for, course_enrollments, **kwargs):
+    """Estimates the average progress by grading a sample of the learners
+
+    Returns a ``figures.pipeline.sampling.ProgressEstimate``. The learners
+    not in the sample have their latest snapshot carried forward. See
+    ``figures.pipeline.sampling`` for how the sample is chosen
+
+    ``sample_size`` and ``max_days`` default to the sampled progress
+    settings. If ``target_error`` is given, or set in the settings, the
+    sample size is what it takes for a 95% confidence interval that wide on
+    either side of the estimate
+
+    If ``stats`` is given, the number of learners and errors are added to it
+    """
+    sample_size = kwargs.get('sample_size', settings.sampled_progress_sample_size())
+    target_error = kwargs.get(
+        'target_error', settings.sampled_progress_target_error())
+    max_days = kwargs.get('max_days', settings.sampled_progress_max_days())
+    stats = kwargs.get('stats') or PipelineStats()
+
+    snapshots = get_latest_learner_course_grades(course_id, date_for)
+    course_enrollments = list(course_enrollments)
+    population = len(course_enrollments)
+    if target_error:
+        sample_size = figures.pipeline.sampling.sample_size_for_error(
+            [snapshot.progress_percent for snapshot in snapshots.values()],
+            target_error, population)
+    slots = figures.pipeline.sampling.rotation_slots(
+        population, sample_size, max_days)
+
+    # (population count, graded progress, carried forward progress) by stratum
+    strata = defaultdict(lambda: [0, [], []])
+    stratum_for = {}
+    to_grade = []
+    lcg_writer = figures.pipeline.loaders.LearnerCourseGradesWriter()
+    for ce in course_enrollments:
+        snapshot = snapshots.get(ce.user_id)
+        stratum = figures.pipeline.sampling.progress_stratum(
+            snapshot.progress_percent if snapshot else None)
+        stratum_for[ce.id] = stratum
+        strata[stratum][0] += 1
+        if figures.pipeline.sampling.in_sample(
+                ce.user_id, snapshot.graded_at if snapshot else None,
+                date_for, slots, max_days):
+            to_grade.append(ce)
+        else:
+            lcg_writer.carry_forward(
+                date_for=date_for,
+                learner_course_grades=snapshot)
+            strata[stratum][2].append(snapshot.progress_percent)
+
+    try:
+        for ce, result in grade_learners(course_id, date_for, to_grade, lcg_writer):
+            if result.error:
+                stats.error_count += 1
+                # Use what we had, so the errors do not drag the estimate down
+                snapshot = snapshots.get(ce.user_id)
+                if snapshot:
+                    strata[stratum_for[ce.id]][2].append(snapshot.progress_percent)
+            else:
+                stats.learners_graded += 1
+                strata[stratum_for[ce.id]][1].append(result.progress_percent)
+    except Exception as e:
+        log_course_grades_error(course_id, e)
+        lcg_writer.flush()
+        stats.error_count += 1
+        return figures.pipeline.sampling.ProgressEstimate(0.0, None, None, 0)
+
+    lcg_writer.flush()
+    stats.learners_processed += population
+    return figures.pipeline.sampling.stratified_estimate(
+        dict((key, tuple(value)) for key, value in strata.items()))
+
+
+def get_days_to_complete(course_id, date_for, since=None):
     """Return a dict with a list of days to complete and errors
 
     NOTE: This is a work in progress, as it has issues to resolve:
@@ -124,37 +455,47 @@ def get_days_to_complete(course_id, date_for):
     * This means if a learner starts at midnight and finished just before
       midnight, then 0 days will be given
 
-    NOTE: This has limited scaling. We ought to test it with
-    1k, 10k, 100k cert records
+    We get the certificate date and enrollment date pairs in a single query
+    by joining certificates to the learner's enrollment in the same course.
+    Certificates for learners with no enrollment in the course are skipped.
+    If a learner has more than one enrollment record for the course, we
+    record an error and use the earliest enrollment
 
-    TODO: change to use start_date, end_date with defaults that
-    start_date is open and end_date is today
+    Certificates created through the end of ``date_for`` are included. If
+    ``since`` is given, only certificates created on or after ``since`` are
+    included
 
     TODO: Consider collecting the total seconds rather than days
     This will improve accuracy, but may actually not be that important
     TODO: Analyze the error based on number of completions
-
-    When we have to support scale, we can look into optimization
-    techinques.
     """
+    course_key = as_course_key(course_id)
     certificates = GeneratedCertificate.objects.filter(
-        course_id=as_course_key(course_id),
-        created_date__lte=as_datetime(date_for))
+        course_id=course_key,
+        created_date__lt=as_datetime(next_day(date_for)),
+        user__courseenrollment__course_id=course_key,
+    )
+    if since:
+        certificates = certificates.filter(created_date__gte=as_datetime(since))
+    pairs = certificates.order_by(
+        'created_date', 'user_id', 'user__courseenrollment__created',
+    ).values_list('user_id', 'created_date', 'user__courseenrollment__created')
 
     days = []
     errors = []
-    for cert in certificates:
-        ce = CourseEnrollment.objects.filter(
-            course_id=as_course_key(course_id),
-            user=cert.user)
-        # How do we want to handle multiples?
-        if ce.count() > 1:
-            errors.append(
-                dict(msg='Multiple CE records',
-                     course_id=course_id,
-                     user_id=cert.user.id,
-                     ))
-        days.append((cert.created_date - ce[0].created).days)
+    last_user_id = None
+    for user_id, cert_created, enrollment_created in pairs.iterator():
+        # Rows for the same certificate are adjacent because of the ordering
+        if user_id == last_user_id:
+            if not errors or errors[-1]['user_id'] != user_id:
+                errors.append(
+                    dict(msg='Multiple CE records',
+                         course_id=course_id,
+                         user_id=user_id,
+                         ))
+            continue
+        last_user_id = user_id
+        days.append((cert_created - enrollment_created).days)
     return dict(days=days, errors=errors)
 
 
@@ -166,6 +507,144 @@ def calc_average_days_to_complete(days):
         return 0.0
 
 
+def count_days(days, day_counts=None):
+    """Returns a dict of the number of times each value occurs in ``days``
+
+    If ``day_counts`` is given, the values are added to a copy of it. This is
+    how we merge days to complete distributions
+    """
+    counts = defaultdict(int)
+    if day_counts:
+        counts.update(day_counts)
+    for day in days:
+        counts[day] += 1
+    return dict(counts)
+
+
+def calc_percentile(day_counts, percent):
+    """Returns the nearest-rank percentile from a dict of day counts
+
+    Returns None if there are no days
+    """
+    total = sum(day_counts.values())
+    if not total:
+        return None
+    rank = max(int(math.ceil(percent / 100.0 * total)), 1)
+    seen = 0
+    for day in sorted(day_counts):
+        seen += day_counts[day]
+        if seen >= rank:
+            return day
+
+
+def calc_day_counts_histogram(day_counts):
+    """Counts the day counts in the ``DAYS_TO_COMPLETE_HISTOGRAM_BINS``
+
+    Each bin counts the values from its lower bound up to, but not including,
+    the next bin's lower bound. The last bin is open ended. Negative values
+    are counted in the first bin
+    """
+    bins = DAYS_TO_COMPLETE_HISTOGRAM_BINS
+    counts = [0] * len(bins)
+    for day, count in day_counts.items():
+        counts[max(bisect.bisect_right(bins, day) - 1, 0)] += count
+    return dict(bins=list(bins), counts=counts)
+
+
+def calc_days_to_complete_histogram(days):
+    return calc_day_counts_histogram(count_days(days))
+
+
+def calc_day_counts_stats(day_counts):
+    """Returns the distribution statistics we store for days to complete
+    from a dict of day counts
+
+    The cost depends on the number of distinct days, not the number of
+    certificates
+    """
+    total = sum(day_counts.values())
+    if total:
+        average = float(sum(
+            day * count for day, count in day_counts.items())) / float(total)
+    else:
+        average = 0.0
+    return dict(
+        average=average,
+        median=calc_percentile(day_counts, 50),
+        p90=calc_percentile(day_counts, 90),
+        histogram=calc_day_counts_histogram(day_counts),
+    )
+
+
+def calc_days_to_complete_stats(days):
+    """Returns the distribution statistics we store for days to complete
+    """
+    return calc_day_counts_stats(count_days(days))
+
+
+def aggregate_day_counts(aggregate):
+    """Returns the ``CourseDaysToCompleteAggregate.day_counts`` with int keys
+    """
+    return dict((int(day), count) for day, count in aggregate.day_counts.items())
+
+
+def set_days_to_complete_aggregate(aggregate, date_for, day_counts, save=True):
+    aggregate.date_for = date_for
+    aggregate.certificate_count = sum(day_counts.values())
+    aggregate.days_sum = sum(day * count for day, count in day_counts.items())
+    aggregate.day_counts = day_counts
+    if save:
+        aggregate.save()
+    return aggregate
+
+
+def update_days_to_complete_aggregate(course_id, date_for, rebuild=False):
+    """Returns the course's ``CourseDaysToCompleteAggregate`` through
+    ``date_for``
+
+    If the course has an aggregate for an earlier date, only the certificates
+    created after that date are read and added to it. This is the daily case
+    and its cost depends on the number of new certificates, not the age of the
+    course. If the aggregate is already for ``date_for`` it is returned as is.
+
+    Otherwise all the course's certificates through ``date_for`` are read.
+    This happens for the first run for a course and when ``rebuild`` is True.
+    When we are asked for a date earlier than the stored aggregate, as when
+    backfilling, the result is not saved so the aggregate is not moved back
+    """
+    course_id = str(course_id)
+    aggregate = CourseDaysToCompleteAggregate.objects.filter(
+        course_id=course_id).first()
+
+    if aggregate and not rebuild:
+        if aggregate.date_for == date_for:
+            return aggregate
+        elif aggregate.date_for < date_for:
+            new_days = get_days_to_complete(
+                course_id, date_for, since=next_day(aggregate.date_for))['days']
+            return set_days_to_complete_aggregate(
+                aggregate, date_for,
+                count_days(new_days, aggregate_day_counts(aggregate)))
+        else:
+            days = get_days_to_complete(course_id, date_for)['days']
+            return set_days_to_complete_aggregate(
+                CourseDaysToCompleteAggregate(course_id=course_id),
+                date_for, count_days(days), save=False)
+
+    days = get_days_to_complete(course_id, date_for)['days']
+    return set_days_to_complete_aggregate(
+        aggregate or CourseDaysToCompleteAggregate(course_id=course_id),
+        date_for, count_days(days))
+
+
+def get_days_to_complete_stats(course_id, date_for):
+    """Returns the days to complete statistics through ``date_for`` from the
+    course's running days to complete aggregate
+    """
+    aggregate = update_days_to_complete_aggregate(course_id, date_for)
+    return calc_day_counts_stats(aggregate_day_counts(aggregate))
+
+
 def get_average_days_to_complete(course_id, date_for):
 
     days_to_complete = get_days_to_complete(course_id, date_for)
@@ -218,6 +697,27 @@ class CourseDailyMetricsExtractor(object):
                 average_days_to_complete=data.get('average_days_to_complete, None'),
                 num_learners_completed=data['num_learners_completed'],
             )
+
+        Optional kwargs:
+
+        ``incremental``: only regrade learners with new courseware activity.
+        See ``get_average_progress``
+
+        ``course_counts``: a dict of counts already computed for the course by
+        the site-wide extractors in ``figures.pipeline.site_extractors``.
+        Counts that are not in the dict are queried for the course
+
+        ``stats``: a ``figures.pipeline.instrumentation.PipelineStats`` to
+        record the extraction stages in. Each stage is also emitted as a span
+        tagged with the course id and date
+
+        ``partial`` is True in the returned data if grading ran out of its
+        time budget. See ``get_average_progress``
+
+        Courses with at least
+        ``figures.settings.sampled_progress_min_enrollments()`` learners have
+        their average progress estimated from a sample, with its confidence
+        interval. See ``get_sampled_average_progress``
         """
 
         # Update args if not assigned
@@ -240,21 +740,52 @@ class CourseDailyMetricsExtractor(object):
         # After we get this working, we can then define them declaratively
         # we can do a lambda for course_enrollments to get the count
 
-        data['enrollment_count'] = course_enrollments.count()
-        active_learner_ids_today = get_active_learner_ids_today(
-            course_id, date_for,)
-        if active_learner_ids_today:
-            active_learners_today = active_learner_ids_today.count()
-        else:
-            active_learners_today = 0
-
-        data['active_learners_today'] = active_learners_today
-        data['average_progress'] = get_average_progress(
-            course_id, date_for, course_enrollments,)
-        data['average_days_to_complete'] = get_average_days_to_complete(
-            course_id, date_for,)
-        data['num_learners_completed'] = get_num_learners_completed(
-            course_id, date_for,)
+        course_counts = kwargs.get('course_counts') or {}
+        stats = kwargs.get('stats') or PipelineStats()
+
+        tags = dict(extractor='course_daily_metrics',
+                    course_id=str(course_id), date_for=date_for)
+
+        with stats.stage('enrollment_count', **tags):
+            if 'enrollment_count' in course_counts:
+                data['enrollment_count'] = course_counts['enrollment_count']
+            else:
+                data['enrollment_count'] = get_learner_enrollment_count(
+                    course_id, date_for)
+        with stats.stage('active_learners_today', **tags):
+            if 'active_learners_today' in course_counts:
+                data['active_learners_today'] = course_counts['active_learners_today']
+            else:
+                data['active_learners_today'] = get_active_learner_ids_today(
+                    course_id, date_for,).count()
+        with stats.stage('num_learners_completed', **tags):
+            if 'num_learners_completed' in course_counts:
+                data['num_learners_completed'] = course_counts['num_learners_completed']
+            else:
+                data['num_learners_completed'] = get_num_learners_completed(
+                    course_id, date_for,)
+        with stats.stage('grades', **tags):
+            if use_sampled_progress(data['enrollment_count']):
+                estimate = get_sampled_average_progress(
+                    course_id, date_for, course_enrollments.select_related('user'),
+                    stats=stats)
+                data['average_progress'] = estimate.average
+                data['average_progress_lower'] = estimate.lower
+                data['average_progress_upper'] = estimate.upper
+                data['progress_sample_size'] = estimate.sample_size
+            else:
+                data['average_progress'] = get_average_progress(
+                    course_id, date_for, course_enrollments.select_related('user'),
+                    incremental=kwargs.get('incremental', settings.incremental_grades()),
+                    stats=stats)
+        data['partial'] = stats.partial
+        data['learners_graded'] = stats.learners_graded
+        with stats.stage('days_to_complete', **tags):
+            days_to_complete_stats = get_days_to_complete_stats(course_id, date_for)
+        data['average_days_to_complete'] = days_to_complete_stats['average']
+        data['days_to_complete_median'] = days_to_complete_stats['median']
+        data['days_to_complete_p90'] = days_to_complete_stats['p90']
+        data['days_to_complete_histogram'] = days_to_complete_stats['histogram']
 
         return data
 
@@ -265,10 +796,11 @@ class CourseDailyMetricsLoader(object):
         self.course_id = course_id
         self.extractor = CourseDailyMetricsExtractor()
 
-    def get_data(self, date_for):
+    def get_data(self, date_for, **kwargs):
         return self.extractor.extract(
             course_id=self.course_id,
-            date_for=date_for)
+            date_for=date_for,
+            **kwargs)
 
     def load(self, date_for=None, force_update=False, **kwargs):
         """
@@ -284,29 +816,53 @@ class CourseDailyMetricsLoader(object):
                 datetime.datetime.utcnow().replace(tzinfo=utc).date()
             )
 
-        # if we already have a record for the date_for and force_update is False
-        # then skip getting data
-        if not force_update:
-            try:
-                cdm = CourseDailyMetrics.objects.get(
-                    course_id=self.course_id,
-                    date_for=date_for)
-                return (cdm, False,)
-
-            except CourseDailyMetrics.DoesNotExist:
-                # proceed normally
-                pass
-
-        data = self.get_data(date_for=date_for)
-        cdm, created = CourseDailyMetrics.objects.update_or_create(
+        # If we already have a record for the date_for and force_update is
+        # False then skip getting data. Otherwise we write the row directly,
+        # so there is at most one read and one write per course
+        cdm = CourseDailyMetrics.objects.filter(
             course_id=self.course_id,
-            date_for=date_for,
-            defaults=dict(
-                enrollment_count=data['enrollment_count'],
-                active_learners_today=data['active_learners_today'],
-                average_progress=data['average_progress'],
-                average_days_to_complete=data['average_days_to_complete'],
-                num_learners_completed=data['num_learners_completed'],
-            )
+            date_for=date_for).first()
+        if cdm and not force_update:
+            return (cdm, False,)
+
+        # Errors for the course are written in a row per kind at the end
+        with buffered_errors():
+            data = self.get_data(date_for=date_for, **kwargs)
+        stats = kwargs.get('stats') or PipelineStats()
+        with stats.stage('load', extractor='course_daily_metrics',
+                         course_id=str(self.course_id), date_for=date_for):
+            result = self.save(cdm, date_for, data)
+            figures.pipeline.monthly_metrics.update_course_monthly_metrics(
+                date_for, course_ids=[self.course_id])
+            bump_data_version(date_for)
+            return result
+
+    def save(self, cdm, date_for, data):
+        """Writes the extracted data to ``cdm``, or to a new record if ``cdm``
+        is None
+        """
+        values = dict(
+            enrollment_count=data['enrollment_count'],
+            active_learners_today=data['active_learners_today'],
+            average_progress=data['average_progress'],
+            average_days_to_complete=data['average_days_to_complete'],
+            num_learners_completed=data['num_learners_completed'],
+            days_to_complete_median=data['days_to_complete_median'],
+            days_to_complete_p90=data['days_to_complete_p90'],
+            days_to_complete_histogram=data['days_to_complete_histogram'],
+            partial=data.get('partial', False),
+            learners_graded=data.get('learners_graded'),
+            average_progress_lower=data.get('average_progress_lower'),
+            average_progress_upper=data.get('average_progress_upper'),
+            progress_sample_size=data.get('progress_sample_size'),
         )
-        return (cdm, created,)
+        if cdm:
+            for key, value in values.items():
+                setattr(cdm, key, value)
+            cdm.save()
+            return (cdm, False,)
+        cdm = CourseDailyMetrics.objects.create(
+            course_id=self.course_id,
+            date_for=date_for,
+            **values)
+        return (cdm, True,)
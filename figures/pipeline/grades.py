@@ -0,0 +1,153 @@
+'''Computes learner grades for the course daily metrics grades pass
+
+Grading is done either in the current process or fanned out to a pool of
+worker processes. Either way, grading yields compact ``GradeResult`` tuples
+and the caller does the ``LearnerCourseGradeMetrics`` writes and averaging.
+This keeps all the pipeline writes in the parent process.
+
+The pool is used when ``figures.settings.grades_worker_count()`` is greater
+than one and there are more learners to grade than
+``figures.settings.grades_chunk_size()``. Each worker grades a chunk of
+enrollment ids against its own ``CourseGradingSession``, so the course is
+loaded once per chunk instead of once per learner.
+
+Worker processes are forked from the current process, which may already
+have used the modulestore, for example to grade an earlier course. Database
+connections are closed before the pool is created, and each worker starts
+by dropping the modulestore it inherited, see ``init_grades_worker``. So
+each worker opens its own database and Mongo connections rather than
+sharing the parent's sockets.
+'''
+
+from collections import namedtuple
+import multiprocessing
+
+from django.db import connections
+
+from student.models import CourseEnrollment
+from xmodule.modulestore.django import clear_existing_modulestores
+
+from figures import settings
+import figures.metrics
+
+
+GradeResult = namedtuple('GradeResult', [
+    'enrollment_id',
+    'progress_percent',
+    'points_possible',
+    'points_earned',
+    'sections_worked',
+    'count',
+    'error',
+    'error_class',
+])
+
+
+def grade_result(course_enrollment, course_progress=None, error=None,
+                 error_class=None):
+    '''Builds a ``GradeResult`` from ``LearnerCourseGrades.course_progress``
+    output or from an error message and the exception's class name
+    '''
+    if error:
+        return GradeResult(course_enrollment.id, 0.0, None, None, None, None,
+                           error, error_class)
+    details = course_progress['course_progress_details']
+    return GradeResult(
+        enrollment_id=course_enrollment.id,
+        progress_percent=course_progress['progress_percent'],
+        points_possible=details['points_possible'],
+        points_earned=details['points_earned'],
+        sections_worked=details['sections_worked'],
+        count=details['count'],
+        error=None,
+        error_class=None)
+
+
+def course_progress_details(result):
+    '''Returns the ``course_progress_details`` dict for a ``GradeResult``
+    '''
+    return dict(
+        points_possible=result.points_possible,
+        points_earned=result.points_earned,
+        sections_worked=result.sections_worked,
+        count=result.count)
+
+
+def grade_enrollments(grading_session, course_enrollments):
+    '''Grades the course enrollments in the current process
+
+    Yields a ``GradeResult`` for each enrollment
+    '''
+    for ce in course_enrollments:
+        try:
+            yield grade_result(ce, grading_session.course_progress(ce))
+        except Exception as e:
+            yield grade_result(ce, error=str(e), error_class=type(e).__name__)
+
+
+def grade_enrollment_chunk(args):
+    '''Worker function. Grades a chunk of enrollments for one course
+
+    ``args`` is a ``(course_id, enrollment_ids)`` tuple. Returns a list of
+    ``GradeResult`` tuples. Raises if the course cannot be loaded
+    '''
+    course_id, enrollment_ids = args
+    grading_session = figures.metrics.CourseGradingSession(course_id)
+    course_enrollments = CourseEnrollment.objects.filter(
+        id__in=enrollment_ids).select_related('user')
+    return list(grade_enrollments(grading_session, course_enrollments))
+
+
+def init_grades_worker():
+    '''Pool initializer. Makes the worker open its own connections
+
+    The parent's database connections were closed before the fork, so this
+    only makes sure none is left open. The modulestore is dropped, not
+    closed, so the worker creates its own on first use. Closing the
+    inherited Mongo client would end the parent's sessions on the sockets
+    the worker shares with it
+    '''
+    connections.close_all()
+    clear_existing_modulestores()
+
+
+def get_grades_pool(worker_count):
+    '''Returns a process pool for grading
+
+    Closes the database connections first so the forked workers do not share
+    them. The parent reconnects on its next query. Each worker is initialized
+    with ``init_grades_worker``
+    '''
+    connections.close_all()
+    return multiprocessing.Pool(processes=worker_count,
+                                initializer=init_grades_worker)
+
+
+def use_grades_pool(learner_count):
+    return (settings.grades_worker_count() > 1 and
+            learner_count > settings.grades_chunk_size())
+
+
+def grade_enrollments_in_pool(course_id, course_enrollments):
+    '''Fans the course enrollments out to a pool of worker processes
+
+    Yields a ``GradeResult`` for each enrollment as the chunks complete
+    '''
+    chunk_size = settings.grades_chunk_size()
+    enrollment_ids = [ce.id for ce in course_enrollments]
+    chunks = [
+        (str(course_id), enrollment_ids[i:i + chunk_size])
+        for i in range(0, len(enrollment_ids), chunk_size)]
+
+    pool = get_grades_pool(settings.grades_worker_count())
+    try:
+        for results in pool.imap_unordered(grade_enrollment_chunk, chunks):
+            for result in results:
+                yield result
+    except BaseException:
+        pool.terminate()
+        raise
+    else:
+        pool.close()
+    finally:
+        pool.join()
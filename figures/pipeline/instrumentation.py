@@ -0,0 +1,260 @@
+'''Timing and query counting for the Figures pipeline
+
+``PipelineStats`` collects what the run ledger records for a course or a site
+metrics run: the duration of each stage, the number of database queries, the
+number of learners processed, the number of errors and whether the course's
+grades are partial. Pipeline functions
+take an optional ``stats`` argument and record into it::
+
+    stats = PipelineStats()
+    with stats.stage('grades'):
+        ...
+    stats.learners_processed += len(course_enrollments)
+
+Each stage is also emitted as a span, a dict with the stage's wall time,
+query count and tags such as the course id, to the span sinks. Sinks have an
+``emit(span)`` method. ``MemorySpanSink`` keeps the spans in a list for
+tests and ``JSONLinesSpanSink`` appends them to a file. Set
+``PIPELINE_SPAN_LOG`` to a file path to write the spans there, or add a sink
+with ``add_span_sink``::
+
+    with span_sink(MemorySpanSink()) as sink:
+        CourseDailyMetricsLoader(course_id).load(date_for=date_for)
+    for span in sink.spans:
+        print(span['name'], span['duration'], span['query_count'])
+
+Queries are counted by wrapping the database connection's cursors while a
+``count_queries`` block is active. Blocks can be nested, each counts all the
+queries made inside it. Django 1.8 does not have ``execute_wrapper``, so we
+replace the connection's cursor factories for the duration of the outermost
+block. Connections are per thread, so blocks only count the queries made in
+their own thread.
+'''
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import json
+import logging
+import threading
+import time
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.backends import utils as backend_utils
+
+from figures import settings
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCounter(object):
+    def __init__(self):
+        self.count = 0
+
+
+class CountingCursorMixin(object):
+    '''Adds to the active ``QueryCounter`` objects for each statement
+    '''
+    def _count(self):
+        for counter in self.counters:
+            counter.count += 1
+
+    def execute(self, sql, params=None):
+        self._count()
+        return super(CountingCursorMixin, self).execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        self._count()
+        return super(CountingCursorMixin, self).executemany(sql, param_list)
+
+
+class CountingCursorWrapper(CountingCursorMixin, backend_utils.CursorWrapper):
+    pass
+
+
+class CountingDebugCursorWrapper(CountingCursorMixin,
+                                 backend_utils.CursorDebugWrapper):
+    pass
+
+
+# Active counters by database alias. Django's connections are per thread, so
+# the counters are too
+_local = threading.local()
+
+
+def _active_counters():
+    if not hasattr(_local, 'counters'):
+        _local.counters = {}
+    return _local.counters
+
+
+def _install(connection, counters):
+    def make_cursor(cursor):
+        wrapper = CountingCursorWrapper(cursor, connection)
+        wrapper.counters = counters
+        return wrapper
+
+    def make_debug_cursor(cursor):
+        wrapper = CountingDebugCursorWrapper(cursor, connection)
+        wrapper.counters = counters
+        return wrapper
+
+    connection.make_cursor = make_cursor
+    connection.make_debug_cursor = make_debug_cursor
+
+
+def _uninstall(connection):
+    # Remove the instance attributes so the class methods are used again
+    del connection.make_cursor
+    del connection.make_debug_cursor
+
+
+@contextmanager
+def count_queries(using=DEFAULT_DB_ALIAS):
+    '''Counts the queries made on the database connection inside the block
+
+    Yields a ``QueryCounter``. Its ``count`` is final when the block exits
+    '''
+    counter = QueryCounter()
+    connection = connections[using]
+    active_counters = _active_counters()
+    counters = active_counters.get(using)
+    outermost = counters is None
+    if outermost:
+        counters = active_counters[using] = []
+        _install(connection, counters)
+    counters.append(counter)
+    try:
+        yield counter
+    finally:
+        counters.remove(counter)
+        if outermost:
+            _uninstall(connection)
+            del active_counters[using]
+
+
+class MemorySpanSink(object):
+    '''Keeps the spans in a list. For tests
+    '''
+    def __init__(self):
+        self.spans = []
+
+    def emit(self, span):
+        self.spans.append(span)
+
+
+class JSONLinesSpanSink(object):
+    '''Appends each span to a file as a line of JSON
+    '''
+    def __init__(self, path):
+        self.path = path
+
+    def emit(self, span):
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(span, sort_keys=True, cls=DjangoJSONEncoder) + '\n')
+
+
+_span_sinks = []
+
+
+def add_span_sink(sink):
+    _span_sinks.append(sink)
+
+
+def remove_span_sink(sink):
+    _span_sinks.remove(sink)
+
+
+@contextmanager
+def span_sink(sink):
+    '''Adds the sink for the duration of the block. Yields the sink
+    '''
+    add_span_sink(sink)
+    try:
+        yield sink
+    finally:
+        remove_span_sink(sink)
+
+
+def get_span_sinks():
+    '''Returns the sinks added with ``add_span_sink``, and a
+    ``JSONLinesSpanSink`` for ``figures.settings.pipeline_span_log()`` if it
+    is set
+    '''
+    sinks = list(_span_sinks)
+    path = settings.pipeline_span_log()
+    if path:
+        sinks.append(JSONLinesSpanSink(path))
+    return sinks
+
+
+def emit_span(record):
+    for sink in get_span_sinks():
+        try:
+            sink.emit(record)
+        except Exception:
+            # Instrumentation must not break the pipeline
+            logger.exception('Unable to emit span to {}'.format(sink))
+
+
+@contextmanager
+def span(name, **tags):
+    '''Times the block and counts its queries, then emits a span record to
+    the span sinks
+
+    The record is a dict with the ``tags`` and the ``name``, ``started``
+    timestamp, ``duration`` in seconds and ``query_count``. If the block
+    raises, the record has the exception class name in ``error``. Yields the
+    record so the block can add tags
+    '''
+    record = dict(tags, name=name, started=time.time())
+    with count_queries() as counter:
+        try:
+            yield record
+        except Exception as e:
+            record['error'] = type(e).__name__
+            raise
+        finally:
+            record['duration'] = time.time() - record['started']
+            record['query_count'] = counter.count
+            emit_span(record)
+
+
+class PipelineStats(object):
+    '''Collects stage durations, query counts, learners processed and errors
+    for a unit of pipeline work
+
+    ``learners_graded`` counts the learners graded exactly, rather than
+    carried forward. ``partial`` is set when grading ran out of its time
+    budget
+    '''
+    def __init__(self):
+        self.stage_durations = OrderedDict()
+        self.query_count = 0
+        self.learners_processed = 0
+        self.learners_graded = 0
+        self.error_count = 0
+        self.partial = False
+        self._depth = 0
+
+    @contextmanager
+    def stage(self, name, **tags):
+        '''Times the block and counts its queries. The stage is also emitted
+        as a span with the ``tags``. See ``span``
+
+        Durations for a stage name used more than once are added together.
+        Stages can be nested. Only the outermost stage is recorded in the
+        stats, so the durations and queries are not counted twice. The nested
+        stages are still emitted as spans
+        '''
+        outermost = self._depth == 0
+        self._depth += 1
+        try:
+            with span(name, **tags) as record:
+                yield record
+        finally:
+            self._depth -= 1
+            if outermost:
+                self.stage_durations[name] = (
+                    self.stage_durations.get(name, 0.0) + record['duration'])
+                self.query_count += record['query_count']
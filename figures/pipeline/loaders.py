@@ -2,7 +2,21 @@
 
 """
 
+from django.utils import timezone
+
 from figures.models import LearnerCourseGradeMetrics
+from figures.pipeline.bulk import BulkUpserter
+
+
+def learner_course_grades_values(course_progress_details):
+    """Maps ``course_progress_details`` to ``LearnerCourseGradeMetrics`` fields
+    """
+    return dict(
+        points_possible=course_progress_details['points_possible'],
+        points_earned=course_progress_details['points_earned'],
+        sections_worked=course_progress_details['sections_worked'],
+        sections_possible=course_progress_details['count']
+        )
 
 
 def save_learner_course_grades(date_for, course_enrollment, course_progress_details):
@@ -13,15 +27,61 @@ def save_learner_course_grades(date_for, course_enrollment, course_progress_deta
 
     """
     # details = course_progress['course_progress_details']
-    data = dict(
-        points_possible=course_progress_details['points_possible'],
-        points_earned=course_progress_details['points_earned'],
-        sections_worked=course_progress_details['sections_worked'],
-        sections_possible=course_progress_details['count']
-        )
+    data = learner_course_grades_values(course_progress_details)
+    data['graded_at'] = timezone.now()
     obj, created = LearnerCourseGradeMetrics.objects.update_or_create(
         user=course_enrollment.user,
         course_id=str(course_enrollment.course_id),
         date_for=date_for,
         defaults=data)
     return obj, created
+
+
+class LearnerCourseGradesWriter(BulkUpserter):
+    """Buffers ``LearnerCourseGradeMetrics`` rows and writes them in bulk
+
+    This is the bulk counterpart to ``save_learner_course_grades`` for the
+    grades pass, where we write a row for every enrollment in a course
+    """
+    def __init__(self, **kwargs):
+        super(LearnerCourseGradesWriter, self).__init__(
+            LearnerCourseGradeMetrics, **kwargs)
+
+    def add_course_progress(self, date_for, course_enrollment,
+                            course_progress_details, graded_at=None):
+        """Adds a row for grades just computed
+
+        ``graded_at`` is when the grades were computed. It defaults to now.
+        Pass the time grading started if the grades may have been read
+        earlier, so activity during grading is not taken as graded
+        """
+        self.add(
+            user_id=course_enrollment.user_id,
+            course_id=str(course_enrollment.course_id),
+            date_for=date_for,
+            graded_at=graded_at or timezone.now(),
+            **learner_course_grades_values(course_progress_details))
+
+    def carry_forward(self, date_for, learner_course_grades):
+        """Copies a previous ``LearnerCourseGradeMetrics`` snapshot to
+        ``date_for``
+
+        Used by the incremental grades pass for learners who have had no
+        courseware activity since the snapshot was taken, and for the learners
+        not graded when grading runs out of its time budget. Nothing is written
+        if the snapshot is already for ``date_for``
+
+        The copy keeps the snapshot's ``graded_at``, so the learner's activity
+        since then still shows as not graded
+        """
+        if learner_course_grades.date_for == date_for:
+            return
+        self.add(
+            user_id=learner_course_grades.user_id,
+            course_id=learner_course_grades.course_id,
+            date_for=date_for,
+            points_possible=learner_course_grades.points_possible,
+            points_earned=learner_course_grades.points_earned,
+            sections_worked=learner_course_grades.sections_worked,
+            sections_possible=learner_course_grades.sections_possible,
+            graded_at=learner_course_grades.graded_at)
@@ -2,10 +2,27 @@
 
 Initial focus is on tracking exceptions for Course
 
+Errors can be buffered. Inside a ``buffered_errors`` block, ``log_error``
+adds each error to a ``PipelineErrorBuffer`` instead of writing it right
+away. The buffer groups the errors by their fingerprint: the error type, the
+course and the exception class. Only the first error of each group is
+logged when it happens. When the block exits, each group is written as a
+single ``PipelineError`` row with its count and a few sample users, and the
+groups with repeats are logged with their counts. So a bad day for the
+modulestore writes a row per course instead of a row per learner::
+
+    with buffered_errors():
+        for ce in course_enrollments:
+            ...
+            log_error(error_data, error_type=PipelineError.GRADES_DATA, ...)
+
 '''
 
+from collections import OrderedDict
+from contextlib import contextmanager
 import logging
 import json
+import threading
 
 from django.core.serializers.json import DjangoJSONEncoder
 
@@ -14,8 +31,18 @@ from figures import settings
 
 logger = logging.getLogger(__name__)
 
+# Number of users kept with each group of buffered errors
+MAX_SAMPLE_USERS = 5
 
-def log_error(error_data, error_type=None, **kwargs):
+_local = threading.local()
+
+
+def log_to_db(**kwargs):
+    return (settings.log_pipeline_errors_to_db() or
+            kwargs.get('log_pipeline_errors_to_db', False))
+
+
+def log_error_data(error_data):
     logger.error(json.dumps(
         error_data,
         sort_keys=True,
@@ -23,13 +50,117 @@ def log_error(error_data, error_type=None, **kwargs):
         cls=DjangoJSONEncoder
     ))
 
-    if settings.log_pipeline_errors_to_db() or kwargs.get('log_pipeline_errors_to_db', False):
-        data = dict(
-            error_data=error_data,
-            error_type=error_type or PipelineError.UNSPECIFIED_DATA,
-            )
-        if 'user' in kwargs:
-            data.update(user=kwargs['user'])
-        if 'course_id' in kwargs:
-            data.update(course_id=str(kwargs['course_id']))
-        PipelineError.objects.create(**data)
+
+def pipeline_error(error_data, error_type=None, **kwargs):
+    '''Returns an unsaved ``PipelineError`` for the ``log_error`` arguments
+    '''
+    data = dict(
+        error_data=error_data,
+        error_type=error_type or PipelineError.UNSPECIFIED_DATA,
+        )
+    if 'user' in kwargs:
+        data.update(user=kwargs['user'])
+    if 'course_id' in kwargs:
+        data.update(course_id=str(kwargs['course_id']))
+    return PipelineError(**data)
+
+
+def log_error(error_data, error_type=None, **kwargs):
+    buffer = getattr(_local, 'buffer', None)
+    if buffer is not None:
+        buffer.add(error_data, error_type, **kwargs)
+        return
+
+    log_error_data(error_data)
+    if log_to_db(**kwargs):
+        pipeline_error(error_data, error_type, **kwargs).save()
+
+
+class ErrorGroup(object):
+    '''The errors in a ``PipelineErrorBuffer`` with the same fingerprint
+    '''
+    def __init__(self, error_data, error_type, kwargs):
+        self.error_data = error_data
+        self.error_type = error_type
+        self.kwargs = kwargs
+        self.count = 0
+        self.sample_users = []
+
+    def add(self, user=None):
+        self.count += 1
+        if user is not None and len(self.sample_users) < MAX_SAMPLE_USERS:
+            self.sample_users.append(getattr(user, 'username', user))
+
+
+class PipelineErrorBuffer(object):
+    '''Groups pipeline errors by fingerprint and writes a row per group
+    '''
+    def __init__(self):
+        self.groups = OrderedDict()
+
+    @staticmethod
+    def fingerprint(error_data, error_type=None, **kwargs):
+        '''Returns the error type, course id and exception class of the
+        error. Errors with no exception class are told apart by message
+        '''
+        error_data = error_data if isinstance(error_data, dict) else {}
+        course_id = kwargs.get('course_id', error_data.get('course_id'))
+        return (
+            error_type or PipelineError.UNSPECIFIED_DATA,
+            str(course_id) if course_id else '',
+            error_data.get('exception_class') or error_data.get('msg'),
+        )
+
+    def add(self, error_data, error_type=None, **kwargs):
+        key = self.fingerprint(error_data, error_type, **kwargs)
+        group = self.groups.get(key)
+        if group is None:
+            group = self.groups[key] = ErrorGroup(error_data, error_type, kwargs)
+            log_error_data(error_data)
+        group.add(kwargs.get('user'))
+
+    def flush(self):
+        '''Writes a ``PipelineError`` for each group with ``bulk_create``
+
+        Each row has the first error's data and user, with the group's
+        ``count`` and ``sample_users`` added to the error data. Groups with
+        more than one error are logged with their count
+        '''
+        groups, self.groups = list(self.groups.values()), OrderedDict()
+        errors = []
+        for group in groups:
+            if group.count > 1:
+                logger.error('{} more like the above. error_type={}, course_id={}'.format(
+                    group.count - 1, group.error_type,
+                    group.kwargs.get('course_id', '')))
+            if not log_to_db(**group.kwargs):
+                continue
+            error_data = group.error_data
+            if isinstance(error_data, dict):
+                error_data = dict(error_data,
+                                  count=group.count,
+                                  sample_users=group.sample_users)
+            errors.append(pipeline_error(error_data, group.error_type, **group.kwargs))
+        if errors:
+            PipelineError.objects.bulk_create(errors)
+        return len(errors)
+
+
+@contextmanager
+def buffered_errors():
+    '''Buffers the ``log_error`` calls in the block and flushes them when it
+    exits
+
+    Blocks can be nested. The errors are flushed when the outermost block
+    exits. Yields the ``PipelineErrorBuffer``
+    '''
+    buffer = getattr(_local, 'buffer', None)
+    if buffer is not None:
+        yield buffer
+        return
+    buffer = _local.buffer = PipelineErrorBuffer()
+    try:
+        yield buffer
+    finally:
+        _local.buffer = None
+        buffer.flush()
@@ -0,0 +1,122 @@
+'''Maintains the monthly metrics rollups
+
+The site and course history endpoints show a value for each of the last few
+months. Computing each value from the daily metrics costs an aggregate query
+per metric and month. Instead, whenever the pipeline writes daily metrics for
+a day, it rolls up the day's month into ``SiteMonthlyMetrics`` and
+``CourseMonthlyMetrics``, and the endpoints read each series from the rollups.
+
+A month is rolled up with one aggregate query over its daily records, so
+rewriting a day, for example with ``force_update``, leaves the month's values
+the same as if they were computed from scratch. The values are computed the
+same way as the ``figures.metrics`` metrics.
+'''
+
+import calendar
+import datetime
+
+from django.db.models import Avg, Max
+
+from figures.helpers import as_date, previous_months_iterator
+from figures.metrics import (
+    COURSE_AVERAGE_DAYS_TO_COMPLETE,
+    COURSE_AVERAGE_PROGRESS,
+    get_active_users_for_time_period,
+)
+from figures.models import (
+    CourseDailyMetrics,
+    CourseMonthlyMetrics,
+    SiteDailyMetrics,
+    SiteMonthlyMetrics,
+)
+from figures.pipeline.bulk import BulkUpserter
+
+
+def month_bounds(date_for):
+    '''Returns the first and last days of the month of ``date_for``
+    '''
+    date_for = as_date(date_for)
+    last_day = calendar.monthrange(date_for.year, date_for.month)[1]
+    return date_for.replace(day=1), date_for.replace(day=last_day)
+
+
+def update_course_monthly_metrics(date_for, course_ids=None):
+    '''Rolls up the course daily metrics for the month of ``date_for``
+
+    Rolls up the ``course_ids``, or every course with daily metrics in the
+    month if not given. Returns the number of records written
+    '''
+    month_for, end_date = month_bounds(date_for)
+    qs = CourseDailyMetrics.objects.filter(
+        date_for__gte=month_for, date_for__lte=end_date)
+    if course_ids is not None:
+        qs = qs.filter(course_id__in=[str(course_id) for course_id in course_ids])
+    recs = qs.values('course_id').annotate(
+        enrollment_count=Max('enrollment_count'),
+        average_progress=Avg('average_progress'),
+        average_days_to_complete=Avg('average_days_to_complete'),
+        num_learners_completed=Max('num_learners_completed'),
+    ).order_by()
+
+    with BulkUpserter(CourseMonthlyMetrics) as writer:
+        for rec in recs:
+            writer.add(
+                course_id=rec['course_id'],
+                month_for=month_for,
+                enrollment_count=rec['enrollment_count'],
+                average_progress=COURSE_AVERAGE_PROGRESS.to_value(
+                    rec['average_progress']),
+                average_days_to_complete=COURSE_AVERAGE_DAYS_TO_COMPLETE.to_value(
+                    rec['average_days_to_complete']),
+                num_learners_completed=rec['num_learners_completed'],
+            )
+    return writer.rows_written
+
+
+def update_site_monthly_metrics(date_for):
+    '''Rolls up the site daily metrics for the month of ``date_for``
+
+    The active users are counted with the month's daily active users
+    sketches and the completions are from the course daily metrics, so write
+    those first. Returns the number of records written
+    '''
+    month_for, end_date = month_bounds(date_for)
+    site_values = SiteDailyMetrics.objects.filter(
+        date_for__gte=month_for, date_for__lte=end_date,
+    ).aggregate(
+        total_user_count=Max('total_user_count'),
+        course_count=Max('course_count'),
+        total_enrollment_count=Max('total_enrollment_count'),
+    )
+    num_learners_completed = CourseDailyMetrics.objects.filter(
+        date_for__gte=month_for, date_for__lte=end_date,
+    ).aggregate(maxval=Max('num_learners_completed'))['maxval']
+
+    with BulkUpserter(SiteMonthlyMetrics, unique_fields=('month_for',)) as writer:
+        writer.add(
+            month_for=month_for,
+            active_user_count=get_active_users_for_time_period(
+                start_date=month_for, end_date=end_date),
+            total_user_count=site_values['total_user_count'] or 0,
+            course_count=site_values['course_count'] or 0,
+            total_enrollment_count=site_values['total_enrollment_count'] or 0,
+            num_learners_completed=num_learners_completed or 0,
+        )
+    return writer.rows_written
+
+
+def update_monthly_metrics(start_date, end_date):
+    '''Rolls up every month from ``start_date`` through ``end_date``, for
+    the site and all courses
+
+    Returns a dict with the number of course and site records written
+    '''
+    results = dict(course_monthly_metrics=0, site_monthly_metrics=0)
+    months_back = ((end_date.year - start_date.year) * 12 +
+                   end_date.month - start_date.month)
+    last_month_for = month_bounds(end_date)[0]
+    for year, month, day in previous_months_iterator(last_month_for, months_back):
+        month_for = datetime.date(year, month, 1)
+        results['course_monthly_metrics'] += update_course_monthly_metrics(month_for)
+        results['site_monthly_metrics'] += update_site_monthly_metrics(month_for)
+    return results
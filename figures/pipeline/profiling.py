@@ -0,0 +1,164 @@
+'''Per course profiling for the daily metrics pipeline
+
+When a nightly run starts to take longer, we want to know which courses got
+slower and why. Inside a ``profiling`` block, ``run_course`` records each
+course's wall time, query count and learners processed in the active
+``PipelineProfiler``. With ``use_cprofile``, each course is also run under
+``cProfile``, and the profiles of the slowest courses can be dumped for
+``pstats``::
+
+    profiler = PipelineProfiler()
+    with profiling(profiler):
+        populate_daily_metrics(date_for=date_for, force_update=True)
+    profiler.write_report('/tmp/figures-report.json')
+
+The courses are profiled one at a time. ``cProfile`` can only have one
+profile enabled at a time, so the parallel pipeline is not supported.
+
+See the ``populate_figures_metrics`` management command's ``--profile`` and
+``--report`` options
+'''
+
+from collections import OrderedDict
+from contextlib import contextmanager
+import cProfile
+import json
+import os
+import re
+import threading
+import time
+
+from figures.pipeline.instrumentation import count_queries
+
+
+# Number of the slowest courses to dump profiles for
+DEFAULT_PROFILE_TOP = 5
+
+_local = threading.local()
+
+
+class CourseProfile(object):
+    '''What the profiler recorded for a course
+    '''
+    def __init__(self, course_id):
+        self.course_id = str(course_id)
+        self.duration = 0.0
+        self.query_count = 0
+        self.learners_processed = 0
+        self.stage_durations = {}
+        self.error = None
+        self.profile = None
+
+    def as_dict(self):
+        return OrderedDict([
+            ('course_id', self.course_id),
+            ('duration', self.duration),
+            ('query_count', self.query_count),
+            ('learners_processed', self.learners_processed),
+            ('seconds_per_learner', (self.duration / self.learners_processed
+                                     if self.learners_processed else None)),
+            ('stage_durations', self.stage_durations),
+            ('error', self.error),
+        ])
+
+
+class PipelineProfiler(object):
+    '''Collects a ``CourseProfile`` for each course the pipeline populates
+    '''
+    def __init__(self, use_cprofile=True):
+        self.use_cprofile = use_cprofile
+        self.courses = []
+
+    @contextmanager
+    def course(self, course_id, stats):
+        '''Profiles the block for the course. ``stats`` is the course's
+        ``figures.pipeline.instrumentation.PipelineStats``
+        '''
+        course = CourseProfile(course_id)
+        if self.use_cprofile:
+            course.profile = cProfile.Profile()
+        start = time.time()
+        with count_queries() as counter:
+            if course.profile:
+                course.profile.enable()
+            try:
+                yield course
+            except Exception as e:
+                course.error = type(e).__name__
+                raise
+            finally:
+                if course.profile:
+                    course.profile.disable()
+                course.duration = time.time() - start
+                course.query_count = counter.count
+                course.learners_processed = stats.learners_processed
+                course.stage_durations = dict(stats.stage_durations)
+                self.courses.append(course)
+
+    def ranked(self, key):
+        '''Returns the courses ordered by the ``CourseProfile`` attribute,
+        largest first
+        '''
+        return sorted(self.courses,
+                      key=lambda course: (-getattr(course, key), course.course_id))
+
+    def report(self):
+        '''Returns the totals and the courses ranked by duration, query count
+        and learners processed
+        '''
+        return OrderedDict([
+            ('course_count', len(self.courses)),
+            ('duration', sum(course.duration for course in self.courses)),
+            ('query_count', sum(course.query_count for course in self.courses)),
+            ('learners_processed', sum(
+                course.learners_processed for course in self.courses)),
+            ('courses', [course.as_dict() for course in self.ranked('duration')]),
+            ('rankings', OrderedDict(
+                (key, [course.course_id for course in self.ranked(key)])
+                for key in ['duration', 'query_count', 'learners_processed'])),
+        ])
+
+    def write_report(self, path, profile_top=DEFAULT_PROFILE_TOP, **extra):
+        '''Writes the report to ``path`` as JSON, with the ``extra`` items
+
+        The profiles of the ``profile_top`` slowest courses are dumped next to
+        the report, one ``pstats`` file per course. Their paths are in the
+        report's ``profiles``. Returns the report
+        '''
+        report = OrderedDict(extra)
+        report.update(self.report())
+        report['profiles'] = OrderedDict()
+        base = os.path.splitext(path)[0]
+        for course in self.ranked('duration')[:profile_top]:
+            if not course.profile:
+                continue
+            profile_path = '{}-{}.pstats'.format(
+                base, re.sub(r'[^\w.-]+', '_', course.course_id))
+            course.profile.dump_stats(profile_path)
+            report['profiles'][course.course_id] = profile_path
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+        return report
+
+
+@contextmanager
+def profiling(profiler):
+    '''Makes the profiler active for the block. Yields the profiler
+    '''
+    _local.profiler = profiler
+    try:
+        yield profiler
+    finally:
+        _local.profiler = None
+
+
+@contextmanager
+def profile_course(course_id, stats):
+    '''Profiles the block with the active profiler, if there is one
+    '''
+    profiler = getattr(_local, 'profiler', None)
+    if profiler is None:
+        yield None
+        return
+    with profiler.course(course_id, stats) as course:
+        yield course
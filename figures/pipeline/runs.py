@@ -0,0 +1,181 @@
+'''Database barrier for the parallel daily metrics pipeline
+
+A ``PipelineRun`` is created for each run with a ``PipelineCourseRun`` for
+each course. Course tasks update their course run as they go. When a course
+run finishes, complete or failed after its last attempt, the task checks
+whether every course run in the pipeline run has finished. The first task to
+see that claims the run with a conditional update and populates the site
+metrics. This replaces the celery chord callback, which never fires if a
+course task is lost.
+
+A run that does not finish on its own, because a worker died for example, is
+closed by ``fail_unfinished_course_runs``, which the pipeline schedules for
+after ``figures.settings.pipeline_run_timeout()``.
+
+Re-running the parallel pipeline for a date creates a new run. The loaders
+skip the metrics records that already exist unless the run has
+``force_update`` set.
+
+The runs are also the pipeline's ledger. Each course run records the timing,
+query count, learners processed and errors of its last attempt, and the run
+records its site metrics step. The serial pipeline resumes an unfinished run
+for the same date from its first incomplete course. See
+``start_or_resume_pipeline_run``
+'''
+
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from figures import settings
+from figures.models import PipelineCourseRun, PipelineRun
+from figures.pipeline.course_daily_metrics import CourseDailyMetricsLoader
+from figures.pipeline.instrumentation import PipelineStats
+from figures.pipeline.profiling import profile_course
+
+
+def start_pipeline_run(date_for, course_ids, force_update=False,
+                       mode=PipelineRun.PARALLEL):
+    '''Creates the run and its course runs
+    '''
+    with transaction.atomic():
+        run = PipelineRun.objects.create(
+            date_for=date_for, force_update=force_update, mode=mode)
+        PipelineCourseRun.objects.bulk_create([
+            PipelineCourseRun(run=run, course_id=str(course_id))
+            for course_id in course_ids])
+    return run
+
+
+def start_or_resume_pipeline_run(date_for, course_ids, force_update=False,
+                                 mode=PipelineRun.SERIAL):
+    '''Returns the latest unfinished run for the date, with course runs added
+    for any new courses, or a new run if there is none
+
+    Returns a ``(run, resumed)`` tuple
+    '''
+    run = PipelineRun.objects.filter(
+        date_for=date_for,
+        force_update=force_update,
+        mode=mode,
+        status=PipelineRun.RUNNING).order_by('-created').first()
+    if not run:
+        return start_pipeline_run(date_for, course_ids, force_update, mode), False
+
+    existing = set(run.course_runs.values_list('course_id', flat=True))
+    PipelineCourseRun.objects.bulk_create([
+        PipelineCourseRun(run=run, course_id=str(course_id))
+        for course_id in course_ids if str(course_id) not in existing])
+    return run, True
+
+
+def incomplete_course_runs(run):
+    '''Returns the run's course runs that have not completed, in the order
+    they were created
+    '''
+    return run.course_runs.exclude(
+        status=PipelineCourseRun.COMPLETE).order_by('id')
+
+
+def retry_countdown(attempts):
+    '''Returns the seconds to wait before the next attempt, doubling with each
+    attempt made
+    '''
+    return settings.pipeline_retry_backoff() * 2 ** max(attempts - 1, 0)
+
+
+def record_stats(obj, stats):
+    '''Copies the ``PipelineStats`` to a run or course run. Does not save
+    '''
+    obj.stage_durations = dict(stats.stage_durations)
+    obj.query_count = stats.query_count
+    if isinstance(obj, PipelineCourseRun):
+        obj.learners_processed = stats.learners_processed
+        obj.error_count = stats.error_count
+        obj.partial = stats.partial
+
+
+def run_course(course_run, course_counts=None, max_attempts=None):
+    '''Makes one attempt to populate the course run's ``CourseDailyMetrics``
+
+    Returns True if it succeeded. On failure the course run is set back to
+    pending if it has attempts left, else it is marked failed. The attempt's
+    timing and stats are recorded in the course run. The attempt is profiled
+    if there is an active ``figures.pipeline.profiling.PipelineProfiler``
+
+    ``max_attempts`` defaults to
+    ``figures.settings.pipeline_course_max_attempts()``
+    '''
+    if max_attempts is None:
+        max_attempts = settings.pipeline_course_max_attempts()
+    PipelineCourseRun.objects.filter(pk=course_run.pk).update(
+        status=PipelineCourseRun.RUNNING,
+        attempts=F('attempts') + 1,
+        started=timezone.now(),
+        finished=None)
+    course_run.refresh_from_db()
+    run = course_run.run
+    stats = PipelineStats()
+    try:
+        with profile_course(course_run.course_id, stats):
+            CourseDailyMetricsLoader(course_run.course_id).load(
+                date_for=run.date_for,
+                force_update=run.force_update,
+                course_counts=course_counts,
+                stats=stats)
+    except Exception as e:
+        course_run.error = str(e)
+        stats.error_count += 1
+        if course_run.attempts >= max_attempts:
+            course_run.status = PipelineCourseRun.FAILED
+        else:
+            course_run.status = PipelineCourseRun.PENDING
+        succeeded = False
+    else:
+        course_run.status = PipelineCourseRun.COMPLETE
+        course_run.error = ''
+        succeeded = True
+
+    record_stats(course_run, stats)
+    course_run.finished = timezone.now()
+    course_run.save()
+    return succeeded
+
+
+def claim_run_finalization(run):
+    '''Returns True if every course run has finished and the caller is the
+    one to populate the run's site metrics
+
+    Only one caller gets True for a run, however many call this at once
+    '''
+    unfinished = run.course_runs.exclude(
+        status__in=PipelineCourseRun.FINISHED_STATUSES)
+    if unfinished.exists():
+        return False
+    claimed = PipelineRun.objects.filter(
+        pk=run.pk, status=PipelineRun.RUNNING).update(
+        status=PipelineRun.FINALIZING)
+    return bool(claimed)
+
+
+def finish_run(run, status, stats=None):
+    '''Records the end of the run and the stats of its site metrics step
+    '''
+    run.status = status
+    run.finished = timezone.now()
+    update_fields = ['status', 'finished', 'modified']
+    if stats:
+        record_stats(run, stats)
+        update_fields += ['stage_durations', 'query_count']
+    run.save(update_fields=update_fields)
+
+
+def fail_unfinished_course_runs(run):
+    '''Marks the run's unfinished course runs as failed
+
+    Returns the number of course runs marked
+    '''
+    return run.course_runs.exclude(
+        status__in=PipelineCourseRun.FINISHED_STATUSES).update(
+        status=PipelineCourseRun.FAILED,
+        error='Did not finish before the pipeline run timeout')
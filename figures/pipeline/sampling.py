@@ -0,0 +1,158 @@
+'''Sampled progress estimation for very large courses
+
+Grading every learner in a course with 100k+ enrollments every day costs
+more than an exact ``average_progress`` is worth. In sampled mode the
+pipeline grades a sample of the learners and estimates the course average
+with a confidence interval. Everyone else has their latest grades snapshot
+carried forward.
+
+The sample is stratified by the learner's latest snapshot progress, see
+``progress_stratum``. Within each stratum, learners are spread over
+rotation slots by a hash of their user id, and each day grades one slot. So
+each day's sample is spread over the strata in proportion to their size, and
+every learner is graded once per rotation. The rotation changes when the
+population does, so it does not bound how long a learner can go without
+being graded. Learners with no snapshot, or whose grades were last computed
+``max_days`` ago, are always graded. That is what bounds how old any
+learner's grades can get. Carried forward snapshots keep the time the grades
+were computed, see ``LearnerCourseGradeMetrics.graded_at``.
+
+The estimate is the usual stratified mean. Its confidence interval uses the
+variance of the progress graded in each stratum, with the finite population
+correction
+
+See ``figures.pipeline.course_daily_metrics.get_sampled_average_progress``
+'''
+
+import bisect
+from collections import namedtuple
+import math
+
+from figures.helpers import as_date, next_day
+
+
+# Upper bounds of the progress strata. Learners with no snapshot are in a
+# stratum of their own
+PROGRESS_STRATA_BOUNDS = (0.0, 0.25, 0.5, 0.75)
+
+# Normal quantile for a 95% confidence interval
+Z_95 = 1.96
+
+# Smallest sample size for a target error. With no variance in the snapshot
+# progress the computed size is zero, which would turn the rotation off and
+# grade everyone
+MIN_SAMPLE_SIZE = 30
+
+
+ProgressEstimate = namedtuple('ProgressEstimate', [
+    'average',
+    'lower',
+    'upper',
+    'sample_size',
+])
+
+
+def progress_stratum(progress):
+    '''Returns the stratum for a learner's latest snapshot progress, or None
+    if the learner has no snapshot
+    '''
+    if progress is None:
+        return None
+    return bisect.bisect_left(PROGRESS_STRATA_BOUNDS, progress)
+
+
+def rotation_slot(user_id, slots):
+    '''Returns the learner's rotation slot
+
+    Knuth's multiplicative hash spreads consecutive user ids over the slots
+    '''
+    return ((user_id * 2654435761) % 2 ** 32) % slots
+
+
+def rotation_slots(population, sample_size, max_days):
+    '''Returns the number of days in the rotation
+
+    Each day grades about ``population / slots`` learners. There are no more
+    than ``max_days`` slots
+    '''
+    if sample_size <= 0:
+        return 1
+    return int(max(1, min(max_days, population // sample_size)))
+
+
+def sample_size_for_error(values, target_error, population):
+    '''Returns the sample size for a 95% confidence interval of plus or minus
+    ``target_error`` around the mean of a population like ``values``
+
+    ``values`` are the learners' snapshot progress, which we use to estimate
+    the variance. The sample size is at least ``MIN_SAMPLE_SIZE`` and at most
+    the population
+    '''
+    if not population:
+        return 0
+    if len(values) < 2 or target_error <= 0:
+        return population
+    mean = float(sum(values)) / len(values)
+    variance = sum((value - mean) ** 2 for value in values) / (len(values) - 1)
+    sample_size = (Z_95 ** 2) * variance / (target_error ** 2)
+    # Finite population correction
+    sample_size = sample_size / (1 + sample_size / population)
+    return min(population, max(MIN_SAMPLE_SIZE, int(math.ceil(sample_size))))
+
+
+def grades_age(graded_at, date_for):
+    '''Returns the number of days from when the learner's grades were
+    computed to the end of ``date_for``
+
+    The pipeline runs after the day it is for has ended, so grades computed
+    in the run for the day before ``date_for`` are one day old
+    '''
+    return (next_day(as_date(date_for)) - as_date(graded_at)).days
+
+
+def in_sample(user_id, graded_at, date_for, slots, max_days):
+    '''Returns True if the learner is graded on ``date_for``
+
+    ``graded_at`` is when the learner's grades were last computed, or None if
+    they have no snapshot or it does not record when
+    '''
+    if graded_at is None or grades_age(graded_at, date_for) >= max_days:
+        return True
+    return rotation_slot(user_id, slots) == date_for.toordinal() % slots
+
+
+def stratified_estimate(strata):
+    '''Returns a ``ProgressEstimate`` for the population
+
+    ``strata`` is a dict of ``(population_count, graded, carried_forward)``
+    tuples. ``graded`` is the list of progress values graded today and
+    ``carried_forward`` the snapshot progress of the others. A stratum with
+    nothing graded is estimated from its carried forward values, and a
+    stratum with one learner graded adds no variance
+    '''
+    population = sum(count for count, graded, carried in strata.values())
+    if not population:
+        return ProgressEstimate(0.0, 0.0, 0.0, 0)
+
+    average = 0.0
+    variance = 0.0
+    sample_size = 0
+    for count, graded, carried in strata.values():
+        weight = float(count) / population
+        values = graded or carried
+        if not values:
+            continue
+        mean = float(sum(values)) / len(values)
+        average += weight * mean
+        sample_size += len(graded)
+        if len(graded) > 1:
+            s2 = sum((value - mean) ** 2 for value in graded) / (len(graded) - 1)
+            fpc = 1 - float(len(graded)) / count
+            variance += weight ** 2 * fpc * s2 / len(graded)
+
+    half_width = Z_95 * math.sqrt(variance)
+    return ProgressEstimate(
+        average=average,
+        lower=max(average - half_width, 0.0),
+        upper=min(average + half_width, 1.0),
+        sample_size=sample_size)
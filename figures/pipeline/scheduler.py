@@ -0,0 +1,136 @@
+'''Cost-aware scheduling for the parallel daily metrics pipeline
+
+The parallel pipeline's wall-clock time on a fixed pool of workers is set by
+how the courses are spread over the workers. One large course started last
+makes the tail of the run long, and thousands of tiny courses each pay the
+per-task overhead. So the pipeline:
+
+* estimates each course's cost in seconds, from how long the course took in
+  the previous completed run, or else from its enrollment count
+* packs the courses estimated to take less than
+  ``figures.settings.pipeline_task_batch_seconds()`` into shared tasks of up
+  to that many seconds each, first fit decreasing
+* dispatches the tasks most expensive first. The workers take tasks off the
+  queue in order, so this is longest processing time first list scheduling
+
+Usage::
+
+    costs = estimate_course_costs(course_ids, site_course_counts['course_counts'])
+    for batch in schedule_courses(costs):
+        ...
+
+'''
+
+from collections import namedtuple
+
+from figures import settings
+from figures.models import PipelineCourseRun, PipelineRun
+
+
+# Used to estimate courses that have no previous run until there is history
+# to fit the seconds per learner from
+DEFAULT_SECONDS_PER_LEARNER = 0.5
+
+# Fixed cost of populating a course, whatever its size
+COURSE_OVERHEAD_SECONDS = 1.0
+
+
+CourseBatch = namedtuple('CourseBatch', ['course_ids', 'cost'])
+
+
+def get_previous_course_durations(before_date=None):
+    '''Returns the duration and learners processed for each course that
+    completed in the latest completed pipeline run
+
+    Returns a dict of ``(duration, learners_processed)`` keyed by course id.
+    Only runs for dates before ``before_date`` are used, if given
+    '''
+    runs = PipelineRun.objects.filter(status=PipelineRun.COMPLETE)
+    if before_date:
+        runs = runs.filter(date_for__lt=before_date)
+    run = runs.order_by('-date_for', '-created').first()
+    if not run:
+        return {}
+    # Load the model instances so the JSON field is decoded
+    course_runs = run.course_runs.filter(
+        status=PipelineCourseRun.COMPLETE).only(
+        'course_id', 'stage_durations', 'learners_processed')
+    return dict(
+        (course_run.course_id, (sum((course_run.stage_durations or {}).values()),
+                                course_run.learners_processed))
+        for course_run in course_runs.iterator())
+
+
+def fit_seconds_per_learner(previous_durations):
+    '''Returns the seconds per learner over the previous run's courses, less
+    the per course overhead
+    '''
+    seconds = learners = 0
+    for duration, learners_processed in previous_durations.values():
+        if learners_processed:
+            seconds += max(duration - COURSE_OVERHEAD_SECONDS, 0)
+            learners += learners_processed
+    if not learners:
+        return DEFAULT_SECONDS_PER_LEARNER
+    return float(seconds) / learners
+
+
+def estimate_course_costs(course_ids, course_counts=None, before_date=None):
+    '''Returns the estimated seconds to populate each course, keyed by
+    course id
+
+    ``course_counts`` are the site-wide extractor counts keyed by course id.
+    See ``figures.pipeline.site_extractors.get_course_counts_for_date``
+    '''
+    course_counts = course_counts or {}
+    previous_durations = get_previous_course_durations(before_date)
+    seconds_per_learner = fit_seconds_per_learner(previous_durations)
+    costs = {}
+    for course_id in course_ids:
+        course_id = str(course_id)
+        if course_id in previous_durations:
+            costs[course_id] = max(
+                previous_durations[course_id][0], COURSE_OVERHEAD_SECONDS)
+        else:
+            enrollment_count = course_counts.get(course_id, {}).get(
+                'enrollment_count', 0)
+            costs[course_id] = (
+                COURSE_OVERHEAD_SECONDS + enrollment_count * seconds_per_learner)
+    return costs
+
+
+def schedule_courses(costs, batch_seconds=None):
+    '''Groups the courses into task batches and orders them most expensive
+    first
+
+    ``costs`` are the estimated seconds keyed by course id. Each course that
+    costs at least ``batch_seconds`` gets a batch of its own. The others are
+    packed into batches of up to ``batch_seconds``, first fit decreasing.
+    Returns a list of ``CourseBatch`` tuples
+
+    ``batch_seconds`` defaults to
+    ``figures.settings.pipeline_task_batch_seconds()``. Zero or less turns off
+    packing
+    '''
+    if batch_seconds is None:
+        batch_seconds = settings.pipeline_task_batch_seconds()
+    # Sort by id for ties so the schedule is the same from run to run
+    ordered = sorted(costs.items(), key=lambda item: (-item[1], item[0]))
+
+    batches = []
+    open_batches = []
+    for course_id, cost in ordered:
+        if cost >= batch_seconds:
+            batches.append(CourseBatch([course_id], cost))
+            continue
+        for i, batch in enumerate(open_batches):
+            if batch.cost + cost <= batch_seconds:
+                batch.course_ids.append(course_id)
+                open_batches[i] = batch._replace(cost=batch.cost + cost)
+                break
+        else:
+            open_batches.append(CourseBatch([course_id], cost))
+
+    batches.extend(open_batches)
+    batches.sort(key=lambda batch: -batch.cost)
+    return batches
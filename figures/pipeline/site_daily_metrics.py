@@ -16,8 +16,12 @@ from openedx.core.djangoapps.content.course_overviews.models import (
     CourseOverview,
 )
 
+from figures.cache import bump_data_version
 from figures.helpers import as_course_key, as_datetime, next_day, prev_day
 from figures.models import CourseDailyMetrics, SiteDailyMetrics
+from figures.pipeline.instrumentation import PipelineStats
+from figures.pipeline.monthly_metrics import update_site_monthly_metrics
+from figures.pipeline.site_extractors import get_active_learners_for_date
 
 
 #
@@ -52,10 +56,11 @@ def missing_course_daily_metrics(date_for):
 
 def get_active_user_count_for_date(date_for, course_daily_metrics=None):
     '''
+    Returns the sum of the course active learner counts for the date_for
 
-    Do we have course daily metrics for the date_for?
-    If so, we can use the data there,
-    else, we need to calculate it or raise that we don't have data we need
+    NOTE: Learners active in more than one course are counted once for each
+    course. The extractor uses the distinct site-wide count from
+    ``figures.pipeline.site_extractors.get_active_learners_for_date``
     '''
     aggregates = CourseDailyMetrics.objects.filter(date_for=date_for).aggregate(
         Sum('active_learners_today'))
@@ -107,6 +112,14 @@ class SiteDailyMetricsExtractor(object):
         We get the count from the User model since there can be registered users
         who have not enrolled.
 
+        The active user count is the number of distinct learners active in any
+        course on the day. If the pipeline has already counted them, it passes
+        the count in the ``todays_active_user_count`` kwarg
+
+        If the ``stats`` kwarg is given, a
+        ``figures.pipeline.instrumentation.PipelineStats``, the extraction
+        stages are recorded in it. Each stage is also emitted as a span
+
         TODO: Exclude non-students from the user count
         '''
         if not date_for:
@@ -115,19 +128,26 @@ class SiteDailyMetricsExtractor(object):
             )
 
         data = dict()
-
-        user_count = get_user_model().objects.filter(
-            date_joined__lt=as_datetime(next_day(date_for))).count()
-        course_count = CourseOverview.objects.filter(
-            created__lt=as_datetime(next_day(date_for))).count()
-
-        todays_active_user_count = get_active_user_count_for_date(date_for)
+        stats = kwargs.get('stats') or PipelineStats()
+        tags = dict(extractor='site_daily_metrics', date_for=date_for)
+
+        with stats.stage('user_count', **tags):
+            data['total_user_count'] = get_user_model().objects.filter(
+                date_joined__lt=as_datetime(next_day(date_for))).count()
+        with stats.stage('course_count', **tags):
+            data['course_count'] = CourseOverview.objects.filter(
+                created__lt=as_datetime(next_day(date_for))).count()
+        with stats.stage('todays_active_user_count', **tags):
+            todays_active_user_count = kwargs.get('todays_active_user_count')
+            if todays_active_user_count is None:
+                todays_active_user_count = get_active_learners_for_date(
+                    date_for)['site_count']
         data['todays_active_user_count'] = todays_active_user_count
-        data['cumulative_active_user_count'] = get_previous_cumulative_active_user_count(
-            date_for) + todays_active_user_count
-        data['total_user_count'] = user_count
-        data['course_count'] = course_count
-        data['total_enrollment_count'] = get_total_enrollment_count(date_for)
+        with stats.stage('cumulative_active_user_count', **tags):
+            data['cumulative_active_user_count'] = get_previous_cumulative_active_user_count(
+                date_for) + todays_active_user_count
+        with stats.stage('total_enrollment_count', **tags):
+            data['total_enrollment_count'] = get_total_enrollment_count(date_for)
         return data
 
 
@@ -147,26 +167,29 @@ class SiteDailyMetricsLoader(object):
                 datetime.datetime.utcnow().replace(tzinfo=utc).date()
             )
 
-        # if we already have a record for the date_for and force_update is False
-        # then skip getting data
-        if not force_update:
-            try:
-                sdm = SiteDailyMetrics.objects.get(date_for=date_for)
-                return (sdm, False,)
-
-            except SiteDailyMetrics.DoesNotExist:
-                # proceed normally
-                pass
-
-        data = self.extractor.extract(date_for=date_for)
-        site_metrics, created = SiteDailyMetrics.objects.update_or_create(
-            date_for=date_for,
-            defaults=dict(
-                cumulative_active_user_count=data['cumulative_active_user_count'],
-                todays_active_user_count=data['todays_active_user_count'],
-                total_user_count=data['total_user_count'],
-                course_count=data['course_count'],
-                total_enrollment_count=data['total_enrollment_count'],
-            )
+        # If we already have a record for the date_for and force_update is
+        # False then skip getting data. Otherwise we write the row directly,
+        # so there is at most one read and one write
+        site_metrics = SiteDailyMetrics.objects.filter(date_for=date_for).first()
+        if site_metrics and not force_update:
+            return site_metrics, False
+
+        data = self.extractor.extract(date_for=date_for, **kwargs)
+        values = dict(
+            cumulative_active_user_count=data['cumulative_active_user_count'],
+            todays_active_user_count=data['todays_active_user_count'],
+            total_user_count=data['total_user_count'],
+            course_count=data['course_count'],
+            total_enrollment_count=data['total_enrollment_count'],
         )
+        if site_metrics:
+            for key, value in values.items():
+                setattr(site_metrics, key, value)
+            site_metrics.save()
+            created = False
+        else:
+            site_metrics = SiteDailyMetrics.objects.create(date_for=date_for, **values)
+            created = True
+        update_site_monthly_metrics(date_for)
+        bump_data_version(date_for)
         return site_metrics, created
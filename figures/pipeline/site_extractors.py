@@ -0,0 +1,241 @@
+'''Site-wide extractors for the daily metrics pipeline
+
+These extractors compute data for all the courses in the site with a single
+pass over the source table instead of a query per course. The pipeline runs
+them once per day and hands each course its values when building the
+course's ``CourseDailyMetrics`` record.
+
+Course ids in the returned dicts are strings so the values can be passed to
+celery tasks
+
+The enrollment and active learner counts are for learners only. Course
+staff, instructors and CCX coaches are left out using a ``CourseStaffIndex``
+loaded once per run, so there are no role lookups per course
+'''
+
+from collections import defaultdict
+
+from django.db.models import Count, Q
+
+from certificates.models import GeneratedCertificate
+from courseware.models import StudentModule
+from student.models import CourseAccessRole, CourseEnrollment
+
+from figures.helpers import as_course_key, as_date, as_datetime, next_day, prev_day
+
+# The CourseDailyMetrics fields computed for all courses at once
+COURSE_COUNT_FIELDS = (
+    'enrollment_count',
+    'active_learners_today',
+    'num_learners_completed',
+)
+
+
+# The course roles whose users are not counted as learners. These are the
+# roles ``student.roles.CourseStaffRole``, ``CourseInstructorRole`` and
+# ``CourseCcxCoachRole`` check
+COURSE_STAFF_ROLES = ('staff', 'instructor', 'ccx_coach')
+
+
+class CourseStaffIndex(object):
+    '''Holds the users with a course staff role in each course
+
+    All the ``CourseAccessRole`` assignments for ``COURSE_STAFF_ROLES`` are
+    loaded with one query. Pass ``course_ids`` to load only those courses.
+    A CCX course uses the roles of the course it is based on, the same as
+    ``figures.pipeline.course_daily_metrics.get_num_enrolled_in_exclude_admins``
+    '''
+    def __init__(self, course_ids=None):
+        self._course_keys = {}
+        roles = CourseAccessRole.objects.filter(role__in=COURSE_STAFF_ROLES)
+        if course_ids is not None:
+            roles = roles.filter(course_id__in=[
+                as_course_key(self._role_course_id(course_id))
+                for course_id in course_ids])
+        self.user_ids = defaultdict(set)
+        for course_id, user_id in roles.values_list('course_id', 'user_id').iterator():
+            if course_id:
+                self.user_ids[str(course_id)].add(user_id)
+        self.all_user_ids = set().union(*self.user_ids.values())
+
+    def _role_course_id(self, course_id):
+        course_id = str(course_id)
+        if course_id not in self._course_keys:
+            course_key = as_course_key(course_id)
+            if getattr(course_key, 'ccx', None):
+                course_key = course_key.to_course_locator()
+            self._course_keys[course_id] = str(course_key)
+        return self._course_keys[course_id]
+
+    def users_for(self, course_id):
+        '''Returns the set of staff user ids for the course
+        '''
+        if not self.all_user_ids:
+            return frozenset()
+        return self.user_ids.get(self._role_course_id(course_id), frozenset())
+
+    def is_staff(self, course_id, user_id):
+        return user_id in self.all_user_ids and user_id in self.users_for(course_id)
+
+
+def get_active_learners_for_date(date_for, staff_index=None):
+    '''Returns the learners who were active in the site on ``date_for``
+
+    We scan the StudentModule rows modified on the day, from the start of
+    ``date_for`` up to, but not including, the start of the next day, once
+    for the whole site.
+
+    Returns a dict with:
+
+    * ``course_counts``: a dict of the number of distinct learners active in
+      each course, keyed by course id. Courses with no active learners are not
+      included
+    * ``site_count``: the number of distinct learners active in any course.
+      Learners active in several courses are counted once
+    * ``course_user_ids`` and ``site_user_ids``: the ids of the learners
+      counted, as a dict of sets keyed by course id and a set. The pipeline
+      writes the daily active users sketches from them
+
+    Activity by a course's staff in that course is not counted. A
+    ``CourseStaffIndex`` is loaded if ``staff_index`` is not given
+    '''
+    if staff_index is None:
+        staff_index = CourseStaffIndex()
+    pairs = StudentModule.objects.filter(
+        modified__gte=as_datetime(date_for),
+        modified__lt=as_datetime(next_day(date_for)),
+    ).values_list('course_id', 'student_id').distinct().order_by()
+
+    course_learners = defaultdict(set)
+    site_learners = set()
+    for course_id, student_id in pairs.iterator():
+        if staff_index.is_staff(course_id, student_id):
+            continue
+        course_learners[str(course_id)].add(student_id)
+        site_learners.add(student_id)
+    return dict(course_counts=dict(
+                    (course_id, len(user_ids))
+                    for course_id, user_ids in course_learners.items()),
+                site_count=len(site_learners),
+                course_user_ids=dict(course_learners),
+                site_user_ids=site_learners)
+
+
+def get_active_user_ids_for_dates(dates, course_ids=None, staff_index=None):
+    '''Returns the ids of the learners active on each of ``dates``, as a dict
+    of sets keyed by date
+
+    The learners are found the same way as in ``get_active_learners_for_date``
+    and the daily active users sketches, in the site, or in ``course_ids`` if
+    given. The StudentModule rows for all of the days are read with one query.
+    ``figures.metrics.ActiveUsersMetric`` uses this for the days the sketches
+    do not cover
+    '''
+    dates = sorted(set(dates))
+    user_ids = dict((date_for, set()) for date_for in dates)
+    if not dates:
+        return user_ids
+    if staff_index is None:
+        staff_index = CourseStaffIndex(course_ids=course_ids)
+
+    # Read each run of consecutive days as one range of modified times
+    runs = []
+    for date_for in dates:
+        if runs and runs[-1][1] == prev_day(date_for):
+            runs[-1][1] = date_for
+        else:
+            runs.append([date_for, date_for])
+    modified = Q()
+    for start_date, end_date in runs:
+        modified |= Q(modified__gte=as_datetime(start_date),
+                      modified__lt=as_datetime(next_day(end_date)))
+    qs = StudentModule.objects.filter(modified)
+    if course_ids:
+        qs = qs.filter(course_id__in=[as_course_key(course_id)
+                                      for course_id in course_ids])
+    rows = qs.values_list('course_id', 'student_id', 'modified').order_by()
+    for course_id, student_id, modified_at in rows.iterator():
+        if not staff_index.is_staff(course_id, student_id):
+            user_ids[as_date(modified_at)].add(student_id)
+    return user_ids
+
+
+def count_by_course(queryset):
+    '''Returns a dict of the number of rows in the queryset for each course,
+    keyed by course id, with a single grouped query
+    '''
+    recs = queryset.values('course_id').annotate(count=Count('id')).order_by()
+    return dict((str(rec['course_id']), rec['count']) for rec in recs)
+
+
+def get_enrollment_counts_for_date(date_for, staff_index=None):
+    '''Returns the number of learner enrollments created through
+    ``date_for`` for each course
+
+    Matches ``figures.pipeline.course_daily_metrics.get_course_enrollments``,
+    less the course's staff. We count all the enrollments with one grouped
+    query, then take off the staff enrollments. Only the enrollments of
+    users with a staff role somewhere are read for that
+    '''
+    if staff_index is None:
+        staff_index = CourseStaffIndex()
+    enrollments = CourseEnrollment.objects.filter(
+        created__lt=as_datetime(next_day(date_for)))
+    counts = count_by_course(enrollments)
+    if staff_index.all_user_ids:
+        staff_enrollments = enrollments.filter(
+            user__courseaccessrole__role__in=COURSE_STAFF_ROLES,
+        ).values_list('course_id', 'user_id').distinct().order_by()
+        for course_id, user_id in staff_enrollments.iterator():
+            if staff_index.is_staff(course_id, user_id):
+                counts[str(course_id)] -= 1
+    return counts
+
+
+def get_certificate_counts_for_date(date_for):
+    '''Returns the number of certificates created through ``date_for`` for
+    each course
+
+    Matches ``figures.pipeline.course_daily_metrics.get_num_learners_completed``
+    '''
+    return count_by_course(GeneratedCertificate.objects.filter(
+        created_date__lt=as_datetime(next_day(date_for))))
+
+
+def get_course_counts_for_date(date_for):
+    '''Returns the ``COURSE_COUNT_FIELDS`` for every course in the site
+
+    This runs one query per source table for the whole site, and loads the
+    course staff once. Returns a dict with:
+
+    * ``course_counts``: a dict of counts dicts keyed by course id. Use
+      ``counts_for_course`` to get a course's counts
+    * ``site_active_learners``: the distinct number of learners active in the
+      site on ``date_for``
+    * ``active_learners``: the ``get_active_learners_for_date`` results
+    '''
+    staff_index = CourseStaffIndex()
+    active_learners = get_active_learners_for_date(date_for, staff_index)
+    counts = dict(
+        enrollment_count=get_enrollment_counts_for_date(date_for, staff_index),
+        active_learners_today=active_learners['course_counts'],
+        num_learners_completed=get_certificate_counts_for_date(date_for),
+    )
+    course_counts = defaultdict(dict)
+    for field in COURSE_COUNT_FIELDS:
+        for course_id, count in counts[field].items():
+            course_counts[course_id][field] = count
+    return dict(course_counts=dict(course_counts),
+                site_active_learners=active_learners['site_count'],
+                active_learners=active_learners)
+
+
+def counts_for_course(site_course_counts, course_id):
+    '''Returns the counts dict for the course from the
+    ``get_course_counts_for_date`` results
+
+    Counts are zero for courses that have no rows in a source table
+    '''
+    counts = dict((field, 0) for field in COURSE_COUNT_FIELDS)
+    counts.update(site_course_counts['course_counts'].get(str(course_id), {}))
+    return counts
@@ -0,0 +1,48 @@
+'''Writes the daily active users sketches
+
+Each day the pipeline writes an ``ActiveUsersSketch`` of the users active in
+the site, and one for each course with active users. The users are the ones
+``figures.pipeline.site_extractors.get_active_learners_for_date`` counts, so
+course staff are left out. The site sketch is written even when no one was
+active, so a day with a site sketch is a day the sketches cover.
+
+See ``figures.hll`` and ``figures.metrics.get_active_users_for_time_period``
+'''
+
+from figures.hll import HyperLogLog
+from figures.models import ActiveUsersSketch
+from figures.pipeline.bulk import BulkUpserter
+
+
+def add_active_user_sketches(writer, date_for, course_user_ids, site_user_ids):
+    '''Adds the day's sketches to a ``BulkUpserter`` for ``ActiveUsersSketch``
+
+    ``course_user_ids`` is a dict of user id sets keyed by course id and
+    ``site_user_ids`` a set of user ids
+    '''
+    writer.add(
+        date_for=date_for,
+        course_id='',
+        sketch=HyperLogLog().update(site_user_ids).to_bytes(),
+        user_count=len(site_user_ids))
+    for course_id, user_ids in course_user_ids.items():
+        writer.add(
+            date_for=date_for,
+            course_id=str(course_id),
+            sketch=HyperLogLog().update(user_ids).to_bytes(),
+            user_count=len(user_ids))
+
+
+def save_active_user_sketches(date_for, active_learners):
+    '''Writes the sketches for ``date_for``, replacing any there are
+
+    ``active_learners`` are the ``get_active_learners_for_date`` results.
+    Returns the number of sketches written
+    '''
+    with BulkUpserter(ActiveUsersSketch) as writer:
+        add_active_user_sketches(
+            writer,
+            date_for,
+            active_learners['course_user_ids'],
+            active_learners['site_user_ids'])
+    return writer.rows_written
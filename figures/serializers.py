@@ -35,17 +35,22 @@ from student.models import CourseAccessRole, CourseEnrollment
 
 from figures.helpers import as_course_key
 from figures.metrics import (
-    get_course_enrolled_users_for_time_period,
-    get_course_average_progress_for_time_period,
-    get_course_average_days_to_complete_for_time_period,
-    get_course_num_learners_completed_for_time_period,
+    COURSE_AVERAGE_DAYS_TO_COMPLETE,
+    COURSE_AVERAGE_PROGRESS,
+    COURSE_ENROLLED_USERS,
+    COURSE_NUM_LEARNERS_COMPLETED,
     get_monthly_history_metric,
+    get_monthly_history_metrics,
+    history_start_date,
     )
 from figures.models import (
     CourseDailyMetrics,
+    CourseMonthlyMetrics,
     SiteDailyMetrics,
     LearnerCourseGradeMetrics,
+    PipelineCourseRun,
     PipelineError,
+    PipelineRun,
     )
 from figures.pipeline.logger import log_error
 
@@ -157,6 +162,38 @@ class SiteDailyMetricsSerializer(serializers.ModelSerializer):
         model = SiteDailyMetrics
 
 
+class PipelineCourseRunSerializer(serializers.ModelSerializer):
+    """Provides the pipeline ledger entry for a course
+    """
+
+    class Meta:
+        model = PipelineCourseRun
+        exclude = ('run',)
+
+
+class PipelineRunSerializer(serializers.ModelSerializer):
+    """Provides a summary of a pipeline run
+
+    The totals are annotated on the queryset by ``PipelineRunViewSet``
+    """
+    course_count = serializers.IntegerField(read_only=True)
+    courses_complete = serializers.IntegerField(read_only=True)
+    courses_failed = serializers.IntegerField(read_only=True)
+    courses_partial = serializers.IntegerField(read_only=True)
+    learners_processed = serializers.IntegerField(read_only=True)
+    error_count = serializers.IntegerField(read_only=True)
+    course_query_count = serializers.IntegerField(read_only=True)
+
+    class Meta:
+        model = PipelineRun
+
+
+class PipelineRunDetailsSerializer(PipelineRunSerializer):
+    """Provides a pipeline run with the ledger entries for its courses
+    """
+    course_runs = PipelineCourseRunSerializer(many=True, read_only=True)
+
+
 #
 # Serializers for serving the front end views
 #
@@ -251,7 +288,8 @@ class GeneralCourseDataSerializer(serializers.Serializer):
             return []
 
 
-def get_course_history_metric(course_id, func, date_for, months_back):
+def get_course_history_metric(course_id, func, date_for, months_back,
+                              monthly=None):
     """Retieves current_month and history metric data for a course and time
     period
 
@@ -259,29 +297,22 @@ def get_course_history_metric(course_id, func, date_for, months_back):
 
     :param course_id: The course identifier for the course we want data
     :param func: The metric function to retrieve a metric for the specified
-    course and date range
+    course and date range. It can also be a ``figures.timeseries`` metric,
+    such as ``figures.metrics.COURSE_ENROLLED_USERS``, which is evaluated for
+    all of the months with one query
     :param date_for: The date to determine the current month
     :param months_back: How many months back to retrieve data
+    :param monthly: optional ``CourseMonthlyMetrics`` records for the course.
+    See ``get_monthly_history_metric``
     :returns: a dict with the current month metric and list of metrics for
     previous months
     """
-    # wrapper_func = lambda start_date, end_date: func(
-    #         start_date=start_date,
-    #         end_date=end_date,
-    #         course_id=course_id)
-
-    # def wrapper_func(start_date, end_date):
-    #         start_date=start_date,
-    #         end_date=end_date,
-    #         course_id=course_id
-
     return get_monthly_history_metric(
-        func=lambda start_date, end_date: func(
-            start_date=start_date,
-            end_date=end_date,
-            course_id=course_id),
+        func=func,
         date_for=date_for,
         months_back=months_back,
+        monthly=monthly,
+        course_id=course_id,
         )
 
 
@@ -315,6 +346,14 @@ class CourseDetailsSerializer(serializers.ModelSerializer):
 
     # TODO: Consider if we want to add a hyperlink field to the learner details endpoint
 
+    # The metric for each history field
+    HISTORY_METRICS = dict(
+        learners_enrolled=COURSE_ENROLLED_USERS,
+        average_progress=COURSE_AVERAGE_PROGRESS,
+        average_days_to_complete=COURSE_AVERAGE_DAYS_TO_COMPLETE,
+        users_completed=COURSE_NUM_LEARNERS_COMPLETED,
+    )
+
     class Meta:
         model = CourseOverview
         fields = ['course_id', 'course_name', 'course_code', 'org', 'start_date',
@@ -322,6 +361,28 @@ class CourseDetailsSerializer(serializers.ModelSerializer):
                   'average_progress', 'average_days_to_complete', 'users_completed', ]
         read_only_fields = fields
 
+    def course_history(self, course_overview):
+        """Returns the history for each of the course's history fields
+
+        The course's ``CourseMonthlyMetrics`` records are read with one query
+        and the metrics are evaluated together for the months without a
+        record, once per course for all of the fields
+        """
+        course_id = str(course_overview.id)
+        if getattr(self, '_history_course_id', None) != course_id:
+            date_for = datetime.datetime.utcnow().date()
+            monthly = CourseMonthlyMetrics.objects.for_months(
+                history_start_date(date_for, HISTORY_MONTHS_BACK), date_for,
+                course_id=course_id)
+            self._history = get_monthly_history_metrics(
+                self.HISTORY_METRICS,
+                date_for=date_for,
+                months_back=HISTORY_MONTHS_BACK,
+                monthly=monthly,
+                course_id=course_id)
+            self._history_course_id = course_id
+        return self._history
+
     def get_staff(self, course_overview):
         qs = CourseAccessRole.objects.filter(course_id=course_overview.id)
         if qs:
@@ -334,42 +395,22 @@ class CourseDetailsSerializer(serializers.ModelSerializer):
         Would be nice to have the course_enrollment and course_overview models
         linked
         """
-        return get_course_history_metric(
-            course_id=course_overview.id,
-            func=get_course_enrolled_users_for_time_period,
-            date_for=datetime.datetime.utcnow(),
-            months_back=HISTORY_MONTHS_BACK,
-            )
+        return self.course_history(course_overview)['learners_enrolled']
 
     def get_average_progress(self, course_overview):
         """
         """
-        return get_course_history_metric(
-            course_id=course_overview.id,
-            func=get_course_average_progress_for_time_period,
-            date_for=datetime.datetime.utcnow(),
-            months_back=HISTORY_MONTHS_BACK,
-            )
+        return self.course_history(course_overview)['average_progress']
 
     def get_average_days_to_complete(self, course_overview):
         """
         """
-        return get_course_history_metric(
-            course_id=course_overview.id,
-            func=get_course_average_days_to_complete_for_time_period,
-            date_for=datetime.datetime.utcnow(),
-            months_back=HISTORY_MONTHS_BACK,
-            )
+        return self.course_history(course_overview)['average_days_to_complete']
 
     def get_users_completed(self, course_overview):
         """
         """
-        return get_course_history_metric(
-            course_id=course_overview.id,
-            func=get_course_num_learners_completed_for_time_period,
-            date_for=datetime.datetime.utcnow(),
-            months_back=HISTORY_MONTHS_BACK,
-            )
+        return self.course_history(course_overview)['users_completed']
 
 
 class GeneralSiteMetricsSerializer(serializers.Serializer):
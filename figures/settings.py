@@ -17,9 +17,63 @@ DAILY_METRICS_CELERY_TASK_LABEL = 'figures-populate-daily-metrics'
 
 DEFAULT_LOG_PIPELINE_ERRORS_TO_DB = True
 
+DEFAULT_INCREMENTAL_GRADES = False
+
+# Worker processes and enrollments per worker task for grading a single course
+# A worker count of 1 grades in the pipeline process
+DEFAULT_GRADES_WORKER_COUNT = 1
+DEFAULT_GRADES_CHUNK_SIZE = 1000
+
+# Seconds a single course may spend on exact grading before the rest of its
+# learners have their previous grades carried forward. Zero turns the budget
+# off
+DEFAULT_PIPELINE_GRADES_TIME_BUDGET = 0
+
+# Estimate the average progress of courses with at least this many
+# enrollments from a sample of learners. Zero turns sampling off
+DEFAULT_SAMPLED_PROGRESS_MIN_ENROLLMENTS = 0
+DEFAULT_SAMPLED_PROGRESS_SAMPLE_SIZE = 2000
+DEFAULT_SAMPLED_PROGRESS_TARGET_ERROR = 0
+DEFAULT_SAMPLED_PROGRESS_MAX_DAYS = 30
+
+# Number of rows per statement and rows per transaction for pipeline bulk writes
+DEFAULT_BULK_WRITE_BATCH_SIZE = 500
+DEFAULT_BULK_WRITE_TRANSACTION_SIZE = 5000
+
+# Retries, timeouts and schedule for the parallel daily metrics pipeline
+DEFAULT_PARALLEL_DAILY_METRICS = False
+DEFAULT_PIPELINE_COURSE_MAX_ATTEMPTS = 3
+DEFAULT_PIPELINE_RETRY_BACKOFF = 60
+DEFAULT_PIPELINE_COURSE_TIME_LIMIT = 60 * 60
+DEFAULT_PIPELINE_RUN_TIMEOUT = 6 * 60 * 60
+DEFAULT_PIPELINE_TASK_BATCH_SECONDS = 60
+
+# Alias of the Django cache for the general site metrics responses. None
+# turns the cache off
+DEFAULT_METRICS_CACHE = 'default'
+
 env_tokens = {}
 
 
+def pipeline_span_log():
+    """Path of a file to append the pipeline stage timing spans to as JSON
+    lines. None turns it off
+
+    See ``figures.pipeline.instrumentation``
+    """
+    return env_tokens.get('PIPELINE_SPAN_LOG')
+
+
+def metrics_cache():
+    """Alias of the Django cache the general site metrics responses are
+    cached in, or None to not cache them
+
+    The cache must be shared by the web and pipeline processes. See
+    ``figures.cache``
+    """
+    return env_tokens.get('METRICS_CACHE', DEFAULT_METRICS_CACHE)
+
+
 def log_pipeline_errors_to_db():
     """Capture pipeline errors to the figures.models.PipelineError model
     """
@@ -27,6 +81,130 @@ def log_pipeline_errors_to_db():
                                DEFAULT_LOG_PIPELINE_ERRORS_TO_DB))
 
 
+def incremental_grades():
+    """Only recompute learner grades when there is new courseware activity
+
+    See ``figures.pipeline.course_daily_metrics.get_average_progress``
+    """
+    return bool(env_tokens.get('INCREMENTAL_GRADES',
+                               DEFAULT_INCREMENTAL_GRADES))
+
+
+def grades_worker_count():
+    """Number of worker processes used to grade a single course
+
+    See ``figures.pipeline.grades``
+    """
+    return int(env_tokens.get('GRADES_WORKER_COUNT',
+                              DEFAULT_GRADES_WORKER_COUNT))
+
+
+def grades_chunk_size():
+    """Number of enrollments sent to a grades worker process at a time
+    """
+    return int(env_tokens.get('GRADES_CHUNK_SIZE',
+                              DEFAULT_GRADES_CHUNK_SIZE))
+
+
+def pipeline_grades_time_budget():
+    """Seconds a course may spend on exact grading in the daily pipeline
+
+    See ``figures.pipeline.course_daily_metrics.get_average_progress``
+    """
+    return float(env_tokens.get('PIPELINE_GRADES_TIME_BUDGET',
+                                DEFAULT_PIPELINE_GRADES_TIME_BUDGET))
+
+
+def sampled_progress_min_enrollments():
+    """Enrollment count from which a course's average progress is estimated
+    from a sample of learners. Zero turns sampling off
+
+    See ``figures.pipeline.sampling``
+    """
+    return int(env_tokens.get('SAMPLED_PROGRESS_MIN_ENROLLMENTS',
+                              DEFAULT_SAMPLED_PROGRESS_MIN_ENROLLMENTS))
+
+
+def sampled_progress_sample_size():
+    """Number of learners graded each day in a sampled course
+    """
+    return int(env_tokens.get('SAMPLED_PROGRESS_SAMPLE_SIZE',
+                              DEFAULT_SAMPLED_PROGRESS_SAMPLE_SIZE))
+
+
+def sampled_progress_target_error():
+    """Half width of the 95% confidence interval the sample is sized for. If
+    set, this is used instead of the sample size
+    """
+    return float(env_tokens.get('SAMPLED_PROGRESS_TARGET_ERROR',
+                                DEFAULT_SAMPLED_PROGRESS_TARGET_ERROR))
+
+
+def sampled_progress_max_days():
+    """Most days between gradings of a learner in a sampled course
+    """
+    return int(env_tokens.get('SAMPLED_PROGRESS_MAX_DAYS',
+                              DEFAULT_SAMPLED_PROGRESS_MAX_DAYS))
+
+
+def bulk_write_batch_size():
+    """Number of rows written per statement by ``figures.pipeline.bulk``
+    """
+    return int(env_tokens.get('BULK_WRITE_BATCH_SIZE',
+                              DEFAULT_BULK_WRITE_BATCH_SIZE))
+
+
+def bulk_write_transaction_size():
+    """Number of rows buffered and committed per transaction by
+    ``figures.pipeline.bulk``
+    """
+    return int(env_tokens.get('BULK_WRITE_TRANSACTION_SIZE',
+                              DEFAULT_BULK_WRITE_TRANSACTION_SIZE))
+
+
+def pipeline_course_max_attempts():
+    """Number of times the parallel pipeline tries to populate a course
+    before marking it failed
+    """
+    return int(env_tokens.get('PIPELINE_COURSE_MAX_ATTEMPTS',
+                              DEFAULT_PIPELINE_COURSE_MAX_ATTEMPTS))
+
+
+def pipeline_retry_backoff():
+    """Seconds to wait before the first retry of a failed course. The wait
+    doubles with each retry
+    """
+    return int(env_tokens.get('PIPELINE_RETRY_BACKOFF',
+                              DEFAULT_PIPELINE_RETRY_BACKOFF))
+
+
+def pipeline_course_time_limit():
+    """Seconds a course task may run before it is interrupted and retried
+
+    A task for a batch of small courses gets this for each of its courses
+    """
+    return int(env_tokens.get('PIPELINE_COURSE_TIME_LIMIT',
+                              DEFAULT_PIPELINE_COURSE_TIME_LIMIT))
+
+
+def pipeline_run_timeout():
+    """Seconds after which a parallel pipeline run marks its unfinished
+    courses failed and populates the site metrics
+    """
+    return int(env_tokens.get('PIPELINE_RUN_TIMEOUT',
+                              DEFAULT_PIPELINE_RUN_TIMEOUT))
+
+
+def pipeline_task_batch_seconds():
+    """Estimated seconds of work the parallel pipeline packs into one task
+    from courses smaller than that
+
+    See ``figures.pipeline.scheduler``
+    """
+    return float(env_tokens.get('PIPELINE_TASK_BATCH_SECONDS',
+                                DEFAULT_PIPELINE_TASK_BATCH_SECONDS))
+
+
 def update_webpack_loader(webpack_loader_settings, figures_env_tokens=None):
     """
     figures_env_tokens is a dict retrieved from the ``ENV_TOKENS`` in the LMS
@@ -61,8 +239,14 @@ def update_celerybeat_schedule(celerybeat_schedule_settings, figures_env_tokens=
     if not figures_env_tokens:
         figures_env_tokens = {}
 
+    if figures_env_tokens.get('PARALLEL_DAILY_METRICS',
+                              DEFAULT_PARALLEL_DAILY_METRICS):
+        task = 'figures.tasks.parallel_populate_daily_metrics'
+    else:
+        task = 'figures.tasks.populate_daily_metrics'
+
     celerybeat_schedule_settings[DAILY_METRICS_CELERY_TASK_LABEL] = {
-        'task': 'figures.tasks.populate_daily_metrics',
+        'task': task,
         'schedule': crontab(
             hour=figures_env_tokens.get('DAILY_METRICS_IMPORT_HOUR', 2),
             minute=figures_env_tokens.get('DAILY_METRICS_IMPORT_MINUTE', 0),
@@ -100,6 +284,10 @@ def update_settings(webpack_loader_settings,
             "ENABLE_DAILY_METRICS_IMPORT": false
         },
 
+    Set ``PARALLEL_DAILY_METRICS`` to true to schedule the parallel pipeline,
+    ``figures.tasks.parallel_populate_daily_metrics``, instead of the serial
+    one
+
     """
     update_webpack_loader(webpack_loader_settings, figures_env_tokens)
 
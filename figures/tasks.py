@@ -7,16 +7,25 @@ import time
 
 from django.utils.timezone import utc
 
-from celery import chord
 from celery.app import shared_task
 from celery.utils.log import get_task_logger
 
-from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
 from student.models import CourseEnrollment
 
+from figures import settings
 from figures.helpers import as_course_key, as_date
-from figures.pipeline.course_daily_metrics import CourseDailyMetricsLoader
+from figures.models import PipelineCourseRun, PipelineRun, SiteDailyMetrics
+from figures.pipeline import runs, scheduler, sketches
+from figures.pipeline.course_daily_metrics import (
+    CourseDailyMetricsLoader,
+    get_course_ids_to_populate,
+)
+from figures.pipeline.instrumentation import PipelineStats
 from figures.pipeline.site_daily_metrics import SiteDailyMetricsLoader
+from figures.pipeline.site_extractors import (
+    counts_for_course,
+    get_course_counts_for_date,
+)
 
 
 logger = get_task_logger(__name__)
@@ -31,25 +40,38 @@ logger = get_task_logger(__name__)
 
 
 @shared_task
-def populate_single_cdm(course_id, date_for=None, force_update=False):
+def populate_single_cdm(course_id, date_for=None, force_update=False,
+                        course_counts=None):
     '''Populates a CourseDailyMetrics record for the given date and course
+
+    ``course_counts`` are the course's counts from the site-wide extractors,
+    if the caller has them. See ``figures.pipeline.site_extractors``
     '''
     if date_for:
         date_for = as_date(date_for)
 
     # Provide info in celery log
-    learner_count = CourseEnrollment.objects.filter(
-        course_id=as_course_key(course_id)).count()
+    if course_counts and 'enrollment_count' in course_counts:
+        learner_count = course_counts['enrollment_count']
+    else:
+        learner_count = CourseEnrollment.objects.filter(
+            course_id=as_course_key(course_id)).count()
     msg = 'populate_single_cdm. course id = "{}", learner count={}'.format(
         course_id, learner_count)
     logger.info(msg)
 
     start_time = time.time()
+    stats = PipelineStats()
     cdm_obj, created = CourseDailyMetricsLoader(
-        course_id).load(date_for=date_for, force_update=force_update)
+        course_id).load(date_for=date_for, force_update=force_update,
+                        course_counts=course_counts, stats=stats)
     elapsed_time = time.time() - start_time
     logger.info('done. Elapsed time (seconds)={}. cdm_obj={}'.format(
         elapsed_time, cdm_obj))
+    logger.info('stage durations (seconds)={}, query count={}'.format(
+        ', '.join('{}={:.3f}'.format(name, duration)
+                  for name, duration in stats.stage_durations.items()),
+        stats.query_count))
 
 
 @shared_task
@@ -57,13 +79,19 @@ def populate_site_daily_metrics(**kwargs):
     '''Populate a SiteDailyMetrics record
     '''
     logger.debug("populate_site_daily_metrics called")
-    SiteDailyMetricsLoader().load(
-        date_for=kwargs.get('date_for', None),
-        force_update=kwargs.get('force_update', False),
-        )
+    SiteDailyMetricsLoader().load(**kwargs)
     logger.debug('done running populate_site_daily_metrics')
 
 
+def is_populated(date_for, course_ids_to_populate, force_update=False):
+    '''Returns True if there are no courses to populate for the date and
+    its SiteDailyMetrics record exists
+    '''
+    if force_update or course_ids_to_populate:
+        return False
+    return SiteDailyMetrics.objects.filter(date_for=date_for).exists()
+
+
 @shared_task
 def populate_daily_metrics(date_for=None, force_update=False):
     '''Populates the daily metrics models for the given date
@@ -71,16 +99,22 @@ def populate_daily_metrics(date_for=None, force_update=False):
     This method populates CourseDailyMetrics for all the courses in the site,
     then populates SiteDailyMetrics
 
-    It calls the individual tasks, ``populate_single_cdm`` and
-    ``populate_site_daily_metrics`` as immediate calls so that no courses are
-    missed when the site daily metrics record is populated.
+    The courses are populated one at a time in this call, then
+    ``populate_site_daily_metrics`` is called so that no courses are missed
+    when the site daily metrics record is populated.
 
-    NOTE: We have an experimental task that runs the course populators in
+    Courses that already have a record for the date are left out unless
+    ``force_update`` is True. If there is nothing to populate, no run is
+    recorded and this returns None. Otherwise it returns the run id.
 
-    parallel, then when they are all done, populates the site metrics. See the
-    function ``experimental_populate_daily_metrics`` docstring for details
+    The run is recorded in the ``PipelineRun`` and ``PipelineCourseRun``
+    models. A course that fails is recorded and the run continues with the
+    next course. If the task is restarted for the same date after a run did
+    not finish, it resumes that run from its first incomplete course.
+
+    NOTE: ``parallel_populate_daily_metrics`` runs the course populators in
+    parallel, then when they are all done, populates the site metrics
 
-    TODO: Add error handling and error logging
     TODO: Create and add decorator to assign 'date_for' if None
     '''
     if date_for:
@@ -91,66 +125,216 @@ def populate_daily_metrics(date_for=None, force_update=False):
     logger.info('Starting task "figures.populate_daily_metrics" for date "{}"'.format(
         date_for))
 
-    for course in CourseOverview.objects.all():
-        populate_single_cdm(
-            course_id=course.id,
-            date_for=date_for,
-            force_update=force_update)
-    populate_site_daily_metrics(date_for=date_for, force_update=force_update)
+    course_ids = get_course_ids_to_populate(date_for, force_update)
+    if is_populated(date_for, course_ids, force_update):
+        logger.info('Daily metrics are already populated for date "{}"'.format(
+            date_for))
+        return None
+
+    site_course_counts = get_course_counts_for_date(date_for)
+    sketches.save_active_user_sketches(date_for, site_course_counts['active_learners'])
+    run, resumed = runs.start_or_resume_pipeline_run(
+        date_for, course_ids, force_update=force_update,
+        mode=PipelineRun.SERIAL)
+    if resumed:
+        logger.info('Resuming pipeline run {} for date "{}"'.format(
+            run.id, date_for))
+
+    for course_run in runs.incomplete_course_runs(run):
+        if not runs.run_course(
+                course_run,
+                course_counts=counts_for_course(
+                    site_course_counts, course_run.course_id),
+                max_attempts=course_run.attempts + 1):
+            logger.info('populate_daily_metrics. course id = "{}" failed: {}'.format(
+                course_run.course_id, course_run.error))
+
+    populate_run_site_metrics(
+        run, todays_active_user_count=site_course_counts['site_active_learners'])
     logger.info('Finished task "figures.populate_daily_metrics" for date "{}"'.format(
         date_for))
+    return run.id
+
+
+def populate_run_site_metrics(run, **kwargs):
+    '''Populates the SiteDailyMetrics record for the run and records the end
+    of the run
+    '''
+    stats = PipelineStats()
+    try:
+        with stats.stage('site_daily_metrics'):
+            populate_site_daily_metrics(
+                date_for=run.date_for, force_update=run.force_update, **kwargs)
+    except Exception:
+        runs.finish_run(run, PipelineRun.FAILED, stats)
+        raise
+    runs.finish_run(run, PipelineRun.COMPLETE, stats)
 
 
 #
-# Experimental tasks
+# Parallel pipeline tasks
 #
 
 
+def finish_pipeline_run(run_id):
+    '''Populates the site metrics if every course in the run has finished
+
+    See ``figures.pipeline.runs``
+    '''
+    run = PipelineRun.objects.get(id=run_id)
+    if not runs.claim_run_finalization(run):
+        return
+    populate_run_site_metrics(run)
+    logger.info('Finished pipeline run {} for date "{}"'.format(
+        run.id, run.date_for))
+
+
+def run_course_with_retries(course_run, course_counts=None, delay=True):
+    '''Populates the course run, retrying failed attempts with backoff
+
+    If ``delay`` is True a retry is queued as a ``populate_course_run`` task
+    with a countdown and this returns False. Otherwise it is retried right
+    away. Returns True when the course run has finished
+    '''
+    while not runs.run_course(course_run, course_counts):
+        logger.info('populate_course_run. course id = "{}", attempt {} failed: {}'.format(
+            course_run.course_id, course_run.attempts, course_run.error))
+        if course_run.status == PipelineCourseRun.FAILED:
+            break
+        if delay:
+            populate_course_run.apply_async(
+                kwargs=dict(course_run_id=course_run.id,
+                            course_counts=course_counts),
+                countdown=runs.retry_countdown(course_run.attempts),
+                soft_time_limit=settings.pipeline_course_time_limit())
+            return False
+    return True
+
+
 @shared_task
-def experimental_populate_daily_metrics(date_for=None, force_update=False):
-    '''Experimental task to populate daily metrics
+def populate_course_run(course_run_id, course_counts=None, delay=True):
+    '''Populates the CourseDailyMetrics record for a course in a pipeline run
 
-    WARNING: In Ginkgo devstack, this task tends to gets stuck in the middle of
-    processing course metrics. Not all the courses get processed and the site
-    metrics doesn't get called.
+    Failed attempts are retried with backoff. If ``delay`` is True the retry
+    is queued with a countdown, else it is retried right away in this call.
+    When the course has finished, the run's site metrics are populated if
+    every other course has also finished
+    '''
+    course_run = PipelineCourseRun.objects.select_related('run').get(
+        id=course_run_id)
+    if course_run.status in PipelineCourseRun.FINISHED_STATUSES:
+        # This can happen if the task is delivered more than once
+        return
+
+    if run_course_with_retries(course_run, course_counts, delay):
+        finish_pipeline_run(course_run.run_id)
 
-    We're keeping it in the tasks so that we can continue to debug this.
-    Enabling parallel course tasks will improve the pipeline performance
 
+@shared_task
+def populate_course_runs(course_run_ids, course_counts=None, delay=True):
+    '''Populates a batch of small courses in a pipeline run, in order
+
+    ``course_counts`` are the courses' counts keyed by course id. A course
+    that fails is retried in a task of its own. See
+    ``figures.pipeline.scheduler``
     '''
-    def include_course(course_overview, threshold=50):
-        '''This function let's us skip over courses with many enrollments, speeding
-        up testing. Do not use for production
-        '''
-        count = CourseEnrollment.objects.filter(course_id=course_overview.id).count()
-        return False if count > threshold else True
+    course_counts = course_counts or {}
+    course_runs = PipelineCourseRun.objects.select_related('run').in_bulk(
+        course_run_ids)
+    for course_run_id in course_run_ids:
+        course_run = course_runs[course_run_id]
+        if course_run.status in PipelineCourseRun.FINISHED_STATUSES:
+            continue
+        run_course_with_retries(
+            course_run, course_counts.get(course_run.course_id), delay)
+
+    if course_runs:
+        finish_pipeline_run(course_runs[course_run_ids[0]].run_id)
 
+
+@shared_task
+def check_pipeline_run(run_id):
+    '''Closes a pipeline run that has not finished by its timeout
+
+    Marks the courses that have not finished as failed, then populates the
+    site metrics
+    '''
+    run = PipelineRun.objects.get(id=run_id)
+    failed_count = runs.fail_unfinished_course_runs(run)
+    if failed_count:
+        logger.warning('Pipeline run {} timed out with {} unfinished courses'.format(
+            run.id, failed_count))
+    finish_pipeline_run(run.id)
+
+
+@shared_task
+def parallel_populate_daily_metrics(date_for=None, force_update=False, delay=True):
+    '''Populates the daily metrics models for the given date with celery
+    tasks for the courses
+
+    The course tasks run in parallel on the celery workers, the most
+    expensive first, with small courses packed together into shared tasks.
+    See ``figures.pipeline.scheduler``. Each course is retried with backoff
+    if it fails. When every course has finished, or
+    failed after its last attempt, site metrics are populated. Completion is
+    tracked in the ``PipelineRun`` and ``PipelineCourseRun`` models, see
+    ``figures.pipeline.runs``.
+
+    If ``delay`` is False, the courses are populated one at a time in this
+    call.
+
+    This is safe to re-run for the same date. Existing records are kept
+    unless ``force_update`` is True, and only the courses without a record
+    are populated
+
+    Returns the ``PipelineRun`` id, or None if there was nothing to populate
+    '''
     if date_for:
         date_for = as_date(date_for)
     else:
         date_for = datetime.datetime.utcnow().replace(tzinfo=utc).date()
-    date_for = date_for.strftime("%Y-%m-%d")
-    logger.info(
-        'Starting task "figures.experimental_populate_daily_metrics" for date "{}"'.format(
-            date_for))
-
-    courses = CourseOverview.objects.all()
-    cdm_tasks = [
-        populate_single_cdm.s(
-            course_id=unicode(course.id),
-            date_for=date_for,
-            force_update=force_update) for course in courses if include_course(course)
-    ]
-    results = chord(cdm_tasks)(populate_site_daily_metrics.s(
-        date_for=date_for, force_update=force_update))
-
-    # TODO: Are we going to update the SDM for the day if
-    # * course records were created, meaning there are data not added to the SDM
-    # * the SDM record already exists
-    # * force_update is not true
 
     logger.info(
-        'Finished task "figures.experimental_populate_daily_metrics" for date "{}"'.format(
+        'Starting task "figures.parallel_populate_daily_metrics" for date "{}"'.format(
             date_for))
 
-    return results
+    course_ids = get_course_ids_to_populate(date_for, force_update)
+    if is_populated(date_for, course_ids, force_update):
+        logger.info('Daily metrics are already populated for date "{}"'.format(
+            date_for))
+        return None
+
+    site_course_counts = get_course_counts_for_date(date_for)
+    sketches.save_active_user_sketches(date_for, site_course_counts['active_learners'])
+    costs = scheduler.estimate_course_costs(
+        course_ids, site_course_counts['course_counts'], before_date=date_for)
+    batches = scheduler.schedule_courses(costs)
+    run = runs.start_pipeline_run(
+        date_for,
+        [course_id for batch in batches for course_id in batch.course_ids],
+        force_update)
+    course_run_ids = dict(run.course_runs.values_list('course_id', 'id'))
+
+    for batch in batches:
+        kwargs = dict(
+            course_run_ids=[course_run_ids[course_id] for course_id in batch.course_ids],
+            course_counts=dict(
+                (course_id, counts_for_course(site_course_counts, course_id))
+                for course_id in batch.course_ids))
+        if delay:
+            # The time limit is per course, and the batch runs its courses
+            # one after another
+            populate_course_runs.apply_async(
+                kwargs=kwargs,
+                soft_time_limit=(settings.pipeline_course_time_limit() *
+                                 len(batch.course_ids)))
+        else:
+            populate_course_runs(delay=False, **kwargs)
+
+    if not course_ids:
+        finish_pipeline_run(run.id)
+    elif delay:
+        check_pipeline_run.apply_async(
+            args=(run.id,), countdown=settings.pipeline_run_timeout())
+
+    return run.id
@@ -0,0 +1,119 @@
+'''Evaluates metrics for many time periods with one query
+
+The metrics functions used to run an aggregate query for each period, so a
+history of seven months for five metrics was thirty five queries. A metric
+definition here evaluates a list of periods at once. ``AggregateMetric``
+aggregates a model's rows with conditional aggregation, one ``CASE`` per
+period, so all of the periods are a single query::
+
+    TOTAL_SITE_USERS = AggregateMetric(SiteDailyMetrics, 'total_user_count', Max)
+    TOTAL_SITE_USERS.evaluate([(datetime.date(2018, 1, 1), datetime.date(2018, 1, 31)),
+                               (datetime.date(2018, 2, 1), datetime.date(2018, 2, 28))])
+
+``evaluate_metrics`` evaluates several metrics. The aggregate metrics for the
+same model are computed together in one query.
+
+A period is a ``(start_date, end_date)`` tuple. Both dates are included.
+'''
+
+from collections import OrderedDict
+
+from django.db.models import Case, F, When
+
+from figures.helpers import as_date
+
+
+def as_periods(periods):
+    '''Returns the periods with their start and end as dates
+    '''
+    return [(as_date(start_date), as_date(end_date))
+            for start_date, end_date in periods]
+
+
+class AggregateMetric(object):
+    '''A metric aggregated over a model's rows with a date in the period
+
+    ``aggregate`` is a Django aggregate class such as ``Max`` or ``Avg``.
+    ``value`` converts the aggregate to the metric's value. Periods with no
+    rows have the ``default`` value. ``monthly_field`` is the field of the
+    monthly metrics records that has the metric's value for a month, if there
+    is one
+    '''
+    def __init__(self, model, field, aggregate, date_field='date_for',
+                 value=None, default=0, monthly_field=None):
+        self.model = model
+        self.field = field
+        self.aggregate = aggregate
+        self.date_field = date_field
+        self.value = value
+        self.default = default
+        self.monthly_field = monthly_field
+
+    def expression(self, start_date, end_date):
+        '''Returns the aggregate of the field for the rows in the period
+        '''
+        condition = {
+            self.date_field + '__gte': start_date,
+            self.date_field + '__lte': end_date,
+        }
+        return self.aggregate(Case(When(then=F(self.field), **condition)))
+
+    def to_value(self, result):
+        if result is None:
+            return self.default
+        return self.value(result) if self.value else result
+
+    def evaluate(self, periods, **filters):
+        '''Returns the metric's value for each period. The ``filters`` are
+        applied to the model's rows
+        '''
+        return evaluate_aggregates([self], periods, **filters)[0]
+
+
+def evaluate_aggregates(metrics, periods, **filters):
+    '''Evaluates ``AggregateMetric`` objects with one query for each model
+    and date field
+
+    Returns a list with each metric's values for the periods
+    '''
+    periods = as_periods(periods)
+    if not periods:
+        return [[] for metric in metrics]
+    groups = OrderedDict()
+    for index, metric in enumerate(metrics):
+        groups.setdefault((metric.model, metric.date_field), []).append(index)
+
+    results = [None] * len(metrics)
+    for (model, date_field), indexes in groups.items():
+        expressions = {}
+        for index in indexes:
+            for period_index, (start_date, end_date) in enumerate(periods):
+                expressions['m{}_p{}'.format(index, period_index)] = (
+                    metrics[index].expression(start_date, end_date))
+        # Only read the rows in the periods
+        qs = model.objects.filter(**{
+            date_field + '__gte': min(start for start, end in periods),
+            date_field + '__lte': max(end for start, end in periods),
+        }).filter(**filters)
+        row = qs.aggregate(**expressions)
+        for index in indexes:
+            results[index] = [
+                metrics[index].to_value(row['m{}_p{}'.format(index, period_index)])
+                for period_index in range(len(periods))]
+    return results
+
+
+def evaluate_metrics(metrics, periods, **filters):
+    '''Returns a list with each metric's values for the periods
+
+    The aggregate metrics are evaluated together with ``evaluate_aggregates``.
+    Other metrics are evaluated with their ``evaluate(periods, **filters)``
+    method
+    '''
+    aggregates = [metric for metric in metrics if isinstance(metric, AggregateMetric)]
+    aggregate_values = dict(zip(
+        [id(metric) for metric in aggregates],
+        evaluate_aggregates(aggregates, periods, **filters)))
+    return [aggregate_values[id(metric)] if id(metric) in aggregate_values
+            else metric.evaluate(periods, **filters)
+            for metric in metrics]
@@ -19,6 +19,11 @@ router.register(
     views.CourseDailyMetricsViewSet,
     base_name='course-daily-metrics')
 
+router.register(
+    r'pipeline-runs',
+    views.PipelineRunViewSet,
+    base_name='pipeline-runs')
+
 
 # Wrappers around edx-platform models
 router.register(
@@ -4,6 +4,7 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.decorators import user_passes_test
+from django.db.models import Case, Count, IntegerField, Sum, When
 from django.shortcuts import get_object_or_404, render
 from django.views.decorators.csrf import ensure_csrf_cookie
 
@@ -30,10 +31,16 @@ from .filters import (
     CourseDailyMetricsFilter,
     CourseEnrollmentFilter,
     CourseOverviewFilter,
+    PipelineRunFilter,
     SiteDailyMetricsFilter,
     UserFilterSet,
 )
-from .models import CourseDailyMetrics, SiteDailyMetrics
+from .models import (
+    CourseDailyMetrics,
+    PipelineCourseRun,
+    PipelineRun,
+    SiteDailyMetrics,
+)
 from .serializers import (
     CourseDailyMetricsSerializer,
     CourseDetailsSerializer,
@@ -42,11 +49,14 @@ from .serializers import (
     GeneralCourseDataSerializer,
 
     LearnerDetailsSerializer,
+    PipelineRunDetailsSerializer,
+    PipelineRunSerializer,
     SiteDailyMetricsSerializer,
     UserIndexSerializer,
     GeneralUserDataSerializer
 )
 from figures import metrics
+from figures.cache import cached_site_metrics
 from figures.pagination import FiguresLimitOffsetPagination
 from figures.permissions import IsStaffUser
 
@@ -191,6 +201,43 @@ class SiteDailyMetricsViewSet(CommonAuthMixin, viewsets.ModelViewSet):
         return queryset
 
 
+class PipelineRunViewSet(CommonAuthMixin, viewsets.ReadOnlyModelViewSet):
+    '''Provides the pipeline run history
+
+    The list gives each run with totals over its courses. The detail view
+    adds the ledger entry for each course
+    '''
+    model = PipelineRun
+    queryset = PipelineRun.objects.all()
+    pagination_class = FiguresLimitOffsetPagination
+    serializer_class = PipelineRunSerializer
+    filter_backends = (DjangoFilterBackend, )
+    filter_class = PipelineRunFilter
+
+    def get_queryset(self):
+        queryset = super(PipelineRunViewSet, self).get_queryset()
+
+        def count_status(status):
+            return Sum(Case(When(course_runs__status=status, then=1),
+                            default=0, output_field=IntegerField()))
+
+        return queryset.annotate(
+            course_count=Count('course_runs'),
+            courses_complete=count_status(PipelineCourseRun.COMPLETE),
+            courses_failed=count_status(PipelineCourseRun.FAILED),
+            courses_partial=Sum(Case(When(course_runs__partial=True, then=1),
+                                     default=0, output_field=IntegerField())),
+            learners_processed=Sum('course_runs__learners_processed'),
+            error_count=Sum('course_runs__error_count'),
+            course_query_count=Sum('course_runs__query_count'),
+        )
+
+    def get_serializer_class(self):
+        if self.action == 'retrieve':
+            return PipelineRunDetailsSerializer
+        return super(PipelineRunViewSet, self).get_serializer_class()
+
+
 #
 # Views for the front end
 #
@@ -221,7 +268,8 @@ class GeneralSiteMetricsView(CommonAuthMixin, APIView):
 
         date_for = request.query_params.get('date_for')
 
-        data = self.metrics_method(date_for=date_for)
+        # The metrics are cached until the pipeline writes new metrics
+        data = cached_site_metrics(self.metrics_method, date_for=date_for)
 
         if not data:
             data = {
@@ -0,0 +1,125 @@
+'''Fixed size synthetic dataset for the API benchmarks
+
+The edx-platform data are generated with the devsite seeder, then each
+course gets a history of ``CourseDailyMetrics`` and each enrollment a few
+``LearnerCourseGradeMetrics`` snapshots. The daily active users sketches are
+written from the seeded courseware activity and the monthly metrics are
+rolled up, as the pipeline would. The sizes are fixed so the query
+counts are the same from run to run. The dates end today, because the course
+and site history endpoints count back from today.
+'''
+
+from collections import defaultdict
+import datetime
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.utils.timezone import utc
+
+from openedx.core.djangoapps.content.course_overviews.models import (
+    CourseOverview,
+)
+from courseware.models import StudentModule
+from student.models import CourseEnrollment
+
+from devsite.seed import seed_data
+
+from figures.pipeline.bulk import BulkUpserter
+from figures.pipeline.monthly_metrics import update_monthly_metrics
+from figures.pipeline.sketches import add_active_user_sketches
+
+from figures.models import (
+    ActiveUsersSketch,
+    CourseDailyMetrics,
+    LearnerCourseGradeMetrics,
+    PipelineCourseRun,
+    PipelineRun,
+    SiteDailyMetrics,
+)
+
+
+USERS = 60
+COURSES = 6
+ENROLLMENTS = 240
+
+# Days of daily metrics history
+HISTORY_DAYS = 90
+
+# Days between a learner's grade snapshots, and the number of snapshots
+SNAPSHOT_INTERVAL_DAYS = 7
+SNAPSHOTS = 4
+
+SEED = 21
+
+
+def seed_benchmark_data():
+    '''Creates the dataset. Returns the last date of the history
+    '''
+    end_date = datetime.datetime.utcnow().replace(tzinfo=utc).date()
+    seed_data(users=USERS, courses=COURSES, enrollments=ENROLLMENTS,
+              days=HISTORY_DAYS * 2, end_date=end_date, seed=SEED)
+    dates = [end_date - datetime.timedelta(days=days)
+             for days in range(HISTORY_DAYS, 0, -1)]
+    course_ids = [str(course_id) for course_id in
+                  CourseOverview.objects.values_list('id', flat=True)]
+
+    CourseDailyMetrics.objects.bulk_create([
+        CourseDailyMetrics(
+            course_id=course_id,
+            date_for=date_for,
+            enrollment_count=ENROLLMENTS // COURSES,
+            active_learners_today=i % 7,
+            average_progress=Decimal('0.{:02d}'.format(i % 100)),
+            average_days_to_complete=10 + i % 20,
+            num_learners_completed=i // 10)
+        for course_id in course_ids
+        for i, date_for in enumerate(dates)])
+
+    SiteDailyMetrics.objects.bulk_create([
+        SiteDailyMetrics(
+            date_for=date_for,
+            cumulative_active_user_count=i * 5,
+            todays_active_user_count=5,
+            total_user_count=USERS,
+            course_count=COURSES,
+            total_enrollment_count=ENROLLMENTS)
+        for i, date_for in enumerate(dates)])
+
+    course_user_ids = dict((date_for, defaultdict(set)) for date_for in dates)
+    for course_id, student_id, modified in StudentModule.objects.values_list(
+            'course_id', 'student_id', 'modified'):
+        if modified.date() in course_user_ids:
+            course_user_ids[modified.date()][str(course_id)].add(student_id)
+    with BulkUpserter(ActiveUsersSketch) as writer:
+        for date_for, user_ids in course_user_ids.items():
+            add_active_user_sketches(writer, date_for, user_ids,
+                                     set().union(*user_ids.values()))
+
+    LearnerCourseGradeMetrics.objects.bulk_create([
+        LearnerCourseGradeMetrics(
+            user_id=user_id,
+            course_id=str(course_id),
+            date_for=end_date - datetime.timedelta(
+                days=SNAPSHOT_INTERVAL_DAYS * (snapshot + 1)),
+            points_possible=10.0,
+            points_earned=float(SNAPSHOTS - snapshot),
+            sections_worked=SNAPSHOTS - snapshot,
+            sections_possible=10)
+        for user_id, course_id in CourseEnrollment.objects.values_list(
+            'user_id', 'course_id')
+        for snapshot in range(SNAPSHOTS)])
+
+    update_monthly_metrics(dates[0], dates[-1])
+
+    run = PipelineRun.objects.create(
+        date_for=dates[-1], status=PipelineRun.COMPLETE)
+    PipelineCourseRun.objects.bulk_create([
+        PipelineCourseRun(run=run, course_id=course_id,
+                          status=PipelineCourseRun.COMPLETE)
+        for course_id in course_ids])
+    return end_date
+
+
+def benchmark_caller():
+    return get_user_model().objects.create(
+        username='benchmark_staff', is_staff=True)
@@ -0,0 +1,141 @@
+'''Query count and latency benchmarks for the Figures API
+
+Each route in ``figures.urls`` is requested with the fixed dataset in
+``tests.benchmarks.dataset``. The list endpoints are requested at each of
+``PAGE_SIZES``. A test fails when its endpoint makes more queries, or takes
+more seconds, than the budget for it in ``budgets.json``. An endpoint with no
+budget of its own only has the default time budget.
+
+To record the measurements, set ``FIGURES_BENCHMARK_RESULTS`` to a file path.
+The results are written there as JSON, in the same form as the budgets'
+``endpoints``, so a new baseline can be copied into ``budgets.json``::
+
+    FIGURES_BENCHMARK_RESULTS=/tmp/benchmarks.json pytest tests/benchmarks
+'''
+
+from collections import OrderedDict
+import json
+import os
+import time
+
+import pytest
+
+from django.core.urlresolvers import resolve, reverse
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from student.models import CourseEnrollment
+
+from figures.cache import get_cache
+from figures.models import CourseDailyMetrics, PipelineRun, SiteDailyMetrics
+from figures.pipeline.instrumentation import count_queries
+
+from tests.benchmarks.dataset import benchmark_caller, seed_benchmark_data
+
+
+BUDGETS_PATH = os.path.join(os.path.dirname(__file__), 'budgets.json')
+
+PAGE_SIZES = [1, 10, 50]
+
+
+def course_pk():
+    return str(CourseEnrollment.objects.order_by('id').first().course_id)
+
+
+def user_pk():
+    return CourseEnrollment.objects.order_by('id').first().user_id
+
+
+# (url name, function returning the detail pk, or None for routes without one)
+LIST_ROUTES = [
+    ('api:site-daily-metrics', lambda: SiteDailyMetrics.objects.latest('date_for').pk),
+    ('api:course-daily-metrics', lambda: CourseDailyMetrics.objects.latest('date_for').pk),
+    ('api:pipeline-runs', lambda: PipelineRun.objects.latest('date_for').pk),
+    ('api:course-enrollments', lambda: CourseEnrollment.objects.order_by('id').first().pk),
+    ('api:courses-index', course_pk),
+    ('api:courses-general', course_pk),
+    ('api:courses-detail', course_pk),
+    ('api:users-general', user_pk),
+    ('api:users-detail', user_pk),
+    ('api:user-index', user_pk),
+]
+
+OTHER_ROUTES = ['figures-home', 'api:api-root', 'general-site-metrics']
+
+
+def benchmark_cases():
+    '''Returns ``(name, url name, pk function, page size)`` for each request
+    '''
+    cases = [(url_name, url_name, None, None) for url_name in OTHER_ROUTES]
+    for url_name, pk_func in LIST_ROUTES:
+        for page_size in PAGE_SIZES:
+            cases.append(('{}-list?limit={}'.format(url_name, page_size),
+                          url_name + '-list', None, page_size))
+        cases.append((url_name + '-detail', url_name + '-detail', pk_func, None))
+    return cases
+
+
+def load_budgets():
+    with open(BUDGETS_PATH) as f:
+        return json.load(f)
+
+
+@pytest.fixture(scope='module')
+def benchmark_results():
+    '''Collects the measurements and writes them at the end of the module
+    '''
+    results = OrderedDict()
+    yield results
+    path = os.environ.get('FIGURES_BENCHMARK_RESULTS')
+    if path:
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+@pytest.mark.django_db
+class TestAPIBenchmarks(object):
+
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        # Measure the uncached responses
+        get_cache().clear()
+        seed_benchmark_data()
+        self.caller = benchmark_caller()
+
+    def get(self, path, data):
+        '''Calls the view for the path and renders the response
+
+        The test settings have no middleware, so the request is
+        authenticated here for both the Django and the REST framework views
+        '''
+        request = APIRequestFactory().get(path, data)
+        request.user = self.caller
+        force_authenticate(request, user=self.caller)
+        match = request.resolver_match = resolve(path)
+        response = match.func(request, *match.args, **match.kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    @pytest.mark.parametrize('name, url_name, pk_func, page_size', benchmark_cases())
+    def test_endpoint(self, benchmark_results, name, url_name, pk_func, page_size):
+        kwargs = dict(pk=pk_func()) if pk_func else {}
+        path = reverse(url_name, kwargs=kwargs)
+        data = dict(limit=page_size) if page_size else {}
+
+        start = time.time()
+        with count_queries() as counter:
+            response = self.get(path, data)
+        seconds = time.time() - start
+
+        benchmark_results[name] = OrderedDict([
+            ('query_count', counter.count), ('seconds', round(seconds, 3))])
+        assert response.status_code == 200
+        budgets = load_budgets()
+        budget = budgets['endpoints'].get(name, {})
+        max_seconds = budget.get('max_seconds', budgets['max_seconds'])
+        assert seconds <= max_seconds, '{} took {:.2f} seconds. Budget is {}'.format(
+            name, seconds, max_seconds)
+        if 'max_queries' in budget:
+            assert counter.count <= budget['max_queries'], (
+                '{} made {} queries. Budget is {}'.format(
+                    name, counter.count, budget['max_queries']))
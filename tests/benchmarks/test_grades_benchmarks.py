@@ -0,0 +1,93 @@
+'''Benchmarks for the grades pass
+
+Grades every enrollment in one course, first one learner at a time with
+``LearnerCourseGrades.course_progress``, which loads the course for each
+learner, then with ``get_average_progress``, which loads the course once in a
+``CourseGradingSession``. The course loads and queries are asserted. To see
+the measurements, run with ``-s``::
+
+    pytest -s tests/benchmarks/test_grades_benchmarks.py
+
+The test mocks' modulestore is nearly free, so on a real modulestore the time
+saved per course load is much larger than the times measured here.
+'''
+
+from __future__ import print_function
+
+import datetime
+import time
+
+import mock
+import pytest
+
+from courseware.courses import get_course_by_id
+from student.models import CourseEnrollment
+
+import figures.metrics
+from figures.pipeline import course_daily_metrics as pipeline_cdm
+from figures.pipeline.instrumentation import count_queries
+
+from tests.factories import CourseEnrollmentFactory, CourseOverviewFactory
+
+
+ENROLLMENTS = 200
+
+# Query budget for grading the course. The enrollments and their users are
+# selected up front and the grades are written in bulk, so the queries do
+# not grow with the number of learners
+MAX_QUERIES = 5
+
+
+def measure(func):
+    '''Returns ``(course loads, queries, seconds)`` for calling ``func``
+    '''
+    with mock.patch('figures.metrics.get_course_by_id',
+                    wraps=get_course_by_id) as mock_get_course:
+        start = time.time()
+        with count_queries() as counter:
+            func()
+        seconds = time.time() - start
+    return mock_get_course.call_count, counter.count, seconds
+
+
+@pytest.mark.django_db
+class TestGradesPassBenchmark(object):
+
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        self.date_for = datetime.date(2018, 6, 1)
+        self.course_overview = CourseOverviewFactory()
+        for i in range(ENROLLMENTS):
+            CourseEnrollmentFactory(course_id=self.course_overview.id)
+
+    def course_enrollments(self):
+        return CourseEnrollment.objects.filter(
+            course_id=self.course_overview.id).select_related('user')
+
+    def test_course_loaded_once(self):
+        def grade_each():
+            for ce in self.course_enrollments():
+                figures.metrics.LearnerCourseGrades.course_progress(ce)
+
+        def grade_in_session():
+            pipeline_cdm.get_average_progress(
+                course_id=self.course_overview.id,
+                date_for=self.date_for,
+                course_enrollments=self.course_enrollments(),
+                incremental=False,
+                time_budget=0)
+
+        results = [('each', measure(grade_each)),
+                   ('session', measure(grade_in_session))]
+        for name, (course_loads, queries, seconds) in results:
+            print('{}: {:.3f} course loads/learner, {:.3f} queries/learner, '
+                  '{:.2f} ms/learner'.format(
+                      name,
+                      float(course_loads) / ENROLLMENTS,
+                      float(queries) / ENROLLMENTS,
+                      1000 * seconds / ENROLLMENTS))
+
+        each, session = [measurements for name, measurements in results]
+        assert each[0] == ENROLLMENTS
+        assert session[0] == 1
+        assert session[1] <= MAX_QUERIES
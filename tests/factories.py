@@ -27,7 +27,11 @@ from student.models import CourseAccessRole, CourseEnrollment, UserProfile
 from lms.djangoapps.teams.models import CourseTeam, CourseTeamMembership
 
 from figures.helpers import as_course_key
-from figures.models import CourseDailyMetrics, SiteDailyMetrics
+from figures.models import (
+    CourseDailyMetrics,
+    LearnerCourseGradeMetrics,
+    SiteDailyMetrics,
+)
 
 COURSE_ID_STR_TEMPLATE = 'course-v1:StarFleetAcademy+SFA{}+2161'
 
@@ -183,3 +187,17 @@ class SiteDailyMetricsFactory(DjangoModelFactory):
     course_count = factory.Sequence(lambda n: n)
     total_enrollment_count = factory.Sequence(lambda n: n)
     #site = factory.RelatedFactory(SiteFactory, 'site')
+
+
+class LearnerCourseGradeMetricsFactory(DjangoModelFactory):
+    class Meta:
+        model = LearnerCourseGradeMetrics
+    date_for = factory.Sequence(lambda n:
+        (datetime.datetime(2018, 1, 1) + datetime.timedelta(days=n)).replace(tzinfo=utc).date())
+    user = factory.SubFactory(UserFactory)
+    course_id = factory.Sequence(lambda n:
+        'course-v1:StarFleetAcademy+SFA{}+2161'.format(n))
+    points_possible = 10.0
+    points_earned = 5.0
+    sections_worked = 1
+    sections_possible = 4
@@ -9,7 +9,9 @@ from django.utils.timezone import utc
 import mock
 import pytest
 
-from figures.metrics import LearnerCourseGrades
+from courseware.courses import get_course_by_id
+
+from figures.metrics import CourseGradingSession, LearnerCourseGrades
 
 from tests.factories import (
     CourseEnrollmentFactory,
@@ -210,3 +212,45 @@ def test_lcg_course_progress():
     course_enrollment = CourseEnrollmentFactory()
     course_progress = LearnerCourseGrades.course_progress(course_enrollment)
     assert course_progress == expected
+
+
+#
+# Test CourseGradingSession
+#
+
+
+@pytest.mark.django_db
+class TestCourseGradingSession(object):
+
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        self.course_enrollment = CourseEnrollmentFactory()
+        self.course_enrollments = [self.course_enrollment] + [
+            CourseEnrollmentFactory(
+                course_overview=self.course_enrollment.course_overview)
+            for i in range(3)]
+
+    def test_course_loaded_once(self):
+        '''The course descriptor is loaded once for all learners graded in
+        the session
+        '''
+        course_id = self.course_enrollment.course_id
+        with mock.patch('figures.metrics.get_course_by_id',
+                        wraps=get_course_by_id) as mock_get_course:
+            session = CourseGradingSession(course_id)
+            for ce in self.course_enrollments:
+                session.course_progress(ce)
+        assert mock_get_course.call_count == 1
+
+    def test_course_progress(self):
+        '''Grading in a session matches grading a single learner
+        '''
+        session = CourseGradingSession(self.course_enrollment.course_id)
+        assert session.course_progress(self.course_enrollment) == (
+            LearnerCourseGrades.course_progress(self.course_enrollment))
+
+    def test_learner_course_grades(self):
+        session = CourseGradingSession(self.course_enrollment.course_id)
+        lcg = session.learner_course_grades(self.course_enrollment)
+        assert lcg.course is session.course
+        assert lcg.learner == self.course_enrollment.user
@@ -33,8 +33,11 @@ import pytest
 from django.utils.timezone import utc
 
 from figures import metrics
+from figures.hll import HyperLogLog
+from figures.models import ActiveUsersSketch
 
 from tests.factories import (
+    CourseAccessRoleFactory,
     CourseDailyMetricsFactory,
     CourseOverviewFactory,
     SiteDailyMetricsFactory,
@@ -245,6 +248,64 @@ class TestSiteMetricsGetters(object):
             end_date=self.data_end_date)
         assert count == len(student_module_sets)
 
+    def test_get_active_users_for_time_period_from_sketches(self):
+        '''The sketches cover January 1 through 20. The learners active on
+        the other days are counted from the StudentModule records, once each
+        and without the course staff
+        '''
+        course_overview = CourseOverviewFactory()
+        users = [UserFactory() for i in range(5)]
+        for day in range(20):
+            user_ids = [user.id for user in users[:2]] if day == 0 else []
+            ActiveUsersSketch.objects.create(
+                date_for=datetime.date(2018, 1, 1) + datetime.timedelta(days=day),
+                course_id='',
+                sketch=HyperLogLog().update(user_ids).to_bytes(),
+                user_count=len(user_ids))
+        CourseAccessRoleFactory(user=users[4], course_id=course_overview.id,
+                                role='staff')
+        # Users 1 and 2 are active on uncovered days. The covered day's
+        # activity of user 3 is in the sketch, which has no one on the day
+        for user, modified in [
+                (users[1], datetime.datetime(2018, 1, 25, 12, tzinfo=utc)),
+                (users[2], datetime.datetime(2018, 1, 31, 23, tzinfo=utc)),
+                (users[3], datetime.datetime(2018, 1, 10, 12, tzinfo=utc)),
+                (users[4], datetime.datetime(2018, 1, 25, 12, tzinfo=utc))]:
+            StudentModuleFactory(student=user, course_id=course_overview.id,
+                                 created=modified, modified=modified)
+
+        assert metrics.get_active_users_for_time_period(
+            start_date=datetime.date(2018, 1, 1),
+            end_date=datetime.date(2018, 1, 31)) == 3
+        assert metrics.get_active_users_for_time_period(
+            start_date=datetime.date(2018, 1, 1),
+            end_date=datetime.date(2018, 1, 31),
+            course_ids=[course_overview.id]) == 2
+        assert metrics.get_active_users_for_time_period(
+            start_date=datetime.date(2018, 1, 1),
+            end_date=datetime.date(2018, 1, 31),
+            calc_raw=True) == 4
+
+    def test_get_active_users_for_time_period_for_courses(self):
+        course_ids = ['course-v1:FigX+A01+2018', 'course-v1:FigX+B01+2018']
+        date_for = datetime.date(2018, 1, 10)
+        ActiveUsersSketch.objects.create(
+            date_for=date_for,
+            course_id='',
+            sketch=HyperLogLog().update(range(200)).to_bytes(),
+            user_count=200)
+        for course_id, user_ids in zip(course_ids + ['course-v1:FigX+C01+2018'],
+                                       [range(10), range(5, 15), range(100, 200)]):
+            ActiveUsersSketch.objects.create(
+                date_for=date_for,
+                course_id=course_id,
+                sketch=HyperLogLog().update(user_ids).to_bytes(),
+                user_count=len(user_ids))
+        assert metrics.get_active_users_for_time_period(
+            start_date=self.data_start_date,
+            end_date=self.data_end_date,
+            course_ids=course_ids) == 15
+
     def test_get_total_site_users_for_time_period(self):
         '''
         TODO: add users who joined before and after the time period, and
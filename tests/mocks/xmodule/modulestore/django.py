@@ -51,6 +51,18 @@ class MockMixedModulestore(object):
     def get_course(self, course_id, depth):
         return MockCourse(course_locator=course_id)
 
+_MIXED_MODULESTORE = None
+
+
+def clear_existing_modulestores():
+    '''
+    Clears the modulestore, so the next call to ``modulestore`` creates a
+    new one
+    '''
+    global _MIXED_MODULESTORE  # pylint: disable=global-statement
+    _MIXED_MODULESTORE = None
+
+
 def modulestore():
     '''
     Need to mock:
@@ -68,4 +80,7 @@ def modulestore():
     #     settings.MODULESTORE['default'].get('OPTIONS', {})
     # )
 
-    return MockMixedModulestore()
+    global _MIXED_MODULESTORE  # pylint: disable=global-statement
+    if _MIXED_MODULESTORE is None:
+        _MIXED_MODULESTORE = MockMixedModulestore()
+    return _MIXED_MODULESTORE
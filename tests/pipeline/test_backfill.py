@@ -0,0 +1,210 @@
+'''Tests figures.pipeline.backfill
+
+The backfill results are checked against the extractors used by the daily
+pipeline
+'''
+
+import datetime
+import pytest
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.utils.six import StringIO
+
+from figures.helpers import as_datetime, next_day, prev_day
+from figures.hll import HyperLogLog
+from figures.models import (
+    ActiveUsersSketch,
+    CourseDailyMetrics,
+    SiteDailyMetrics,
+    SiteMonthlyMetrics,
+)
+from figures.pipeline import backfill
+from figures.pipeline import course_daily_metrics as pipeline_cdm
+from figures.pipeline.site_extractors import get_active_learners_for_date
+
+from tests.factories import (
+    CourseAccessRoleFactory,
+    CourseDailyMetricsFactory,
+    CourseEnrollmentFactory,
+    CourseOverviewFactory,
+    GeneratedCertificateFactory,
+    LearnerCourseGradeMetricsFactory,
+    SiteDailyMetricsFactory,
+    StudentModuleFactory,
+    UserFactory,
+)
+
+
+def test_sweep():
+    events = [(as_datetime(datetime.date(2018, 1, day)), day) for day in [1, 1, 3, 9]]
+    added = []
+    days = []
+    for date_for in backfill.sweep(
+            events, datetime.date(2018, 1, 2), datetime.date(2018, 1, 4),
+            lambda event: added.append(event[1])):
+        days.append((date_for, list(added)))
+    assert days == [
+        (datetime.date(2018, 1, 2), [1, 1]),
+        (datetime.date(2018, 1, 3), [1, 1, 3]),
+        (datetime.date(2018, 1, 4), [1, 1, 3]),
+    ]
+
+
+@pytest.mark.django_db
+class TestBackfillDailyMetrics(object):
+    '''Builds a small site's history over a few days
+    '''
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        self.start_date = datetime.date(2018, 6, 1)
+        self.end_date = datetime.date(2018, 6, 4)
+        # One course exists before the range and one is created during it
+        self.course_overviews = [
+            CourseOverviewFactory(created=as_datetime(datetime.date(2018, 1, 1))),
+            CourseOverviewFactory(created=as_datetime(datetime.date(2018, 6, 3))),
+        ]
+        UserFactory(date_joined=as_datetime(datetime.date(2018, 1, 1)))
+        UserFactory(date_joined=as_datetime(datetime.date(2018, 6, 2)))
+        self.course_enrollments = []
+        for course, days in [(0, [-20, -10, 1, 2]), (1, [2, 3])]:
+            for day in days:
+                self.course_enrollments.append(CourseEnrollmentFactory(
+                    course_overview=self.course_overviews[course],
+                    created=(as_datetime(self.start_date) +
+                             datetime.timedelta(days=day, hours=6))))
+        for ce, day in [(self.course_enrollments[0], 0),
+                        (self.course_enrollments[1], 2),
+                        (self.course_enrollments[4], 3)]:
+            GeneratedCertificateFactory(
+                user=ce.user,
+                course_id=ce.course_id,
+                created_date=(as_datetime(self.start_date) +
+                              datetime.timedelta(days=day, hours=12)))
+        for ce, day in [(self.course_enrollments[0], 0),
+                        (self.course_enrollments[2], 1),
+                        (self.course_enrollments[4], 3)]:
+            StudentModuleFactory(
+                student=ce.user,
+                course_id=ce.course_id,
+                modified=(as_datetime(self.start_date) +
+                          datetime.timedelta(days=day, hours=8)))
+        # A learner in the first course is on its staff, so is not counted
+        CourseAccessRoleFactory(
+            user=self.course_enrollments[2].user,
+            course_id=self.course_overviews[0].id,
+            role='staff')
+        # The first course's first learner is also active in the second course
+        StudentModuleFactory(
+            student=self.course_enrollments[0].user,
+            course_id=self.course_overviews[1].id,
+            modified=as_datetime(self.end_date))
+
+    def test_matches_daily_extractors(self):
+        results = backfill.backfill_daily_metrics(self.start_date, self.end_date)
+        assert results['course_daily_metrics'] == 6
+        assert results['site_daily_metrics'] == 4
+        assert results['active_users_sketches'] == ActiveUsersSketch.objects.count()
+        assert results['course_monthly_metrics'] == 2
+        assert results['site_monthly_metrics'] == 1
+        assert SiteMonthlyMetrics.objects.get().total_user_count == max(
+            SiteDailyMetrics.objects.values_list('total_user_count', flat=True))
+
+        for cdm in CourseDailyMetrics.objects.all():
+            days = pipeline_cdm.get_days_to_complete(
+                cdm.course_id, cdm.date_for)['days']
+            stats = pipeline_cdm.calc_days_to_complete_stats(days)
+            assert cdm.enrollment_count == pipeline_cdm.get_learner_enrollment_count(
+                cdm.course_id, cdm.date_for)
+            assert cdm.active_learners_today == (
+                pipeline_cdm.get_active_learner_ids_today(
+                    cdm.course_id, cdm.date_for).count())
+            assert cdm.num_learners_completed == (
+                pipeline_cdm.get_num_learners_completed(
+                    cdm.course_id, cdm.date_for))
+            assert cdm.average_days_to_complete == int(stats['average'])
+            assert cdm.days_to_complete_median == stats['median']
+            assert cdm.days_to_complete_p90 == stats['p90']
+            assert cdm.days_to_complete_histogram == stats['histogram']
+            assert cdm.average_progress is None
+
+        cumulative_active_user_count = 0
+        for sdm in SiteDailyMetrics.objects.order_by('date_for'):
+            active_learners = get_active_learners_for_date(sdm.date_for)
+            todays_active_user_count = active_learners['site_count']
+            sketch = ActiveUsersSketch.objects.get(course_id='', date_for=sdm.date_for)
+            assert sketch.user_count == todays_active_user_count
+            assert HyperLogLog.from_bytes(sketch.sketch).count() == todays_active_user_count
+            for course_id, count in active_learners['course_counts'].items():
+                assert ActiveUsersSketch.objects.get(
+                    course_id=course_id, date_for=sdm.date_for).user_count == count
+            cumulative_active_user_count += todays_active_user_count
+            assert sdm.todays_active_user_count == todays_active_user_count
+            assert sdm.cumulative_active_user_count == cumulative_active_user_count
+            assert sdm.total_user_count == get_user_model().objects.filter(
+                date_joined__lt=as_datetime(next_day(sdm.date_for))).count()
+            assert sdm.course_count == (
+                1 if sdm.date_for < datetime.date(2018, 6, 3) else 2)
+            assert sdm.total_enrollment_count == sum(
+                CourseDailyMetrics.objects.filter(
+                    date_for=sdm.date_for).values_list('enrollment_count', flat=True))
+
+    def test_second_course_starts_when_created(self):
+        backfill.backfill_daily_metrics(self.start_date, self.end_date)
+        dates = CourseDailyMetrics.objects.filter(
+            course_id=str(self.course_overviews[1].id)).values_list(
+            'date_for', flat=True)
+        assert list(dates) == [datetime.date(2018, 6, 3), datetime.date(2018, 6, 4)]
+
+    def test_average_progress_from_learner_grades(self):
+        course_id = str(self.course_overviews[0].id)
+        for sections_worked in [1, 2]:
+            LearnerCourseGradeMetricsFactory(
+                course_id=course_id,
+                date_for=self.start_date,
+                sections_worked=sections_worked,
+                sections_possible=4)
+        backfill.backfill_daily_metrics(self.start_date, self.end_date)
+        cdm = CourseDailyMetrics.objects.get(
+            course_id=course_id, date_for=self.start_date)
+        assert float(cdm.average_progress) == pytest.approx(0.38, abs=0.01)
+        assert CourseDailyMetrics.objects.get(
+            course_id=course_id,
+            date_for=next_day(self.start_date)).average_progress is None
+
+    def test_keeps_existing_records(self):
+        course_id = str(self.course_overviews[0].id)
+        cdm = CourseDailyMetricsFactory(
+            course_id=course_id, date_for=self.start_date, enrollment_count=99)
+        SiteDailyMetricsFactory(
+            date_for=prev_day(self.start_date), cumulative_active_user_count=10)
+        SiteDailyMetricsFactory(
+            date_for=next_day(self.start_date), cumulative_active_user_count=50)
+        results = backfill.backfill_daily_metrics(self.start_date, self.end_date)
+        assert results['course_daily_metrics'] == 5
+        assert results['site_daily_metrics'] == 3
+        cdm.refresh_from_db()
+        assert cdm.enrollment_count == 99
+        # The running cumulative count picks up from the existing records
+        assert SiteDailyMetrics.objects.get(
+            date_for=self.start_date).cumulative_active_user_count == 11
+        assert SiteDailyMetrics.objects.get(
+            date_for=datetime.date(2018, 6, 4)).cumulative_active_user_count == 52
+
+    def test_force_update(self):
+        course_id = str(self.course_overviews[0].id)
+        cdm = CourseDailyMetricsFactory(
+            course_id=course_id, date_for=self.start_date, enrollment_count=99)
+        backfill.backfill_daily_metrics(
+            self.start_date, self.end_date, force_update=True)
+        cdm.refresh_from_db()
+        assert cdm.enrollment_count == 2
+
+    def test_command(self):
+        out = StringIO()
+        call_command('backfill_figures_metrics',
+                     '--start={}'.format(self.start_date),
+                     '--end={}'.format(self.end_date),
+                     stdout=out)
+        assert CourseDailyMetrics.objects.count() == 6
+        assert SiteDailyMetrics.objects.count() == 4
@@ -0,0 +1,102 @@
+"""Tests the bulk upsert layer used by the pipeline loaders
+
+Each test runs with the native upsert and with the select-then-write
+fallback
+"""
+
+import datetime
+import mock
+import pytest
+
+from figures.models import LearnerCourseGradeMetrics, SiteDailyMetrics
+from figures.pipeline.bulk import BulkUpserter, upsert
+
+from tests.factories import LearnerCourseGradeMetricsFactory, UserFactory
+
+
+@pytest.fixture(params=[True, False], ids=['native', 'fallback'])
+def native_upsert(request):
+    with mock.patch('figures.pipeline.bulk.supports_native_upsert',
+                    return_value=request.param):
+        yield request.param
+
+
+def lcgm_row(user, date_for, **kwargs):
+    row = dict(
+        user_id=user.id,
+        course_id='course-v1:StarFleetAcademy+SFA01+2161',
+        date_for=date_for,
+        points_possible=10.0,
+        points_earned=5.0,
+        sections_worked=1,
+        sections_possible=4,
+    )
+    row.update(kwargs)
+    return row
+
+
+@pytest.mark.django_db
+class TestBulkUpserter(object):
+
+    @pytest.fixture(autouse=True)
+    def setup(self, db, native_upsert):
+        self.date_for = datetime.date(2018, 6, 1)
+        self.users = [UserFactory() for i in range(5)]
+
+    def test_insert(self):
+        with BulkUpserter(LearnerCourseGradeMetrics) as writer:
+            for user in self.users:
+                writer.add(**lcgm_row(user, self.date_for))
+            assert LearnerCourseGradeMetrics.objects.count() == 0
+        assert writer.rows_written == len(self.users)
+        assert LearnerCourseGradeMetrics.objects.count() == len(self.users)
+
+    def test_update_existing(self):
+        existing = LearnerCourseGradeMetricsFactory(
+            user=self.users[0],
+            course_id='course-v1:StarFleetAcademy+SFA01+2161',
+            date_for=self.date_for,
+            sections_worked=1)
+        with BulkUpserter(LearnerCourseGradeMetrics) as writer:
+            for user in self.users:
+                writer.add(**lcgm_row(user, self.date_for, sections_worked=3))
+        assert LearnerCourseGradeMetrics.objects.count() == len(self.users)
+        updated = LearnerCourseGradeMetrics.objects.get(id=existing.id)
+        assert updated.sections_worked == 3
+        assert updated.created == existing.created
+        assert updated.modified > existing.modified
+
+    def test_last_added_wins(self):
+        with BulkUpserter(LearnerCourseGradeMetrics) as writer:
+            writer.add(**lcgm_row(self.users[0], self.date_for, sections_worked=1))
+            writer.add(**lcgm_row(self.users[0], self.date_for, sections_worked=2))
+            assert len(writer) == 1
+        assert LearnerCourseGradeMetrics.objects.get().sections_worked == 2
+
+    def test_flush_when_full(self):
+        writer = BulkUpserter(LearnerCourseGradeMetrics,
+                              batch_size=2, transaction_size=3)
+        for user in self.users:
+            writer.add(**lcgm_row(user, self.date_for))
+        assert LearnerCourseGradeMetrics.objects.count() == 3
+        assert len(writer) == 2
+        writer.flush()
+        assert LearnerCourseGradeMetrics.objects.count() == len(self.users)
+
+    def test_no_flush_on_error(self):
+        with pytest.raises(ValueError):
+            with BulkUpserter(LearnerCourseGradeMetrics) as writer:
+                writer.add(**lcgm_row(self.users[0], self.date_for))
+                raise ValueError('mock-failure')
+        assert LearnerCourseGradeMetrics.objects.count() == 0
+
+    def test_upsert_unique_fields(self):
+        row = dict(
+            date_for=self.date_for,
+            total_user_count=1,
+            course_count=2,
+            total_enrollment_count=3)
+        assert upsert(SiteDailyMetrics, [row], unique_fields=['date_for']) == 1
+        row['total_user_count'] = 10
+        upsert(SiteDailyMetrics, [row], unique_fields=['date_for'])
+        assert SiteDailyMetrics.objects.get().total_user_count == 10
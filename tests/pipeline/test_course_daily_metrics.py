@@ -3,22 +3,36 @@
 """
 
 import datetime
+import itertools
 import mock
 import pytest
 
 from django.core.exceptions import PermissionDenied
+from django.http import Http404
 
 from student.models import CourseEnrollment, CourseAccessRole
 
 from figures.helpers import as_datetime, next_day, prev_day
-from figures.models import PipelineError
+import figures.metrics
+from figures.models import (
+    CourseDaysToCompleteAggregate,
+    LearnerCourseGradeMetrics,
+    PipelineError,
+)
 from figures.pipeline import course_daily_metrics as pipeline_cdm
+from figures.pipeline import sampling
+from figures.pipeline.instrumentation import (
+    MemorySpanSink,
+    PipelineStats,
+    span_sink,
+)
 
 from tests.factories import (
     CourseAccessRoleFactory,
     CourseEnrollmentFactory,
     CourseOverviewFactory,
     GeneratedCertificateFactory,
+    LearnerCourseGradeMetricsFactory,
     StudentModuleFactory,
 )
 
@@ -75,8 +89,12 @@ class TestCourseDailyMetricsPipelineFunctions(object):
     def setup(self, db):
         self.today = datetime.date(2018, 6, 1)
         self.course_overview = CourseOverviewFactory()
+        # Enrollment dates are set so the certificates below are created
+        # before 'today' no matter how many enrollments other tests create
         self.course_enrollments = [CourseEnrollmentFactory(
-            course_id=self.course_overview.id) for i in range(4)]
+            course_id=self.course_overview.id,
+            created=as_datetime(datetime.date(2018, 1, 1)) + datetime.timedelta(days=i),
+            ) for i in range(4)]
 
         self.course_access_roles = [CourseAccessRoleFactory(
             user=self.course_enrollments[i].user,
@@ -137,7 +155,31 @@ class TestCourseDailyMetricsPipelineFunctions(object):
         """
         recs = pipeline_cdm.get_active_learner_ids_today(
             course_id=self.course_overview.id, date_for=self.today)
-        assert recs.count() == len(self.course_enrollments)
+        # The course staff are not counted
+        assert recs.count() == (
+            len(self.course_enrollments) - len(self.course_access_roles))
+
+    def test_get_active_learner_ids_today_later_in_day(self):
+        """Activity after midnight is counted for the day, activity on the
+        next day is not
+        """
+        ce = CourseEnrollmentFactory(course_id=self.course_overview.id)
+        StudentModuleFactory(
+            course_id=ce.course_id,
+            student=ce.user,
+            modified=as_datetime(self.today) + datetime.timedelta(hours=13))
+        StudentModuleFactory(
+            course_id=ce.course_id,
+            modified=as_datetime(next_day(self.today)))
+        recs = pipeline_cdm.get_active_learner_ids_today(
+            course_id=self.course_overview.id, date_for=self.today)
+        assert recs.count() == (
+            len(self.course_enrollments) - len(self.course_access_roles) + 1)
+
+    def test_get_learner_enrollment_count(self):
+        assert pipeline_cdm.get_learner_enrollment_count(
+            self.course_overview.id, self.today) == (
+            len(self.course_enrollments) - len(self.course_access_roles))
 
     def test_get_average_progress(self):
         """
@@ -162,6 +204,35 @@ class TestCourseDailyMetricsPipelineFunctions(object):
         # hardcode the expected value
         assert actual == 0.5
 
+    def test_get_average_progress_loads_course_once(self):
+        course_enrollments = CourseEnrollment.objects.filter(
+            course_id=self.course_overview.id)
+        assert course_enrollments.count() > 1
+        with mock.patch('figures.metrics.get_course_for_grading',
+                        wraps=figures.metrics.get_course_for_grading) as mock_load:
+            pipeline_cdm.get_average_progress(
+                course_id=self.course_overview.id,
+                date_for=self.today,
+                course_enrollments=course_enrollments
+                )
+        assert mock_load.call_count == 1
+
+    @mock.patch(
+        'figures.metrics.get_course_for_grading',
+        side_effect=Http404('mock-failure')
+    )
+    def test_get_average_progress_course_error(self, mock_load):
+        course_enrollments = CourseEnrollment.objects.filter(
+            course_id=self.course_overview.id)
+        results = pipeline_cdm.get_average_progress(
+                course_id=self.course_overview.id,
+                date_for=self.today,
+                course_enrollments=course_enrollments
+                )
+        assert results == pytest.approx(0.0)
+        assert PipelineError.objects.count() == 1
+        assert PipelineError.objects.first().error_type == PipelineError.COURSE_DATA
+
     @mock.patch(
         'figures.metrics.LearnerCourseGrades.course_progress',
         side_effect=PermissionDenied('mock-failure')
@@ -179,6 +250,19 @@ class TestCourseDailyMetricsPipelineFunctions(object):
         assert results == pytest.approx(0.0)
         assert PipelineError.objects.count() == course_enrollments.count()
 
+    @mock.patch(
+        'figures.metrics.LearnerCourseGrades.course_progress',
+        side_effect=PermissionDenied('mock-failure')
+    )
+    def test_load_buffers_grades_errors(self, mock_lcg):
+        pipeline_cdm.CourseDailyMetricsLoader(
+            str(self.course_overview.id)).load(date_for=self.today)
+        error = PipelineError.objects.get()
+        assert error.error_type == PipelineError.GRADES_DATA
+        assert error.error_data['exception_class'] == 'PermissionDenied'
+        assert error.error_data['count'] == CourseEnrollment.objects.filter(
+            course_id=self.course_overview.id).count()
+
     def test_get_days_to_complete(self):
         expected = dict(
             days=self.cert_days_to_complete,
@@ -190,6 +274,85 @@ class TestCourseDailyMetricsPipelineFunctions(object):
 
         assert actual == expected
 
+    def test_get_days_to_complete_without_enrollment(self):
+        """Certificates for learners not enrolled in the course are skipped
+        """
+        GeneratedCertificateFactory(
+            course_id=self.course_overview.id,
+            created_date=as_datetime(prev_day(self.today)))
+        actual = pipeline_cdm.get_days_to_complete(
+            course_id=self.course_overview.id,
+            date_for=self.today)
+        assert actual == dict(days=self.cert_days_to_complete, errors=[])
+
+    def test_get_days_to_complete_through_end_of_day(self):
+        """Certificates issued on ``date_for`` are counted, the same as in
+        ``get_num_learners_completed``. Certificates issued the next day are not
+        """
+        ce = self.course_enrollments[3]
+        created_date = as_datetime(self.today) + datetime.timedelta(hours=15)
+        GeneratedCertificateFactory(
+            user=ce.user,
+            course_id=ce.course_id,
+            created_date=created_date)
+        GeneratedCertificateFactory(
+            user=CourseEnrollmentFactory(course_id=self.course_overview.id).user,
+            course_id=self.course_overview.id,
+            created_date=as_datetime(next_day(self.today)))
+        actual = pipeline_cdm.get_days_to_complete(
+            course_id=self.course_overview.id,
+            date_for=self.today)
+        assert actual == dict(
+            days=self.cert_days_to_complete + [(created_date - ce.created).days],
+            errors=[])
+        assert len(actual['days']) == pipeline_cdm.get_num_learners_completed(
+            course_id=self.course_overview.id,
+            date_for=self.today)
+
+    def test_calc_days_to_complete_stats(self):
+        actual = pipeline_cdm.calc_days_to_complete_stats(
+            self.cert_days_to_complete)
+        assert actual == dict(
+            average=self.expected_avg_cert_days_to_complete,
+            median=20,
+            p90=30,
+            histogram=dict(
+                bins=list(pipeline_cdm.DAYS_TO_COMPLETE_HISTOGRAM_BINS),
+                counts=[0, 1, 1, 1, 0, 0, 0, 0]),
+            )
+
+    def test_calc_days_to_complete_stats_no_data(self):
+        actual = pipeline_cdm.calc_days_to_complete_stats([])
+        assert actual['average'] == 0.0
+        assert actual['median'] is None
+        assert actual['p90'] is None
+        assert sum(actual['histogram']['counts']) == 0
+
+    @pytest.mark.parametrize('days, expected', [
+        ([-1, 0, 6, 7], [3, 1, 0, 0, 0, 0, 0, 0]),
+        ([364, 365, 1000], [0, 0, 0, 0, 0, 0, 1, 2]),
+    ])
+    def test_calc_days_to_complete_histogram(self, days, expected):
+        actual = pipeline_cdm.calc_days_to_complete_histogram(days)
+        assert actual['counts'] == expected
+
+    def test_get_days_to_complete_since(self):
+        since = self.generated_certificates[1].created_date.date()
+        actual = pipeline_cdm.get_days_to_complete(
+            course_id=self.course_overview.id,
+            date_for=self.today,
+            since=since)
+        assert actual == dict(days=self.cert_days_to_complete[1:], errors=[])
+
+    def test_calc_day_counts_stats_matches_days(self):
+        days = [3, 3, 40, 7, 100, 7, 7]
+        assert (pipeline_cdm.calc_day_counts_stats(pipeline_cdm.count_days(days)) ==
+                pipeline_cdm.calc_days_to_complete_stats(days))
+
+    def test_count_days_merges(self):
+        actual = pipeline_cdm.count_days([1, 2, 2], dict([(2, 1), (5, 3)]))
+        assert actual == {1: 1, 2: 3, 5: 3}
+
     def test_calc_average_days_to_complete(self):
         actual = pipeline_cdm.calc_average_days_to_complete(
             self.cert_days_to_complete)
@@ -209,6 +372,404 @@ class TestCourseDailyMetricsPipelineFunctions(object):
         assert actual == len(self.generated_certificates)
 
 
+@pytest.mark.django_db
+class TestIncrementalAverageProgress(object):
+    """Tests the incremental mode of ``get_average_progress``
+
+    Each learner has a grades snapshot for the previous day with a progress
+    of 0.25. The mock course grades give a progress of 0.5 to anyone who is
+    regraded
+    """
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        self.date_for = datetime.date(2018, 6, 2)
+        self.snapshot_date = prev_day(self.date_for)
+        self.snapshot_written = as_datetime(self.snapshot_date).replace(hour=2)
+        self.course_overview = CourseOverviewFactory()
+        self.course_enrollments = [CourseEnrollmentFactory(
+            course_overview=self.course_overview) for i in range(3)]
+        for ce in self.course_enrollments:
+            LearnerCourseGradeMetricsFactory(
+                user=ce.user,
+                course_id=str(ce.course_id),
+                date_for=self.snapshot_date,
+                graded_at=self.snapshot_written)
+
+    def get_average_progress(self, date_for=None):
+        return pipeline_cdm.get_average_progress(
+            course_id=self.course_overview.id,
+            date_for=date_for or self.date_for,
+            course_enrollments=CourseEnrollment.objects.filter(
+                course_id=self.course_overview.id),
+            incremental=True)
+
+    def test_no_activity(self):
+        with mock.patch('figures.metrics.get_course_for_grading') as mock_load:
+            average_progress = self.get_average_progress()
+        assert not mock_load.called
+        assert average_progress == pytest.approx(0.25)
+        assert LearnerCourseGradeMetrics.objects.filter(
+            date_for=self.date_for).count() == len(self.course_enrollments)
+
+    def test_activity_before_snapshot(self):
+        StudentModuleFactory(
+            course_id=self.course_overview.id,
+            student=self.course_enrollments[0].user,
+            modified=self.snapshot_written - datetime.timedelta(hours=1))
+        assert self.get_average_progress() == pytest.approx(0.25)
+
+    def test_activity_after_snapshot(self):
+        StudentModuleFactory(
+            course_id=self.course_overview.id,
+            student=self.course_enrollments[0].user,
+            modified=self.snapshot_written + datetime.timedelta(hours=1))
+        assert self.get_average_progress() == pytest.approx((0.5 + 0.25 + 0.25) / 3)
+        regraded = LearnerCourseGradeMetrics.objects.get(
+            user=self.course_enrollments[0].user,
+            date_for=self.date_for)
+        assert regraded.progress_percent == pytest.approx(0.5)
+
+    def test_learner_without_snapshot(self):
+        new_ce = CourseEnrollmentFactory(course_overview=self.course_overview)
+        assert self.get_average_progress() == pytest.approx((0.5 + 0.25 * 3) / 4)
+        assert LearnerCourseGradeMetrics.objects.filter(
+            user=new_ce.user, date_for=self.date_for).exists()
+
+    def test_snapshot_without_graded_at(self):
+        LearnerCourseGradeMetrics.objects.update(graded_at=None)
+        assert self.get_average_progress() == pytest.approx(0.5)
+
+    def test_carried_forward_keeps_graded_at(self):
+        """Activity after the grades were computed is regraded, even after
+        the snapshot has been carried forward for days
+        """
+        later_date = next_day(self.date_for)
+        for date_for in [self.date_for, later_date]:
+            assert self.get_average_progress(date_for) == pytest.approx(0.25)
+        carried = LearnerCourseGradeMetrics.objects.filter(date_for=later_date)
+        assert carried.count() == len(self.course_enrollments)
+        assert set(carried.values_list('graded_at', flat=True)) == set(
+            [self.snapshot_written])
+
+        # After midnight, so after the last day carried forward, and before
+        # the carried rows were written
+        StudentModuleFactory(
+            course_id=self.course_overview.id,
+            student=self.course_enrollments[0].user,
+            modified=as_datetime(next_day(later_date)) + datetime.timedelta(hours=1))
+        assert self.get_average_progress(
+            next_day(later_date)) == pytest.approx((0.5 + 0.25 + 0.25) / 3)
+        regraded = LearnerCourseGradeMetrics.objects.get(
+            user=self.course_enrollments[0].user,
+            date_for=next_day(later_date))
+        assert regraded.graded_at > self.snapshot_written
+
+
+@pytest.mark.django_db
+class TestGradesTimeBudget(object):
+    """Tests that ``get_average_progress`` stops exact grading when the
+    course runs out of its time budget
+
+    Each learner has a grades snapshot for the previous day with a progress
+    of 0.25. The mock course grades give a progress of 0.5
+    """
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        self.date_for = datetime.date(2018, 6, 2)
+        self.course_overview = CourseOverviewFactory()
+        enrolled = as_datetime(datetime.date(2018, 1, 1))
+        self.course_enrollments = [CourseEnrollmentFactory(
+            course_overview=self.course_overview,
+            created=enrolled) for i in range(3)]
+        for ce in self.course_enrollments:
+            LearnerCourseGradeMetricsFactory(
+                user=ce.user,
+                course_id=str(ce.course_id),
+                date_for=prev_day(self.date_for))
+        # A learner with no snapshot to carry forward
+        self.new_ce = CourseEnrollmentFactory(
+            course_overview=self.course_overview,
+            created=enrolled)
+
+    def get_average_progress(self, stats, time_budget):
+        return pipeline_cdm.get_average_progress(
+            course_id=self.course_overview.id,
+            date_for=self.date_for,
+            course_enrollments=CourseEnrollment.objects.filter(
+                course_id=self.course_overview.id).order_by('id'),
+            incremental=False,
+            time_budget=time_budget,
+            stats=stats)
+
+    def test_out_of_budget(self):
+        stats = PipelineStats()
+        with mock.patch.object(pipeline_cdm, 'time') as mock_time:
+            # The budget runs out while grading the first learner
+            mock_time.time.side_effect = itertools.chain(
+                [0.0], itertools.repeat(100.0))
+            average_progress = self.get_average_progress(stats, time_budget=10)
+        assert stats.partial
+        assert stats.learners_graded == 1
+        assert stats.learners_processed == 4
+        # The learner with no snapshot counts as no progress
+        assert average_progress == pytest.approx((0.5 + 0.25 + 0.25 + 0.0) / 4)
+        assert LearnerCourseGradeMetrics.objects.filter(
+            date_for=self.date_for).count() == 3
+        assert not LearnerCourseGradeMetrics.objects.filter(
+            user=self.new_ce.user, date_for=self.date_for).exists()
+
+    def test_out_of_budget_learners_without_snapshots(self):
+        """Learners left over with no snapshot do not raise the average
+        """
+        for i in range(2):
+            CourseEnrollmentFactory(
+                course_overview=self.course_overview,
+                created=as_datetime(datetime.date(2018, 1, 1)))
+        stats = PipelineStats()
+        with mock.patch.object(pipeline_cdm, 'time') as mock_time:
+            mock_time.time.side_effect = itertools.chain(
+                [0.0], itertools.repeat(100.0))
+            average_progress = self.get_average_progress(stats, time_budget=10)
+        assert stats.learners_graded == 1
+        assert stats.learners_processed == 6
+        assert average_progress == pytest.approx((0.5 + 0.25 * 2) / 6)
+
+    def test_carried_forward_learners_graded_next_day(self):
+        """Learners left over when the budget runs out are still regraded
+        by the next incremental pass
+        """
+        graded_at = as_datetime(prev_day(self.date_for)).replace(hour=2)
+        LearnerCourseGradeMetrics.objects.update(graded_at=graded_at)
+        for ce in self.course_enrollments:
+            StudentModuleFactory(
+                course_id=self.course_overview.id,
+                student=ce.user,
+                modified=graded_at + datetime.timedelta(hours=1))
+
+        stats = PipelineStats()
+        with mock.patch.object(pipeline_cdm, 'time') as mock_time:
+            mock_time.time.side_effect = itertools.chain(
+                [0.0], itertools.repeat(100.0))
+            pipeline_cdm.get_average_progress(
+                course_id=self.course_overview.id,
+                date_for=self.date_for,
+                course_enrollments=CourseEnrollment.objects.filter(
+                    course_id=self.course_overview.id).order_by('id'),
+                incremental=True,
+                time_budget=10,
+                stats=stats)
+        assert stats.partial
+        assert stats.learners_graded == 1
+
+        stats = PipelineStats()
+        average_progress = pipeline_cdm.get_average_progress(
+            course_id=self.course_overview.id,
+            date_for=next_day(self.date_for),
+            course_enrollments=CourseEnrollment.objects.filter(
+                course_id=self.course_overview.id).order_by('id'),
+            incremental=True,
+            time_budget=0,
+            stats=stats)
+        # The two learners carried forward and the learner with no snapshot
+        assert stats.learners_graded == 3
+        assert average_progress == pytest.approx(0.5)
+
+    def test_within_budget(self):
+        stats = PipelineStats()
+        average_progress = self.get_average_progress(stats, time_budget=3600)
+        assert not stats.partial
+        assert stats.learners_graded == 4
+        assert average_progress == pytest.approx(0.5)
+
+    def test_load_flags_partial(self):
+        with mock.patch.object(pipeline_cdm, 'time') as mock_time:
+            mock_time.time.side_effect = itertools.chain(
+                [0.0], itertools.repeat(100.0))
+            with mock.patch('figures.settings.env_tokens',
+                            {'PIPELINE_GRADES_TIME_BUDGET': 10}):
+                cdm, created = pipeline_cdm.CourseDailyMetricsLoader(
+                    str(self.course_overview.id)).load(
+                    date_for=self.date_for, incremental=False)
+        assert cdm.partial
+        assert cdm.learners_graded == 1
+
+
+@pytest.mark.django_db
+class TestSampledAverageProgress(object):
+    """Tests ``get_sampled_average_progress``
+
+    Each learner has a grades snapshot for the previous day with a progress
+    of 0.25. The mock course grades give a progress of 0.5
+    """
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        self.date_for = datetime.date(2018, 6, 2)
+        self.course_overview = CourseOverviewFactory()
+        self.course_enrollments = [CourseEnrollmentFactory(
+            course_overview=self.course_overview,
+            created=as_datetime(datetime.date(2018, 1, 1))) for i in range(10)]
+        # Graded in the run for the day before
+        self.graded_at = as_datetime(self.date_for).replace(hour=2)
+        for ce in self.course_enrollments:
+            LearnerCourseGradeMetricsFactory(
+                user=ce.user,
+                course_id=str(ce.course_id),
+                date_for=prev_day(self.date_for),
+                graded_at=self.graded_at)
+
+    def get_sampled_average_progress(self, **kwargs):
+        return pipeline_cdm.get_sampled_average_progress(
+            course_id=self.course_overview.id,
+            date_for=self.date_for,
+            course_enrollments=CourseEnrollment.objects.filter(
+                course_id=self.course_overview.id),
+            **kwargs)
+
+    def test_sample(self):
+        stats = PipelineStats()
+        estimate = self.get_sampled_average_progress(
+            sample_size=5, target_error=0, max_days=30, stats=stats)
+        sampled = [ce for ce in self.course_enrollments if sampling.in_sample(
+            ce.user_id, self.graded_at, self.date_for, 2, 30)]
+        assert estimate.sample_size == len(sampled)
+        assert stats.learners_graded == len(sampled)
+        assert stats.learners_processed == len(self.course_enrollments)
+        # Everyone is in the same stratum, and the sample all grade the same
+        assert estimate.average == pytest.approx(0.5)
+        assert estimate.lower == estimate.upper == pytest.approx(0.5)
+        # Everyone has a snapshot for the day
+        assert LearnerCourseGradeMetrics.objects.filter(
+            date_for=self.date_for).count() == len(self.course_enrollments)
+
+    def test_stale_snapshots_are_regraded(self):
+        estimate = self.get_sampled_average_progress(
+            sample_size=5, target_error=0, max_days=1)
+        assert estimate.sample_size == len(self.course_enrollments)
+
+    def test_snapshots_without_graded_at_are_regraded(self):
+        LearnerCourseGradeMetrics.objects.update(graded_at=None)
+        estimate = self.get_sampled_average_progress(
+            sample_size=5, target_error=0, max_days=30)
+        assert estimate.sample_size == len(self.course_enrollments)
+
+    def test_carried_forward_keeps_graded_at(self):
+        self.get_sampled_average_progress(
+            sample_size=5, target_error=0, max_days=30)
+        carried = LearnerCourseGradeMetrics.objects.filter(
+            date_for=self.date_for, graded_at=self.graded_at)
+        assert 0 < carried.count() < len(self.course_enrollments)
+
+    def test_extract_uses_sample(self):
+        env_tokens = {'SAMPLED_PROGRESS_MIN_ENROLLMENTS': 10,
+                      'SAMPLED_PROGRESS_SAMPLE_SIZE': 5}
+        with mock.patch('figures.settings.env_tokens', env_tokens):
+            cdm, created = pipeline_cdm.CourseDailyMetricsLoader(
+                str(self.course_overview.id)).load(date_for=self.date_for)
+        assert cdm.progress_sample_size > 0
+        assert cdm.average_progress_lower <= cdm.average_progress_upper
+
+    def test_extract_exact_below_threshold(self):
+        env_tokens = {'SAMPLED_PROGRESS_MIN_ENROLLMENTS': 11}
+        with mock.patch('figures.settings.env_tokens', env_tokens):
+            cdm, created = pipeline_cdm.CourseDailyMetricsLoader(
+                str(self.course_overview.id)).load(date_for=self.date_for)
+        assert cdm.progress_sample_size is None
+        assert cdm.average_progress_lower is None
+
+
+@pytest.mark.django_db
+class TestDaysToCompleteAggregate(object):
+    """Tests the running days to complete aggregate
+    """
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        self.date_for = datetime.date(2018, 6, 1)
+        self.course_overview = CourseOverviewFactory()
+        self.course_id = str(self.course_overview.id)
+
+    def add_certificate(self, created_date, days):
+        ce = CourseEnrollmentFactory(
+            course_id=self.course_overview.id,
+            created=as_datetime(created_date) - datetime.timedelta(days=days))
+        return GeneratedCertificateFactory(
+            user=ce.user,
+            course_id=ce.course_id,
+            created_date=as_datetime(created_date) + datetime.timedelta(hours=12))
+
+    def test_first_run_reads_all_certificates(self):
+        self.add_certificate(prev_day(self.date_for), 10)
+        self.add_certificate(self.date_for, 20)
+        self.add_certificate(next_day(self.date_for), 30)
+        aggregate = pipeline_cdm.update_days_to_complete_aggregate(
+            self.course_id, self.date_for)
+        assert aggregate.date_for == self.date_for
+        assert aggregate.certificate_count == 2
+        assert aggregate.days_sum == 30
+        assert CourseDaysToCompleteAggregate.objects.count() == 1
+
+    def test_advance_reads_only_new_certificates(self):
+        self.add_certificate(prev_day(self.date_for), 10)
+        pipeline_cdm.update_days_to_complete_aggregate(
+            self.course_id, prev_day(self.date_for))
+        self.add_certificate(self.date_for, 20)
+
+        with mock.patch(
+                'figures.pipeline.course_daily_metrics.get_days_to_complete',
+                wraps=pipeline_cdm.get_days_to_complete) as mock_get:
+            aggregate = pipeline_cdm.update_days_to_complete_aggregate(
+                self.course_id, self.date_for)
+        assert mock_get.call_args[1]['since'] == self.date_for
+        assert aggregate.certificate_count == 2
+        assert aggregate.days_sum == 30
+
+        aggregate.refresh_from_db()
+        assert pipeline_cdm.aggregate_day_counts(aggregate) == {10: 1, 20: 1}
+
+    def test_same_date_is_not_recomputed(self):
+        pipeline_cdm.update_days_to_complete_aggregate(
+            self.course_id, self.date_for)
+        with mock.patch(
+                'figures.pipeline.course_daily_metrics.get_days_to_complete'
+                ) as mock_get:
+            pipeline_cdm.update_days_to_complete_aggregate(
+                self.course_id, self.date_for)
+        assert not mock_get.called
+
+    def test_earlier_date_does_not_move_aggregate_back(self):
+        self.add_certificate(prev_day(self.date_for), 10)
+        self.add_certificate(self.date_for, 20)
+        pipeline_cdm.update_days_to_complete_aggregate(
+            self.course_id, self.date_for)
+        aggregate = pipeline_cdm.update_days_to_complete_aggregate(
+            self.course_id, prev_day(self.date_for))
+        assert aggregate.certificate_count == 1
+        stored = CourseDaysToCompleteAggregate.objects.get(course_id=self.course_id)
+        assert stored.date_for == self.date_for
+        assert stored.certificate_count == 2
+
+    def test_rebuild(self):
+        pipeline_cdm.update_days_to_complete_aggregate(
+            self.course_id, self.date_for)
+        # A certificate created with a date already included in the aggregate
+        self.add_certificate(self.date_for, 20)
+        aggregate = pipeline_cdm.update_days_to_complete_aggregate(
+            self.course_id, self.date_for)
+        assert aggregate.certificate_count == 0
+        aggregate = pipeline_cdm.update_days_to_complete_aggregate(
+            self.course_id, self.date_for, rebuild=True)
+        assert aggregate.certificate_count == 1
+
+    def test_get_days_to_complete_stats(self):
+        self.add_certificate(prev_day(self.date_for), 10)
+        pipeline_cdm.update_days_to_complete_aggregate(
+            self.course_id, prev_day(self.date_for))
+        self.add_certificate(self.date_for, 20)
+        self.add_certificate(self.date_for, 30)
+        stats = pipeline_cdm.get_days_to_complete_stats(
+            self.course_id, self.date_for)
+        assert stats == pipeline_cdm.calc_days_to_complete_stats([10, 20, 30])
+
+
 @pytest.mark.django_db
 class TestCourseDailyMetricsExtractor(object):
     """
@@ -227,6 +788,43 @@ class TestCourseDailyMetricsExtractor(object):
         results = pipeline_cdm.CourseDailyMetricsExtractor().extract(course_id)
         assert results
 
+    def test_extract_with_course_counts(self):
+        course_id = self.course_enrollments[0].course_id
+        course_counts = dict(
+            enrollment_count=11,
+            active_learners_today=7,
+            num_learners_completed=3)
+        with mock.patch(
+                'figures.pipeline.course_daily_metrics.get_active_learner_ids_today'
+                ) as mock_active, mock.patch(
+                'figures.pipeline.course_daily_metrics.get_num_learners_completed'
+                ) as mock_completed:
+            results = pipeline_cdm.CourseDailyMetricsExtractor().extract(
+                course_id, course_counts=course_counts)
+        assert not mock_active.called
+        assert not mock_completed.called
+        for key, value in course_counts.items():
+            assert results[key] == value
+
+    def test_extract_spans(self):
+        course_id = self.course_enrollments[0].course_id
+        date_for = datetime.date(2018, 10, 1)
+        with span_sink(MemorySpanSink()) as sink:
+            pipeline_cdm.CourseDailyMetricsExtractor().extract(
+                course_id, date_for=date_for)
+        assert [span['name'] for span in sink.spans] == [
+            'enrollment_count',
+            'active_learners_today',
+            'num_learners_completed',
+            'grades',
+            'days_to_complete']
+        for span in sink.spans:
+            assert span['extractor'] == 'course_daily_metrics'
+            assert span['course_id'] == str(course_id)
+            assert span['date_for'] == date_for
+            assert span['duration'] >= 0
+        assert sink.spans[0]['query_count'] > 0
+
 
 @pytest.mark.django_db
 class TestCourseDailyMetricsLoader(object):
@@ -241,3 +839,16 @@ class TestCourseDailyMetricsLoader(object):
         course_id = self.course_enrollments[0].course_id
         results = pipeline_cdm.CourseDailyMetricsLoader(course_id).load()
         assert results
+
+    def test_load_days_to_complete_stats(self):
+        ce = self.course_enrollments[0]
+        GeneratedCertificateFactory(
+            user=ce.user,
+            course_id=ce.course_id,
+            created_date=ce.created + datetime.timedelta(days=10))
+        cdm, created = pipeline_cdm.CourseDailyMetricsLoader(ce.course_id).load()
+        assert created
+        assert cdm.average_days_to_complete == 10
+        assert cdm.days_to_complete_median == 10
+        assert cdm.days_to_complete_p90 == 10
+        assert cdm.days_to_complete_histogram['counts'] == [0, 1, 0, 0, 0, 0, 0, 0]
@@ -0,0 +1,128 @@
+"""Tests grading in figures.pipeline.grades and its use by the course daily
+metrics grades pass
+
+Most of the tests replace the process pool with an in-process pool so they
+can look at the chunks. ``TestGradesPool`` uses a real pool. The forked
+workers inherit the test database, which is in memory
+"""
+
+import datetime
+import mock
+import pytest
+
+from student.models import CourseEnrollment
+from xmodule.modulestore.django import modulestore
+
+from figures.models import LearnerCourseGradeMetrics
+from figures.pipeline import course_daily_metrics as pipeline_cdm
+from figures.pipeline import grades
+
+from tests.factories import CourseEnrollmentFactory, CourseOverviewFactory
+
+
+class InProcessPool(object):
+    """Stands in for ``multiprocessing.Pool``
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def imap_unordered(self, func, iterable):
+        for args in iterable:
+            self.chunks.append(args)
+            yield func(args)
+
+    def close(self):
+        pass
+
+    def terminate(self):
+        pass
+
+    def join(self):
+        pass
+
+
+@pytest.mark.django_db
+class TestGrades(object):
+
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        self.date_for = datetime.date(2018, 6, 1)
+        self.course_overview = CourseOverviewFactory()
+        self.course_enrollments = [CourseEnrollmentFactory(
+            course_overview=self.course_overview) for i in range(5)]
+        self.pool = InProcessPool()
+        self.env_tokens = {'GRADES_WORKER_COUNT': 2, 'GRADES_CHUNK_SIZE': 2}
+
+    def test_grade_enrollment_chunk(self):
+        enrollment_ids = [ce.id for ce in self.course_enrollments]
+        results = grades.grade_enrollment_chunk(
+            (str(self.course_overview.id), enrollment_ids))
+        assert set(result.enrollment_id for result in results) == set(enrollment_ids)
+        for result in results:
+            assert not result.error
+            assert result.progress_percent == 0.5
+
+    @pytest.mark.parametrize('env_tokens, expected', [
+        ({}, False),
+        ({'GRADES_WORKER_COUNT': 2, 'GRADES_CHUNK_SIZE': 10}, False),
+        ({'GRADES_WORKER_COUNT': 2, 'GRADES_CHUNK_SIZE': 2}, True),
+    ])
+    def test_use_grades_pool(self, env_tokens, expected):
+        with mock.patch('figures.settings.env_tokens', env_tokens):
+            assert grades.use_grades_pool(len(self.course_enrollments)) == expected
+
+    def test_get_average_progress_in_pool(self):
+        with mock.patch('figures.settings.env_tokens', self.env_tokens):
+            with mock.patch('figures.pipeline.grades.get_grades_pool',
+                            return_value=self.pool):
+                average_progress = pipeline_cdm.get_average_progress(
+                    course_id=self.course_overview.id,
+                    date_for=self.date_for,
+                    course_enrollments=CourseEnrollment.objects.filter(
+                        course_id=self.course_overview.id))
+        assert average_progress == 0.5
+        assert [len(args[1]) for args in self.pool.chunks] == [2, 2, 1]
+        assert LearnerCourseGradeMetrics.objects.filter(
+            date_for=self.date_for).count() == len(self.course_enrollments)
+
+    def test_pool_grading_error(self):
+        with mock.patch('figures.settings.env_tokens', self.env_tokens):
+            with mock.patch('figures.pipeline.grades.get_grades_pool',
+                            return_value=self.pool):
+                with mock.patch('figures.metrics.LearnerCourseGrades.course_progress',
+                                side_effect=Exception('mock-failure')):
+                    average_progress = pipeline_cdm.get_average_progress(
+                        course_id=self.course_overview.id,
+                        date_for=self.date_for,
+                        course_enrollments=CourseEnrollment.objects.filter(
+                            course_id=self.course_overview.id))
+        assert average_progress == 0.0
+        assert LearnerCourseGradeMetrics.objects.count() == 0
+
+
+@pytest.mark.django_db
+class TestGradesPool(object):
+
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        self.course_overview = CourseOverviewFactory()
+        self.course_enrollments = [CourseEnrollmentFactory(
+            course_overview=self.course_overview) for i in range(5)]
+
+    def test_init_grades_worker(self):
+        inherited = modulestore()
+        grades.init_grades_worker()
+        assert modulestore() is not inherited
+
+    def test_grade_enrollments_in_pool(self):
+        # The parent has used the modulestore before the pool is forked
+        modulestore()
+        env_tokens = {'GRADES_WORKER_COUNT': 2, 'GRADES_CHUNK_SIZE': 2}
+        with mock.patch('figures.settings.env_tokens', env_tokens):
+            results = list(grades.grade_enrollments_in_pool(
+                self.course_overview.id, self.course_enrollments))
+        assert sorted(result.enrollment_id for result in results) == sorted(
+            ce.id for ce in self.course_enrollments)
+        for result in results:
+            assert not result.error
+            assert result.progress_percent == 0.5
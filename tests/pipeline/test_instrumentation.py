@@ -0,0 +1,160 @@
+'''Tests figures.pipeline.instrumentation
+'''
+
+import datetime
+import json
+import mock
+import pytest
+import threading
+
+from django.db import connections
+
+from figures.models import SiteDailyMetrics
+from figures.pipeline.instrumentation import (
+    MemorySpanSink,
+    JSONLinesSpanSink,
+    PipelineStats,
+    count_queries,
+    get_span_sinks,
+    span,
+    span_sink,
+)
+
+
+@pytest.mark.django_db
+class TestCountQueries(object):
+
+    def test_count(self):
+        with count_queries() as counter:
+            list(SiteDailyMetrics.objects.all())
+            SiteDailyMetrics.objects.count()
+        assert counter.count == 2
+
+    def test_nested(self):
+        with count_queries() as outer:
+            SiteDailyMetrics.objects.count()
+            with count_queries() as inner:
+                SiteDailyMetrics.objects.count()
+            SiteDailyMetrics.objects.count()
+        assert inner.count == 1
+        assert outer.count == 3
+
+    def test_restores_connection(self):
+        with count_queries():
+            assert 'make_cursor' in connections['default'].__dict__
+        assert 'make_cursor' not in connections['default'].__dict__
+        assert 'make_debug_cursor' not in connections['default'].__dict__
+
+    def test_restores_connection_on_error(self):
+        with pytest.raises(ValueError):
+            with count_queries():
+                raise ValueError()
+        assert 'make_cursor' not in connections['default'].__dict__
+
+    def test_other_thread(self):
+        """A block open in another thread does not take this thread's
+        queries
+        """
+        entered = threading.Event()
+        done = threading.Event()
+        other = []
+
+        def count_in_thread():
+            with count_queries() as counter:
+                other.append(counter)
+                entered.set()
+                done.wait(5)
+
+        thread = threading.Thread(target=count_in_thread)
+        thread.start()
+        try:
+            assert entered.wait(5)
+            with count_queries() as counter:
+                SiteDailyMetrics.objects.count()
+        finally:
+            done.set()
+            thread.join()
+        assert counter.count == 1
+        assert other[0].count == 0
+
+
+@pytest.mark.django_db
+class TestPipelineStats(object):
+
+    def test_stage(self):
+        stats = PipelineStats()
+        with stats.stage('first'):
+            SiteDailyMetrics.objects.count()
+        with stats.stage('second'):
+            SiteDailyMetrics.objects.count()
+        with stats.stage('first'):
+            SiteDailyMetrics.objects.count()
+        assert list(stats.stage_durations.keys()) == ['first', 'second']
+        assert all(duration >= 0 for duration in stats.stage_durations.values())
+        assert stats.query_count == 3
+
+    def test_nested_stages(self):
+        stats = PipelineStats()
+        with span_sink(MemorySpanSink()) as sink:
+            with stats.stage('outer'):
+                SiteDailyMetrics.objects.count()
+                with stats.stage('inner'):
+                    SiteDailyMetrics.objects.count()
+        assert list(stats.stage_durations.keys()) == ['outer']
+        assert stats.query_count == 2
+        assert [(s['name'], s['query_count']) for s in sink.spans] == [
+            ('inner', 1), ('outer', 2)]
+
+
+@pytest.mark.django_db
+class TestSpans(object):
+
+    def test_span(self):
+        with span_sink(MemorySpanSink()) as sink:
+            with span('count', course_id='course-v1:a+b+c') as record:
+                SiteDailyMetrics.objects.count()
+                record['learners'] = 3
+        assert len(sink.spans) == 1
+        assert sink.spans[0]['name'] == 'count'
+        assert sink.spans[0]['course_id'] == 'course-v1:a+b+c'
+        assert sink.spans[0]['learners'] == 3
+        assert sink.spans[0]['query_count'] == 1
+        assert sink.spans[0]['duration'] >= 0
+        assert 'error' not in sink.spans[0]
+
+    def test_span_error(self):
+        with span_sink(MemorySpanSink()) as sink:
+            with pytest.raises(ValueError):
+                with span('count'):
+                    raise ValueError()
+        assert sink.spans[0]['error'] == 'ValueError'
+
+    def test_sink_error_is_logged(self):
+        bad_sink = mock.Mock()
+        bad_sink.emit.side_effect = IOError()
+        with span_sink(bad_sink), span_sink(MemorySpanSink()) as sink:
+            with span('count'):
+                pass
+        assert len(sink.spans) == 1
+
+    def test_span_sink_removed(self):
+        with span_sink(MemorySpanSink()) as sink:
+            assert sink in get_span_sinks()
+        assert sink not in get_span_sinks()
+
+    def test_json_lines_sink(self, tmpdir):
+        path = str(tmpdir.join('spans.jsonl'))
+        with span_sink(JSONLinesSpanSink(path)):
+            for name in ['first', 'second']:
+                with span(name, date_for=datetime.date(2018, 10, 1)):
+                    pass
+        with open(path) as f:
+            spans = [json.loads(line) for line in f]
+        assert [s['name'] for s in spans] == ['first', 'second']
+        assert spans[0]['date_for'] == '2018-10-01'
+
+    def test_span_log_setting(self, tmpdir):
+        path = str(tmpdir.join('spans.jsonl'))
+        with mock.patch('figures.settings.env_tokens', {'PIPELINE_SPAN_LOG': path}):
+            sinks = get_span_sinks()
+        assert [sink.path for sink in sinks] == [path]
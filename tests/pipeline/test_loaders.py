@@ -6,10 +6,15 @@ modules: course_daily_metrics, site_daily_metrics
 import datetime
 import pytest
 
+from django.utils.timezone import utc
+
 from figures.models import LearnerCourseGradeMetrics
 import figures.pipeline.loaders
 
-from tests.factories import CourseEnrollmentFactory
+from tests.factories import (
+    CourseEnrollmentFactory,
+    LearnerCourseGradeMetricsFactory,
+)
 
 
 @pytest.mark.django_db
@@ -39,3 +44,33 @@ class TestSaveLearnerCourseGrades(object):
         assert obj.points_earned == details['points_earned']
         assert obj.sections_worked == details['sections_worked']
         assert obj.sections_possible == details['count']
+        assert obj.graded_at
+
+
+@pytest.mark.django_db
+class TestLearnerCourseGradesWriter(object):
+
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        self.date_for = datetime.date(2018, 2, 2)
+        self.graded_at = datetime.datetime(2018, 1, 20, 2, tzinfo=utc)
+        self.snapshot = LearnerCourseGradeMetricsFactory(
+            date_for=datetime.date(2018, 1, 19),
+            graded_at=self.graded_at)
+
+    def test_carry_forward_keeps_graded_at(self):
+        with figures.pipeline.loaders.LearnerCourseGradesWriter() as writer:
+            writer.carry_forward(self.date_for, self.snapshot)
+        carried = LearnerCourseGradeMetrics.objects.get(date_for=self.date_for)
+        assert carried.graded_at == self.graded_at
+        assert carried.progress_percent == self.snapshot.progress_percent
+
+    def test_add_course_progress(self):
+        details = dict(points_possible=10.0, points_earned=5.0,
+                       sections_worked=2, count=4)
+        course_enrollment = CourseEnrollmentFactory()
+        with figures.pipeline.loaders.LearnerCourseGradesWriter() as writer:
+            writer.add_course_progress(self.date_for, course_enrollment, details,
+                                       graded_at=self.graded_at)
+        assert LearnerCourseGradeMetrics.objects.get(
+            user=course_enrollment.user).graded_at == self.graded_at
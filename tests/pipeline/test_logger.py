@@ -46,3 +46,66 @@ class TestPipelineLogging(object):
     def test_logging_to_model_with_kwargs(self, dict_args):
         assert PipelineError.objects.count() == 0
         logger.log_error(self.error_data, **dict_args)
+
+
+@pytest.mark.django_db
+class TestBufferedErrors(object):
+
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        self.users = [UserFactory() for i in range(8)]
+
+    def log_grades_error(self, user, course_id='course-a', exception_class='KeyError'):
+        logger.log_error(
+            error_data=dict(msg='Unable to get course blocks',
+                            username=user.username,
+                            course_id=course_id,
+                            exception_class=exception_class),
+            error_type=PipelineError.GRADES_DATA,
+            user=user,
+            course_id=course_id)
+
+    def test_groups_errors(self):
+        with mock.patch('figures.pipeline.logger.logger') as mock_logger:
+            with logger.buffered_errors():
+                for user in self.users:
+                    self.log_grades_error(user)
+                self.log_grades_error(self.users[0], exception_class='ValueError')
+                self.log_grades_error(self.users[0], course_id='course-b')
+                assert PipelineError.objects.count() == 0
+        errors = PipelineError.objects.order_by('id')
+        assert errors.count() == 3
+        error = errors[0]
+        assert error.user == self.users[0]
+        assert error.course_id == 'course-a'
+        assert error.error_data['count'] == len(self.users)
+        assert error.error_data['sample_users'] == [
+            user.username for user in self.users[:logger.MAX_SAMPLE_USERS]]
+        assert errors[1].error_data['count'] == 1
+        # The first of each group, and a summary of the repeats
+        assert mock_logger.error.call_count == 4
+
+    def test_flushes_on_error(self):
+        with pytest.raises(ValueError):
+            with logger.buffered_errors():
+                self.log_grades_error(self.users[0])
+                raise ValueError()
+        assert PipelineError.objects.count() == 1
+        self.log_grades_error(self.users[1])
+        assert PipelineError.objects.count() == 2
+
+    def test_nested(self):
+        with logger.buffered_errors() as outer:
+            with logger.buffered_errors() as inner:
+                self.log_grades_error(self.users[0])
+            assert inner is outer
+            assert PipelineError.objects.count() == 0
+            self.log_grades_error(self.users[1])
+        assert PipelineError.objects.get().error_data['count'] == 2
+
+    def test_not_logged_to_db(self):
+        env_tokens = {'LOG_PIPELINE_ERRORS_TO_DB': False}
+        with mock.patch('figures.settings.env_tokens', env_tokens):
+            with logger.buffered_errors():
+                self.log_grades_error(self.users[0])
+        assert PipelineError.objects.count() == 0
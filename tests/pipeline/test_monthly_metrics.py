@@ -0,0 +1,203 @@
+'''Tests figures.pipeline.monthly_metrics and reading the history from the
+monthly metrics
+'''
+
+import datetime
+from decimal import Decimal
+import pytest
+
+from figures import metrics
+from figures.models import CourseMonthlyMetrics, SiteMonthlyMetrics
+from figures.pipeline import monthly_metrics
+from figures.pipeline.instrumentation import count_queries
+
+from tests.factories import CourseDailyMetricsFactory, SiteDailyMetricsFactory
+
+COURSE_IDS = ['course-v1:FigX+A01+2018', 'course-v1:FigX+B01+2018']
+
+
+def test_month_bounds():
+    assert monthly_metrics.month_bounds(datetime.date(2018, 2, 14)) == (
+        datetime.date(2018, 2, 1), datetime.date(2018, 2, 28))
+
+
+@pytest.mark.django_db
+class TestUpdateCourseMonthlyMetrics(object):
+
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        for day, enrollment_count, average_progress in [
+                (1, 10, '0.20'), (15, 12, '0.30'), (28, 11, None)]:
+            CourseDailyMetricsFactory(
+                course_id=COURSE_IDS[0],
+                date_for=datetime.date(2018, 2, day),
+                enrollment_count=enrollment_count,
+                average_progress=(Decimal(average_progress)
+                                  if average_progress else None),
+                average_days_to_complete=day,
+                num_learners_completed=day // 10)
+        # Outside the month
+        CourseDailyMetricsFactory(
+            course_id=COURSE_IDS[0],
+            date_for=datetime.date(2018, 3, 1),
+            enrollment_count=100)
+        CourseDailyMetricsFactory(
+            course_id=COURSE_IDS[1],
+            date_for=datetime.date(2018, 2, 3),
+            enrollment_count=5)
+
+    def test_matches_time_period_functions(self):
+        start_date = datetime.date(2018, 2, 1)
+        end_date = datetime.date(2018, 2, 28)
+        assert monthly_metrics.update_course_monthly_metrics(
+            datetime.date(2018, 2, 14)) == 2
+        rec = CourseMonthlyMetrics.objects.get(course_id=COURSE_IDS[0])
+        assert rec.month_for == start_date
+        assert rec.enrollment_count == \
+            metrics.get_course_enrolled_users_for_time_period(
+                start_date, end_date, COURSE_IDS[0]) == 12
+        assert rec.average_progress == \
+            metrics.get_course_average_progress_for_time_period(
+                start_date, end_date, COURSE_IDS[0]) == 0.25
+        assert rec.average_days_to_complete == \
+            metrics.get_course_average_days_to_complete_for_time_period(
+                start_date, end_date, COURSE_IDS[0]) == 15
+        assert rec.num_learners_completed == \
+            metrics.get_course_num_learners_completed_for_time_period(
+                start_date, end_date, COURSE_IDS[0]) == 2
+
+    def test_courses(self):
+        assert monthly_metrics.update_course_monthly_metrics(
+            datetime.date(2018, 2, 14), course_ids=[COURSE_IDS[1]]) == 1
+        assert CourseMonthlyMetrics.objects.get().course_id == COURSE_IDS[1]
+
+    def test_rewrite(self):
+        monthly_metrics.update_course_monthly_metrics(datetime.date(2018, 2, 1))
+        CourseDailyMetricsFactory(
+            course_id=COURSE_IDS[0],
+            date_for=datetime.date(2018, 2, 20),
+            enrollment_count=50)
+        monthly_metrics.update_course_monthly_metrics(datetime.date(2018, 2, 20))
+        assert CourseMonthlyMetrics.objects.count() == 2
+        assert CourseMonthlyMetrics.objects.get(
+            course_id=COURSE_IDS[0]).enrollment_count == 50
+
+
+@pytest.mark.django_db
+class TestUpdateSiteMonthlyMetrics(object):
+
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        for day in range(1, 4):
+            SiteDailyMetricsFactory(
+                date_for=datetime.date(2018, 2, day),
+                total_user_count=10 + day,
+                course_count=day,
+                total_enrollment_count=20 + day)
+        CourseDailyMetricsFactory(
+            course_id=COURSE_IDS[0],
+            date_for=datetime.date(2018, 2, 2),
+            num_learners_completed=7)
+
+    def test_matches_time_period_functions(self):
+        start_date = datetime.date(2018, 2, 1)
+        end_date = datetime.date(2018, 2, 28)
+        assert monthly_metrics.update_site_monthly_metrics(
+            datetime.date(2018, 2, 3)) == 1
+        rec = SiteMonthlyMetrics.objects.get()
+        assert rec.month_for == start_date
+        assert rec.active_user_count == metrics.get_active_users_for_time_period(
+            start_date, end_date)
+        assert rec.total_user_count == \
+            metrics.get_total_site_users_for_time_period(start_date, end_date) == 13
+        assert rec.course_count == \
+            metrics.get_total_site_courses_for_time_period(start_date, end_date) == 3
+        assert rec.total_enrollment_count == \
+            metrics.get_total_enrollments_for_time_period(start_date, end_date) == 23
+        assert rec.num_learners_completed == \
+            metrics.get_total_course_completions_for_time_period(
+                start_date, end_date) == 7
+
+    def test_update_monthly_metrics(self):
+        SiteDailyMetricsFactory(date_for=datetime.date(2018, 4, 30))
+        results = monthly_metrics.update_monthly_metrics(
+            datetime.date(2018, 1, 31), datetime.date(2018, 4, 30))
+        assert results == dict(course_monthly_metrics=1, site_monthly_metrics=4)
+        assert list(SiteMonthlyMetrics.objects.values_list(
+            'month_for', flat=True)) == [datetime.date(2018, month, 1)
+                                         for month in range(1, 5)]
+
+
+@pytest.mark.django_db
+class TestMonthlyHistory(object):
+    '''The history reads the rolled up months with one query
+    '''
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        self.date_for = datetime.date(2018, 6, 15)
+        for month in range(1, 7):
+            SiteMonthlyMetrics.objects.create(
+                month_for=datetime.date(2018, month, 1),
+                active_user_count=month,
+                total_user_count=10 * month,
+                course_count=2,
+                total_enrollment_count=100 * month,
+                num_learners_completed=month)
+
+    def test_get_monthly_site_metrics(self):
+        with count_queries() as counter:
+            actual = metrics.get_monthly_site_metrics(
+                date_for=self.date_for, months_back=5)
+        assert counter.count == 1
+        assert actual['monthly_active_users']['current_month'] == 6
+        assert [rec['value'] for rec in actual['total_site_users']['history']] == [
+            10, 20, 30, 40, 50, 60]
+        assert actual['total_course_enrollments']['current_month'] == 600
+
+    def test_months_without_rollups(self):
+        SiteMonthlyMetrics.objects.filter(month_for=datetime.date(2018, 3, 1)).delete()
+        SiteDailyMetricsFactory(
+            date_for=datetime.date(2018, 3, 10), total_user_count=33)
+        actual = metrics.get_monthly_site_metrics(
+            date_for=self.date_for, months_back=5)
+        assert [rec['value'] for rec in actual['total_site_users']['history']] == [
+            10, 20, 33, 40, 50, 60]
+
+    def test_without_rollups(self):
+        SiteMonthlyMetrics.objects.all().delete()
+        SiteDailyMetricsFactory(
+            date_for=datetime.date(2018, 3, 10), total_user_count=33)
+        with count_queries() as counter:
+            actual = metrics.get_monthly_site_metrics(
+                date_for=self.date_for, months_back=5)
+        # The rollups, the site and course daily metrics, the sketches and
+        # the StudentModule records
+        assert counter.count == 5
+        assert [rec['value'] for rec in actual['total_site_users']['history']] == [
+            0, 0, 33, 0, 0, 0]
+
+    def test_get_monthly_history_metric_with_function(self):
+        def func(start_date, end_date, course_id=None):
+            assert course_id == COURSE_IDS[0]
+            return start_date.month
+
+        actual = metrics.get_monthly_history_metric(
+            func, self.date_for, 5, course_id=COURSE_IDS[0])
+        assert actual['current_month'] == 6
+        assert [rec['value'] for rec in actual['history']] == [1, 2, 3, 4, 5, 6]
+
+    def test_get_monthly_history_metric_with_metric(self):
+        monthly = SiteMonthlyMetrics.objects.for_months(
+            metrics.history_start_date(self.date_for, 5), self.date_for)
+        actual = metrics.get_monthly_history_metric(
+            metrics.TOTAL_SITE_USERS, self.date_for, 5, monthly=monthly)
+        assert actual['current_month'] == 60
+        assert [rec['value'] for rec in actual['history']] == [
+            10, 20, 30, 40, 50, 60]
+
+    def test_get_monthly_history_metric_without_current(self):
+        actual = metrics.get_monthly_history_metric(
+            lambda start_date, end_date: start_date.month, self.date_for, 5,
+            include_current_in_history=False)
+        assert actual['current_month'] == 6
+        assert [rec['value'] for rec in actual['history']] == [1, 2, 3, 4, 5]
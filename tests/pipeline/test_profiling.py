@@ -0,0 +1,99 @@
+'''Tests figures.pipeline.profiling
+'''
+
+import datetime
+import json
+import pstats
+import pytest
+
+from figures.helpers import as_datetime
+from figures.models import SiteDailyMetrics
+from figures.pipeline.instrumentation import PipelineStats
+from figures.pipeline.profiling import (
+    PipelineProfiler,
+    profile_course,
+    profiling,
+)
+from figures import tasks
+
+from tests.factories import CourseEnrollmentFactory, CourseOverviewFactory
+
+
+@pytest.mark.django_db
+class TestPipelineProfiler(object):
+
+    def profile(self, profiler, course_id, queries, learners):
+        stats = PipelineStats()
+        with profiling(profiler):
+            with profile_course(course_id, stats):
+                for i in range(queries):
+                    SiteDailyMetrics.objects.count()
+                stats.learners_processed = learners
+
+    def test_no_active_profiler(self):
+        with profile_course('course-v1:a+b+c', PipelineStats()) as course:
+            assert course is None
+
+    def test_course(self):
+        profiler = PipelineProfiler()
+        self.profile(profiler, 'course-v1:a+b+c', queries=2, learners=10)
+        course = profiler.courses[0]
+        assert course.course_id == 'course-v1:a+b+c'
+        assert course.query_count == 2
+        assert course.learners_processed == 10
+        assert course.duration >= 0
+        assert course.profile.getstats()
+
+    def test_course_error(self):
+        profiler = PipelineProfiler(use_cprofile=False)
+        with pytest.raises(ValueError):
+            with profiling(profiler):
+                with profile_course('course-v1:a+b+c', PipelineStats()):
+                    raise ValueError()
+        assert profiler.courses[0].error == 'ValueError'
+        assert profiler.courses[0].profile is None
+
+    def test_report(self):
+        profiler = PipelineProfiler(use_cprofile=False)
+        self.profile(profiler, 'course-v1:a+b+c', queries=1, learners=30)
+        self.profile(profiler, 'course-v1:d+e+f', queries=3, learners=20)
+        report = profiler.report()
+        assert report['course_count'] == 2
+        assert report['query_count'] == 4
+        assert report['learners_processed'] == 50
+        assert report['rankings']['query_count'] == [
+            'course-v1:d+e+f', 'course-v1:a+b+c']
+        assert report['rankings']['learners_processed'] == [
+            'course-v1:a+b+c', 'course-v1:d+e+f']
+
+    def test_write_report(self, tmpdir):
+        profiler = PipelineProfiler()
+        for course_id in ['course-v1:a+b+c', 'course-v1:d+e+f']:
+            self.profile(profiler, course_id, queries=1, learners=1)
+        path = str(tmpdir.join('report.json'))
+        profiler.write_report(path, profile_top=1, run_id=7)
+        with open(path) as f:
+            report = json.load(f)
+        assert report['run_id'] == 7
+        assert len(report['courses']) == 2
+        assert list(report['profiles'].keys()) == [report['rankings']['duration'][0]]
+        pstats.Stats(list(report['profiles'].values())[0])
+
+
+@pytest.mark.django_db
+class TestProfileDailyMetrics(object):
+
+    def test_serial_pipeline(self):
+        date_for = datetime.date(2018, 6, 1)
+        course_overviews = [CourseOverviewFactory() for i in range(2)]
+        for co in course_overviews:
+            CourseEnrollmentFactory(
+                course_overview=co,
+                created=as_datetime(date_for - datetime.timedelta(days=1)))
+        profiler = PipelineProfiler(use_cprofile=False)
+        with profiling(profiler):
+            tasks.populate_daily_metrics(date_for=date_for)
+        assert set(course.course_id for course in profiler.courses) == set(
+            str(co.id) for co in course_overviews)
+        assert all(course.query_count > 0 for course in profiler.courses)
+        assert all(course.learners_processed == 1 for course in profiler.courses)
@@ -0,0 +1,125 @@
+'''Tests figures.pipeline.runs
+'''
+
+import datetime
+import mock
+import pytest
+
+from figures.models import CourseDailyMetrics, PipelineCourseRun, PipelineRun
+from figures.pipeline import runs
+
+from tests.factories import CourseOverviewFactory
+
+
+@pytest.mark.django_db
+class TestPipelineRunBarrier(object):
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        self.date_for = datetime.date(2018, 6, 1)
+        self.course_overviews = [CourseOverviewFactory() for i in range(2)]
+        self.run = runs.start_pipeline_run(
+            self.date_for, [co.id for co in self.course_overviews])
+
+    def test_start_pipeline_run(self):
+        assert self.run.status == PipelineRun.RUNNING
+        assert set(self.run.course_runs.values_list('course_id', flat=True)) == set(
+            str(co.id) for co in self.course_overviews)
+        assert set(self.run.course_runs.values_list('status', flat=True)) == set(
+            [PipelineCourseRun.PENDING])
+
+    def test_run_course(self):
+        course_run = self.run.course_runs.first()
+        assert runs.run_course(course_run)
+        course_run.refresh_from_db()
+        assert course_run.status == PipelineCourseRun.COMPLETE
+        assert course_run.attempts == 1
+        assert course_run.started <= course_run.finished
+        assert set(course_run.stage_durations.keys()) == set(
+            ['enrollment_count', 'active_learners_today',
+             'num_learners_completed', 'grades', 'days_to_complete', 'load'])
+        assert course_run.query_count > 0
+        assert course_run.error_count == 0
+        assert not course_run.partial
+
+    def test_run_course_records_partial(self):
+        course_run = self.run.course_runs.first()
+
+        def get_average_progress(course_id, date_for, course_enrollments, **kwargs):
+            kwargs['stats'].partial = True
+            return 0.0
+
+        with mock.patch(
+                'figures.pipeline.course_daily_metrics.get_average_progress',
+                get_average_progress):
+            assert runs.run_course(course_run)
+        course_run.refresh_from_db()
+        assert course_run.partial
+        assert CourseDailyMetrics.objects.get(
+            course_id=course_run.course_id, date_for=self.date_for).partial
+        assert CourseDailyMetrics.objects.filter(
+            course_id=course_run.course_id, date_for=self.date_for).exists()
+
+    @mock.patch('figures.pipeline.runs.CourseDailyMetricsLoader.load',
+                side_effect=Exception('boom'))
+    def test_run_course_failure(self, mock_load):
+        course_run = self.run.course_runs.first()
+        with mock.patch('figures.settings.env_tokens',
+                        {'PIPELINE_COURSE_MAX_ATTEMPTS': 2}):
+            assert not runs.run_course(course_run)
+            assert course_run.status == PipelineCourseRun.PENDING
+            assert not runs.run_course(course_run)
+        course_run.refresh_from_db()
+        assert course_run.status == PipelineCourseRun.FAILED
+        assert course_run.attempts == 2
+        assert course_run.error == 'boom'
+
+    def test_start_or_resume_pipeline_run(self):
+        serial_run, resumed = runs.start_or_resume_pipeline_run(
+            self.date_for, [self.course_overviews[0].id])
+        assert not resumed
+        assert serial_run.mode == PipelineRun.SERIAL
+
+        new_course = CourseOverviewFactory()
+        course_ids = [co.id for co in self.course_overviews] + [new_course.id]
+        resumed_run, resumed = runs.start_or_resume_pipeline_run(
+            self.date_for, course_ids)
+        assert resumed
+        assert resumed_run.id == serial_run.id
+        assert resumed_run.course_runs.count() == 3
+
+    def test_start_or_resume_finished_run(self):
+        serial_run, resumed = runs.start_or_resume_pipeline_run(
+            self.date_for, [self.course_overviews[0].id])
+        runs.finish_run(serial_run, PipelineRun.COMPLETE)
+        new_run, resumed = runs.start_or_resume_pipeline_run(
+            self.date_for, [self.course_overviews[0].id])
+        assert not resumed
+        assert new_run.id != serial_run.id
+
+    def test_incomplete_course_runs(self):
+        course_runs = list(self.run.course_runs.order_by('id'))
+        runs.run_course(course_runs[0])
+        assert list(runs.incomplete_course_runs(self.run)) == course_runs[1:]
+
+    def test_claim_run_finalization(self):
+        course_runs = list(self.run.course_runs.all())
+        runs.run_course(course_runs[0])
+        assert not runs.claim_run_finalization(self.run)
+        course_runs[1].status = PipelineCourseRun.FAILED
+        course_runs[1].save()
+        assert runs.claim_run_finalization(self.run)
+        # Only one caller gets to finalize
+        assert not runs.claim_run_finalization(self.run)
+        self.run.refresh_from_db()
+        assert self.run.status == PipelineRun.FINALIZING
+
+    def test_fail_unfinished_course_runs(self):
+        runs.run_course(self.run.course_runs.first())
+        assert runs.fail_unfinished_course_runs(self.run) == 1
+        assert self.run.course_runs.filter(
+            status=PipelineCourseRun.FAILED).count() == 1
+
+    @pytest.mark.parametrize('attempts, expected', [(1, 60), (2, 120), (3, 240)])
+    def test_retry_countdown(self, attempts, expected):
+        with mock.patch('figures.settings.env_tokens', {}):
+            assert runs.retry_countdown(attempts) == expected
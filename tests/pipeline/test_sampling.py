@@ -0,0 +1,143 @@
+'''Tests figures.pipeline.sampling
+'''
+
+import datetime
+import pytest
+
+from figures.pipeline import sampling
+
+
+@pytest.mark.parametrize('progress, expected', [
+    (None, None),
+    (0.0, 0),
+    (0.1, 1),
+    (0.25, 1),
+    (0.5, 2),
+    (0.6, 3),
+    (1.0, 4),
+])
+def test_progress_stratum(progress, expected):
+    assert sampling.progress_stratum(progress) == expected
+
+
+@pytest.mark.parametrize('population, sample_size, max_days, expected', [
+    (100000, 2000, 30, 30),
+    (100000, 10000, 30, 10),
+    (1000, 2000, 30, 1),
+    (1000, 0, 30, 1),
+])
+def test_rotation_slots(population, sample_size, max_days, expected):
+    assert sampling.rotation_slots(population, sample_size, max_days) == expected
+
+
+def test_rotation_covers_every_learner():
+    slots = 7
+    date_for = datetime.date(2018, 6, 1)
+    graded = set()
+    for day in range(slots):
+        graded.update(
+            user_id for user_id in range(1000)
+            if sampling.in_sample(user_id, date_for, date_for + datetime.timedelta(day),
+                                  slots, max_days=30))
+    assert graded == set(range(1000))
+
+
+def test_rotation_spreads_learners():
+    slot_counts = [0] * 10
+    for user_id in range(10000):
+        slot_counts[sampling.rotation_slot(user_id, 10)] += 1
+    assert min(slot_counts) > 900
+
+
+def test_stale_and_new_learners_are_sampled():
+    date_for = datetime.date(2018, 6, 30)
+    user_id = next(user_id for user_id in range(100)
+                   if not sampling.in_sample(user_id, date_for, date_for, 10, 30))
+    assert sampling.in_sample(user_id, None, date_for, 10, 30)
+    assert sampling.in_sample(
+        user_id, date_for - datetime.timedelta(days=29), date_for, 10, 30)
+
+
+def test_grades_age():
+    date_for = datetime.date(2018, 6, 30)
+    # Graded in the run for the day before
+    assert sampling.grades_age(datetime.datetime(2018, 6, 30, 2), date_for) == 1
+    assert sampling.grades_age(datetime.date(2018, 6, 1), date_for) == 30
+
+
+def test_max_days_when_population_changes():
+    """Learners are graded at least every ``max_days`` days, even when the
+    rotation changes with the population from one day to the next
+    """
+    sample_size = 20
+    max_days = 30
+    start_date = datetime.date(2018, 1, 1)
+    graded_at = {}
+    longest_gap = 0
+    for day in range(4 * max_days):
+        date_for = start_date + datetime.timedelta(days=day)
+        # The population alternates between 580 and 600 learners
+        population = 580 if day % 2 else 600
+        slots = sampling.rotation_slots(population, sample_size, max_days)
+        # The run for the day is after midnight
+        run_time = datetime.datetime.combine(
+            date_for + datetime.timedelta(days=1), datetime.time(2))
+        for user_id in range(population):
+            last_graded = graded_at.get(user_id)
+            if sampling.in_sample(user_id, last_graded, date_for, slots, max_days):
+                if last_graded:
+                    longest_gap = max(longest_gap, (run_time - last_graded).days)
+                graded_at[user_id] = run_time
+    assert 0 < longest_gap <= max_days
+
+
+def test_sample_size_for_error():
+    values = [0.0, 1.0] * 500
+    # The variance is about 0.25, so n is about 1.96 ** 2 * 0.25 / 0.05 ** 2
+    assert sampling.sample_size_for_error(values, 0.05, 10 ** 6) == 385
+    # The finite population correction makes it smaller for a smaller course
+    assert sampling.sample_size_for_error(values, 0.05, 1000) == 278
+    assert sampling.sample_size_for_error([0.5], 0.05, 1000) == 1000
+
+
+def test_sample_size_for_error_without_variance():
+    """Everyone at the same progress does not turn the rotation off
+    """
+    sample_size = sampling.sample_size_for_error([0.0] * 1000, 0.05, 60000)
+    assert sample_size == sampling.MIN_SAMPLE_SIZE
+    assert sampling.rotation_slots(60000, sample_size, 30) == 30
+    assert sampling.sample_size_for_error([0.0] * 10, 0.05, 10) == 10
+
+
+def test_sample_size_for_error_empty_population():
+    assert sampling.sample_size_for_error([0.0, 1.0], 0.05, 0) == 0
+
+
+class TestStratifiedEstimate(object):
+
+    def test_estimate(self):
+        strata = {
+            0: (600, [0.0, 0.0, 0.0], [0.0]),
+            4: (400, [0.8, 1.0], [0.9]),
+        }
+        estimate = sampling.stratified_estimate(strata)
+        assert estimate.average == pytest.approx(0.4 * 0.9)
+        assert estimate.sample_size == 5
+        assert estimate.lower < estimate.average < estimate.upper
+        half_width = sampling.Z_95 * (0.4 ** 2 * (1 - 2 / 400.0) * 0.02 / 2) ** 0.5
+        assert estimate.upper - estimate.average == pytest.approx(half_width)
+
+    def test_fully_graded(self):
+        strata = {None: (2, [0.2, 0.4], [])}
+        estimate = sampling.stratified_estimate(strata)
+        assert estimate.average == pytest.approx(0.3)
+        assert estimate.lower == estimate.upper == pytest.approx(0.3)
+
+    def test_stratum_with_nothing_graded(self):
+        strata = {1: (2, [], [0.2, 0.2]), 3: (2, [0.6], [0.7])}
+        estimate = sampling.stratified_estimate(strata)
+        assert estimate.average == pytest.approx(0.4)
+
+    def test_empty(self):
+        assert sampling.stratified_estimate({}) == sampling.ProgressEstimate(
+            0.0, 0.0, 0.0, 0)
@@ -0,0 +1,71 @@
+'''Tests figures.pipeline.scheduler
+'''
+
+import datetime
+import pytest
+
+from figures.models import PipelineCourseRun, PipelineRun
+from figures.pipeline import runs, scheduler
+
+
+class TestScheduleCourses(object):
+
+    def test_expensive_first(self):
+        costs = {'a': 100, 'b': 300, 'c': 200}
+        batches = scheduler.schedule_courses(costs, batch_seconds=50)
+        assert [batch.course_ids for batch in batches] == [['b'], ['c'], ['a']]
+
+    def test_packs_small_courses(self):
+        costs = {'big': 100, 'a': 30, 'b': 20, 'c': 20, 'd': 10, 'e': 5}
+        batches = scheduler.schedule_courses(costs, batch_seconds=50)
+        assert batches[0] == scheduler.CourseBatch(['big'], 100)
+        assert [batch.course_ids for batch in batches[1:]] == [
+            ['a', 'b'], ['c', 'd', 'e']]
+        assert all(batch.cost <= 50 for batch in batches[1:])
+
+    def test_no_packing(self):
+        costs = {'a': 1, 'b': 2}
+        batches = scheduler.schedule_courses(costs, batch_seconds=0)
+        assert [batch.course_ids for batch in batches] == [['b'], ['a']]
+
+    def test_empty(self):
+        assert scheduler.schedule_courses({}) == []
+
+
+@pytest.mark.django_db
+class TestEstimateCourseCosts(object):
+
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        self.date_for = datetime.date(2018, 6, 2)
+        run = runs.start_pipeline_run(
+            datetime.date(2018, 6, 1), ['course-a', 'course-b'])
+        course_run = run.course_runs.get(course_id='course-a')
+        course_run.status = PipelineCourseRun.COMPLETE
+        course_run.stage_durations = {'grades': 40.0, 'load': 1.0}
+        course_run.learners_processed = 20
+        course_run.save()
+        PipelineCourseRun.objects.filter(run=run, course_id='course-b').update(
+            status=PipelineCourseRun.FAILED)
+        runs.finish_run(run, PipelineRun.COMPLETE)
+
+    def test_estimate(self):
+        course_counts = {
+            'course-a': {'enrollment_count': 1000},
+            'course-b': {'enrollment_count': 10},
+        }
+        costs = scheduler.estimate_course_costs(
+            ['course-a', 'course-b', 'course-c'], course_counts,
+            before_date=self.date_for)
+        # course-a took 41 seconds last time, so 2 seconds per learner
+        assert costs['course-a'] == 41.0
+        assert costs['course-b'] == scheduler.COURSE_OVERHEAD_SECONDS + 10 * 2.0
+        assert costs['course-c'] == scheduler.COURSE_OVERHEAD_SECONDS
+
+    def test_no_history(self):
+        costs = scheduler.estimate_course_costs(
+            ['course-a'], {'course-a': {'enrollment_count': 10}},
+            before_date=datetime.date(2018, 6, 1))
+        assert costs['course-a'] == (
+            scheduler.COURSE_OVERHEAD_SECONDS +
+            10 * scheduler.DEFAULT_SECONDS_PER_LEARNER)
@@ -18,11 +18,17 @@ from openedx.core.djangoapps.content.course_overviews.models import (
 from figures.helpers import as_datetime, prev_day
 from figures.models import SiteDailyMetrics
 from figures.pipeline import site_daily_metrics as pipeline_sdm
+from figures.pipeline.instrumentation import (
+    MemorySpanSink,
+    PipelineStats,
+    span_sink,
+)
 
 from tests.factories import (
     CourseDailyMetricsFactory,
     CourseOverviewFactory,
     SiteDailyMetricsFactory,
+    StudentModuleFactory,
     UserFactory,
 )
 
@@ -173,9 +179,23 @@ class TestSiteDailyMetricsExtractor(object):
             **SDM_PREV_DAY[1])
 
     def test_extract(self):
+        # Two of the users are active in the site today, one of them in two
+        # courses. Activity on the day before is not counted
+        for user, course in [(self.users[0], self.course_overviews[0]),
+                             (self.users[0], self.course_overviews[1]),
+                             (self.users[1], self.course_overviews[1])]:
+            StudentModuleFactory(
+                student=user,
+                course_id=course.id,
+                modified=as_datetime(self.date_for) + datetime.timedelta(hours=1))
+        StudentModuleFactory(
+            student=self.users[2],
+            course_id=self.course_overviews[2].id,
+            modified=as_datetime(prev_day(self.date_for)))
+
         expected_results = dict(
-            cumulative_active_user_count=65,
-            todays_active_user_count=15,
+            cumulative_active_user_count=52,
+            todays_active_user_count=2,
             total_user_count=len(self.users),
             course_count=len(CDM_INPUT_TEST_DATA),
             total_enrollment_count=150,
@@ -191,6 +211,30 @@ class TestSiteDailyMetricsExtractor(object):
         for key, value in expected_results.iteritems():
             assert actual[key] == value, 'failed on key: "{}"'.format(key)
 
+    def test_extract_with_active_user_count(self):
+        actual = pipeline_sdm.SiteDailyMetricsExtractor().extract(
+            date_for=self.date_for, todays_active_user_count=4)
+        assert actual['todays_active_user_count'] == 4
+        assert actual['cumulative_active_user_count'] == 54
+
+    def test_extract_spans(self):
+        stats = PipelineStats()
+        with span_sink(MemorySpanSink()) as sink:
+            pipeline_sdm.SiteDailyMetricsExtractor().extract(
+                date_for=self.date_for, stats=stats)
+        stages = ['user_count',
+                  'course_count',
+                  'todays_active_user_count',
+                  'cumulative_active_user_count',
+                  'total_enrollment_count']
+        assert [span['name'] for span in sink.spans] == stages
+        assert list(stats.stage_durations.keys()) == stages
+        for span in sink.spans:
+            assert span['extractor'] == 'site_daily_metrics'
+            assert span['date_for'] == self.date_for
+            assert span['query_count'] > 0
+        assert stats.query_count == sum(span['query_count'] for span in sink.spans)
+
 
 @pytest.mark.django_db
 class TestSiteDailyMetricsLoader(object):
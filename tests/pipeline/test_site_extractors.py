@@ -0,0 +1,237 @@
+'''Tests figures.pipeline.site_extractors
+'''
+
+import datetime
+import pytest
+
+from figures.helpers import as_datetime, next_day, prev_day
+from figures.pipeline import site_extractors
+from figures.pipeline.instrumentation import count_queries
+
+from tests.factories import (
+    CourseAccessRoleFactory,
+    CourseEnrollmentFactory,
+    CourseOverviewFactory,
+    GeneratedCertificateFactory,
+    StudentModuleFactory,
+    UserFactory,
+)
+
+
+@pytest.mark.django_db
+class TestGetActiveLearnersForDate(object):
+    '''Tests the single site-wide pass over the day's StudentModule rows
+    '''
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        self.date_for = datetime.date(2018, 6, 1)
+        self.course_overviews = [CourseOverviewFactory() for i in range(3)]
+        self.users = [UserFactory() for i in range(3)]
+
+    def add_activity(self, user, course_overview, modified):
+        return StudentModuleFactory(
+            student=user,
+            course_id=course_overview.id,
+            modified=modified)
+
+    def test_no_activity(self):
+        actual = site_extractors.get_active_learners_for_date(self.date_for)
+        assert actual == dict(course_counts={}, site_count=0,
+                              course_user_ids={}, site_user_ids=set())
+
+    def test_counts(self):
+        day_start = as_datetime(self.date_for)
+        # Learner 0 is active in two courses and twice in one of them
+        self.add_activity(self.users[0], self.course_overviews[0], day_start)
+        self.add_activity(self.users[0], self.course_overviews[0],
+                          day_start + datetime.timedelta(hours=23))
+        self.add_activity(self.users[0], self.course_overviews[1],
+                          day_start + datetime.timedelta(hours=2))
+        self.add_activity(self.users[1], self.course_overviews[1],
+                          day_start + datetime.timedelta(hours=5))
+        # Activity outside the day is not counted
+        self.add_activity(self.users[2], self.course_overviews[2],
+                          as_datetime(prev_day(self.date_for)))
+        self.add_activity(self.users[2], self.course_overviews[2],
+                          as_datetime(next_day(self.date_for)))
+
+        actual = site_extractors.get_active_learners_for_date(self.date_for)
+        assert actual == dict(
+            course_counts={
+                str(self.course_overviews[0].id): 1,
+                str(self.course_overviews[1].id): 2,
+            },
+            site_count=2,
+            course_user_ids={
+                str(self.course_overviews[0].id): set([self.users[0].id]),
+                str(self.course_overviews[1].id): set([self.users[0].id,
+                                                       self.users[1].id]),
+            },
+            site_user_ids=set([self.users[0].id, self.users[1].id]))
+
+    def test_user_ids_for_dates(self):
+        day_start = as_datetime(self.date_for)
+        self.add_activity(self.users[0], self.course_overviews[0], day_start)
+        self.add_activity(self.users[1], self.course_overviews[1],
+                          day_start + datetime.timedelta(hours=23))
+        # The day in between is not asked for
+        self.add_activity(self.users[2], self.course_overviews[0],
+                          as_datetime(next_day(self.date_for)))
+        self.add_activity(self.users[2], self.course_overviews[1],
+                          as_datetime(next_day(next_day(self.date_for))))
+        # Staff activity in the course is not counted
+        CourseAccessRoleFactory(user=self.users[0],
+                                course_id=self.course_overviews[1].id,
+                                role='staff')
+        self.add_activity(self.users[0], self.course_overviews[1], day_start)
+        dates = [self.date_for, next_day(next_day(self.date_for))]
+
+        with count_queries() as counter:
+            actual = site_extractors.get_active_user_ids_for_dates(dates)
+        assert counter.count == 2
+        assert actual == {
+            dates[0]: set([self.users[0].id, self.users[1].id]),
+            dates[1]: set([self.users[2].id]),
+        }
+        actual = site_extractors.get_active_user_ids_for_dates(
+            dates, course_ids=[self.course_overviews[1].id])
+        assert actual == {dates[0]: set([self.users[1].id]),
+                          dates[1]: set([self.users[2].id])}
+
+
+@pytest.mark.django_db
+class TestGetCourseCountsForDate(object):
+    '''Tests the grouped per-course counters
+    '''
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        self.date_for = datetime.date(2018, 6, 1)
+        self.course_overviews = [CourseOverviewFactory() for i in range(3)]
+        before = as_datetime(self.date_for) + datetime.timedelta(hours=12)
+        after = as_datetime(next_day(self.date_for))
+        # Course 0: two enrollments, one certificate. Course 1: one
+        # enrollment on the day and one after. Course 2: nothing
+        self.course_enrollments = [
+            CourseEnrollmentFactory(course_id=self.course_overviews[0].id,
+                                    created=before),
+            CourseEnrollmentFactory(course_id=self.course_overviews[0].id,
+                                    created=before),
+            CourseEnrollmentFactory(course_id=self.course_overviews[1].id,
+                                    created=before),
+            CourseEnrollmentFactory(course_id=self.course_overviews[1].id,
+                                    created=after),
+        ]
+        GeneratedCertificateFactory(
+            user=self.course_enrollments[0].user,
+            course_id=self.course_overviews[0].id,
+            created_date=before)
+        GeneratedCertificateFactory(
+            user=self.course_enrollments[2].user,
+            course_id=self.course_overviews[1].id,
+            created_date=after)
+        StudentModuleFactory(
+            student=self.course_enrollments[1].user,
+            course_id=self.course_overviews[0].id,
+            modified=before)
+
+    def test_get_enrollment_counts_for_date(self):
+        actual = site_extractors.get_enrollment_counts_for_date(self.date_for)
+        assert actual == {
+            str(self.course_overviews[0].id): 2,
+            str(self.course_overviews[1].id): 1,
+        }
+
+    def test_get_certificate_counts_for_date(self):
+        actual = site_extractors.get_certificate_counts_for_date(self.date_for)
+        assert actual == {str(self.course_overviews[0].id): 1}
+
+    def test_get_course_counts_for_date(self):
+        site_course_counts = site_extractors.get_course_counts_for_date(
+            self.date_for)
+        assert site_course_counts['site_active_learners'] == 1
+        assert site_extractors.counts_for_course(
+            site_course_counts, self.course_overviews[0].id) == dict(
+                enrollment_count=2,
+                active_learners_today=1,
+                num_learners_completed=1)
+        assert site_extractors.counts_for_course(
+            site_course_counts, self.course_overviews[1].id) == dict(
+                enrollment_count=1,
+                active_learners_today=0,
+                num_learners_completed=0)
+        assert site_extractors.counts_for_course(
+            site_course_counts, self.course_overviews[2].id) == dict(
+                enrollment_count=0,
+                active_learners_today=0,
+                num_learners_completed=0)
+
+
+@pytest.mark.django_db
+class TestCourseStaffExclusion(object):
+    '''Tests that the course staff are left out of the learner counts
+    '''
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        self.date_for = datetime.date(2018, 6, 1)
+        self.course_overviews = [CourseOverviewFactory() for i in range(2)]
+        created = as_datetime(self.date_for)
+        self.course_enrollments = [
+            CourseEnrollmentFactory(course_id=co.id, created=created)
+            for co in self.course_overviews for i in range(3)]
+        # The first learner in course 0 is on its staff and is also a learner
+        # in course 1
+        self.staff_user = self.course_enrollments[0].user
+        CourseAccessRoleFactory(
+            user=self.staff_user, course_id=self.course_overviews[0].id,
+            role='staff')
+        CourseEnrollmentFactory(
+            user=self.staff_user, course_id=self.course_overviews[1].id,
+            created=created)
+        # Instructor of course 1
+        CourseAccessRoleFactory(
+            user=self.course_enrollments[3].user,
+            course_id=self.course_overviews[1].id,
+            role='instructor')
+        # Roles that are not course staff roles do not count
+        CourseAccessRoleFactory(
+            user=self.course_enrollments[4].user,
+            course_id=self.course_overviews[1].id,
+            role='beta_testers')
+        for ce in self.course_enrollments + [self.course_enrollments[0]]:
+            StudentModuleFactory(student=ce.user, course_id=ce.course_id,
+                                 modified=created)
+        StudentModuleFactory(student=self.staff_user,
+                             course_id=self.course_overviews[1].id,
+                             modified=created)
+
+    def test_index(self):
+        index = site_extractors.CourseStaffIndex()
+        assert index.users_for(self.course_overviews[0].id) == set([self.staff_user.id])
+        assert index.is_staff(str(self.course_overviews[0].id), self.staff_user.id)
+        assert not index.is_staff(str(self.course_overviews[1].id), self.staff_user.id)
+
+    def test_index_for_courses(self):
+        index = site_extractors.CourseStaffIndex([self.course_overviews[0].id])
+        assert index.all_user_ids == set([self.staff_user.id])
+
+    def test_enrollment_counts(self):
+        actual = site_extractors.get_enrollment_counts_for_date(self.date_for)
+        assert actual == {
+            str(self.course_overviews[0].id): 2,
+            str(self.course_overviews[1].id): 3,
+        }
+
+    def test_active_learners(self):
+        actual = site_extractors.get_active_learners_for_date(self.date_for)
+        assert actual['course_counts'] == {
+            str(self.course_overviews[0].id): 2,
+            str(self.course_overviews[1].id): 3,
+        }
+        assert actual['site_count'] == 5
+        assert len(actual['site_user_ids']) == 5
+
+    def test_no_per_course_queries(self):
+        with count_queries() as counter:
+            site_extractors.get_course_counts_for_date(self.date_for)
+        # Roles, activity, enrollments, staff enrollments and certificates
+        assert counter.count == 5
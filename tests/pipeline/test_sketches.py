@@ -0,0 +1,118 @@
+'''Tests figures.pipeline.sketches and the ActiveUsersSketch manager
+'''
+
+import datetime
+import pytest
+
+from figures.hll import HyperLogLog
+from figures.models import ActiveUsersSketch
+from figures.pipeline import sketches
+
+COURSE_IDS = ['course-v1:FigX+A01+2018', 'course-v1:FigX+B01+2018']
+
+
+def active_learners(course_user_ids):
+    site_user_ids = set()
+    for user_ids in course_user_ids.values():
+        site_user_ids.update(user_ids)
+    return dict(course_user_ids=course_user_ids, site_user_ids=site_user_ids)
+
+
+@pytest.mark.django_db
+class TestSaveActiveUserSketches(object):
+
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        self.date_for = datetime.date(2018, 6, 1)
+
+    def test_save(self):
+        rows = sketches.save_active_user_sketches(self.date_for, active_learners({
+            COURSE_IDS[0]: set(range(10)),
+            COURSE_IDS[1]: set(range(5, 25)),
+        }))
+        assert rows == 3
+        site = ActiveUsersSketch.objects.get(date_for=self.date_for, course_id='')
+        assert site.user_count == 25
+        assert HyperLogLog.from_bytes(site.sketch).count() == 25
+        course = ActiveUsersSketch.objects.get(course_id=COURSE_IDS[1])
+        assert course.user_count == 20
+        assert HyperLogLog.from_bytes(course.sketch).count() == 20
+
+    def test_site_sketch_without_activity(self):
+        assert sketches.save_active_user_sketches(
+            self.date_for, active_learners({})) == 1
+        site = ActiveUsersSketch.objects.get()
+        assert site.course_id == ''
+        assert site.user_count == 0
+        assert HyperLogLog.from_bytes(site.sketch).count() == 0
+
+    def test_replaces_existing(self):
+        sketches.save_active_user_sketches(self.date_for, active_learners({
+            COURSE_IDS[0]: set(range(10)),
+        }))
+        sketches.save_active_user_sketches(self.date_for, active_learners({
+            COURSE_IDS[0]: set(range(3)),
+        }))
+        assert ActiveUsersSketch.objects.count() == 2
+        assert ActiveUsersSketch.objects.get(
+            course_id=COURSE_IDS[0]).user_count == 3
+
+
+@pytest.mark.django_db
+class TestActiveUsersSketchManager(object):
+
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        self.start_date = datetime.date(2018, 6, 1)
+        for day in range(3):
+            sketches.save_active_user_sketches(
+                self.start_date + datetime.timedelta(days=day),
+                active_learners({
+                    COURSE_IDS[0]: set(range(day * 10, day * 10 + 15)),
+                    COURSE_IDS[1]: set(range(100, 105)),
+                }))
+
+    def test_merged_site(self):
+        sketch = ActiveUsersSketch.objects.merged(
+            self.start_date, self.start_date + datetime.timedelta(days=2))
+        assert sketch.count() == 40
+
+    def test_merged_range(self):
+        sketch = ActiveUsersSketch.objects.merged(
+            self.start_date + datetime.timedelta(days=1),
+            self.start_date + datetime.timedelta(days=1))
+        assert sketch.count() == 20
+
+    def test_merged_courses(self):
+        assert ActiveUsersSketch.objects.merged(
+            self.start_date, self.start_date + datetime.timedelta(days=2),
+            course_ids=[COURSE_IDS[0]]).count() == 35
+        assert ActiveUsersSketch.objects.merged(
+            self.start_date, self.start_date + datetime.timedelta(days=2),
+            course_ids=COURSE_IDS).count() == 40
+
+    def test_merged_none(self):
+        assert ActiveUsersSketch.objects.merged(
+            datetime.date(2018, 1, 1), datetime.date(2018, 1, 31)) is None
+
+    def test_merged_for_periods_coverage(self):
+        end_date = self.start_date + datetime.timedelta(days=4)
+        merged = ActiveUsersSketch.objects.merged_for_periods([
+            (self.start_date, end_date),
+            (datetime.date(2018, 5, 30), datetime.date(2018, 5, 31)),
+        ])
+        assert merged[0][0].count() == 40
+        assert merged[0][1] == [self.start_date + datetime.timedelta(days=3),
+                                end_date]
+        assert merged[1] == (None, [datetime.date(2018, 5, 30),
+                                    datetime.date(2018, 5, 31)])
+
+    def test_merged_course_without_sketches(self):
+        '''The site sketches cover the days for courses too, so a course with
+        no sketches on the days had no active users
+        '''
+        [(sketch, uncovered)] = ActiveUsersSketch.objects.merged_for_periods(
+            [(self.start_date, self.start_date + datetime.timedelta(days=2))],
+            course_ids=['course-v1:FigX+C01+2018'])
+        assert sketch.count() == 0
+        assert uncovered == []
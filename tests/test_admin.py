@@ -8,15 +8,21 @@ from django.contrib.admin.sites import AdminSite
 
 from figures.admin import (
     CourseDailyMetricsAdmin,
+    CourseDaysToCompleteAggregateAdmin,
     SiteDailyMetricsAdmin,
     LearnerCourseGradeMetricsAdmin,
     PipelineErrorAdmin,
+    PipelineRunAdmin,
+    PipelineCourseRunAdmin,
     )
 from figures.models import (
     CourseDailyMetrics,
+    CourseDaysToCompleteAggregate,
     SiteDailyMetrics,
     LearnerCourseGradeMetrics,
     PipelineError,
+    PipelineRun,
+    PipelineCourseRun,
     )
 
 @pytest.mark.django_db
@@ -31,9 +37,12 @@ class TestModelAdminRepresentations(object):
 
     @pytest.mark.parametrize('model_class, model_admin_class', [
             (CourseDailyMetrics, CourseDailyMetricsAdmin),
+            (CourseDaysToCompleteAggregate, CourseDaysToCompleteAggregateAdmin),
             (SiteDailyMetrics, SiteDailyMetricsAdmin),
             (LearnerCourseGradeMetrics, LearnerCourseGradeMetricsAdmin),
             (PipelineError, PipelineErrorAdmin),
+            (PipelineRun, PipelineRunAdmin),
+            (PipelineCourseRun, PipelineCourseRunAdmin),
         ])
     def test_course_daily_metrics_admin(self, model_class, model_admin_class):
         obj = model_admin_class(model_class, self.admin_site)
@@ -0,0 +1,88 @@
+'''Tests figures.cache
+'''
+
+import datetime
+import mock
+import pytest
+
+from figures import cache as figures_cache
+from figures.pipeline import site_daily_metrics as pipeline_sdm
+
+TODAY = datetime.date(2018, 6, 15)
+CLOSED_DATE = datetime.date(2018, 4, 30)
+
+
+class MetricsMethod(object):
+    '''Counts the calls to the metrics method
+    '''
+    def __init__(self, data=None):
+        self.data = dict(total_site_users=1) if data is None else data
+        self.calls = 0
+
+    def __call__(self, date_for=None):
+        self.calls += 1
+        return self.data
+
+
+class TestCachedSiteMetrics(object):
+
+    @pytest.fixture(autouse=True)
+    def setup(self):
+        figures_cache.get_cache().clear()
+        patcher = mock.patch('figures.cache.today', return_value=TODAY)
+        patcher.start()
+        yield
+        patcher.stop()
+
+    def test_reuses_cached_data(self):
+        method = MetricsMethod()
+        assert figures_cache.cached_site_metrics(method) == method.data
+        assert figures_cache.cached_site_metrics(method, date_for=TODAY) == method.data
+        assert method.calls == 1
+
+    def test_bump_invalidates_current_month(self):
+        method = MetricsMethod()
+        figures_cache.cached_site_metrics(method)
+        figures_cache.bump_data_version(TODAY)
+        figures_cache.cached_site_metrics(method)
+        assert method.calls == 2
+
+    def test_closed_month(self):
+        method = MetricsMethod()
+        figures_cache.cached_site_metrics(method, date_for=CLOSED_DATE)
+        figures_cache.bump_data_version(TODAY)
+        figures_cache.cached_site_metrics(method, date_for=CLOSED_DATE)
+        assert method.calls == 1
+        figures_cache.bump_data_version(CLOSED_DATE)
+        figures_cache.cached_site_metrics(method, date_for=CLOSED_DATE)
+        assert method.calls == 2
+
+    def test_empty_data_not_cached(self):
+        method = MetricsMethod(data={})
+        figures_cache.cached_site_metrics(method)
+        figures_cache.cached_site_metrics(method)
+        assert method.calls == 2
+
+    def test_cache_off(self):
+        method = MetricsMethod()
+        with mock.patch('figures.settings.env_tokens', {'METRICS_CACHE': None}):
+            figures_cache.bump_data_version(TODAY)
+            figures_cache.cached_site_metrics(method)
+            figures_cache.cached_site_metrics(method)
+        assert method.calls == 2
+
+
+@pytest.mark.django_db
+def test_loader_bumps_data_version():
+    class MockExtractor(object):
+        def extract(self, **kwargs):
+            return dict(todays_active_user_count=1,
+                        cumulative_active_user_count=2,
+                        total_user_count=3,
+                        course_count=4,
+                        total_enrollment_count=5)
+
+    cache = figures_cache.get_cache()
+    version = figures_cache.get_data_version(cache)
+    pipeline_sdm.SiteDailyMetricsLoader(extractor=MockExtractor()).load()
+    assert figures_cache.get_data_version(cache) != version
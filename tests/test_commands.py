@@ -2,14 +2,110 @@
 
 '''
 
+import datetime
+import json
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
 from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.test import TestCase
 from django.utils.six import StringIO
 
+from certificates.models import GeneratedCertificate
+from courseware.models import StudentModule
+from openedx.core.djangoapps.content.course_overviews.models import CourseOverview
+from student.models import CourseAccessRole, CourseEnrollment, UserProfile
+
+from figures.helpers import as_datetime
+
+from tests.factories import CourseEnrollmentFactory, CourseOverviewFactory
+
+
 class PopulateFiguresMetricsTest(TestCase):
     def test_command_output(self):
         out = StringIO()
         call_command('populate_figures_metrics', '--no-delay', stdout=out)
 
         self.assertEqual('', out.getvalue())
-        #self.assertIn('Expected output', out.getvalue())
\ No newline at end of file
+        #self.assertIn('Expected output', out.getvalue())
+
+    def test_parallel(self):
+        out = StringIO()
+        call_command('populate_figures_metrics', '--no-delay', '--parallel', stdout=out)
+
+        self.assertEqual('', out.getvalue())
+
+    def test_profile_report(self):
+        CourseEnrollmentFactory(course_overview=CourseOverviewFactory())
+        report_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, report_dir)
+        path = os.path.join(report_dir, 'report.json')
+        call_command('populate_figures_metrics', '--profile',
+                     '--report={}'.format(path), '--date=2018-06-01')
+
+        with open(path) as f:
+            report = json.load(f)
+        self.assertEqual(report['course_count'], 1)
+        self.assertEqual(report['date_for'], '2018-06-01')
+        self.assertEqual(len(report['profiles']), 1)
+        self.assertTrue(os.path.exists(list(report['profiles'].values())[0]))
+
+    def test_profile_populated_date(self):
+        CourseEnrollmentFactory(course_overview=CourseOverviewFactory())
+        report_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, report_dir)
+        path = os.path.join(report_dir, 'report.json')
+        call_command('populate_figures_metrics', '--no-delay', '--date=2018-06-01')
+        with self.assertRaises(CommandError):
+            call_command('populate_figures_metrics', '--report={}'.format(path),
+                         '--date=2018-06-01')
+        self.assertFalse(os.path.exists(path))
+
+    def test_profile_without_report(self):
+        with self.assertRaises(CommandError):
+            call_command('populate_figures_metrics', '--profile')
+
+    def test_profile_parallel(self):
+        with self.assertRaises(CommandError):
+            call_command('populate_figures_metrics', '--profile', '--parallel')
+
+
+class RebuildDaysToCompleteTest(TestCase):
+    def test_command_output(self):
+        out = StringIO()
+        call_command('rebuild_days_to_complete', '--date=2018-06-01', stdout=out)
+
+        self.assertEqual('', out.getvalue())
+
+
+class SeedFiguresDataTest(TestCase):
+    def seed(self):
+        call_command('seed_figures_data', '--users=50', '--courses=4',
+                     '--enrollments=120', '--days=60', '--end-date=2018-06-01',
+                     '--seed=42', '--batch-size=25')
+        return sorted(
+            (str(ce.course_id), ce.user.username, ce.created, ce.mode)
+            for ce in CourseEnrollment.objects.select_related('user'))
+
+    def test_seed(self):
+        enrollments = self.seed()
+        self.assertEqual(get_user_model().objects.count(), 50)
+        self.assertEqual(UserProfile.objects.count(), 50)
+        self.assertEqual(CourseOverview.objects.count(), 4)
+        self.assertTrue(0 < len(enrollments) <= 120)
+        self.assertTrue(StudentModule.objects.exists())
+        self.assertTrue(CourseAccessRole.objects.exists())
+        end = as_datetime(datetime.date(2018, 6, 1))
+        self.assertTrue(all(created <= end for course_id, username, created, mode
+                            in enrollments))
+
+    def test_seed_is_deterministic(self):
+        enrollments = self.seed()
+        for model in [CourseAccessRole, GeneratedCertificate, StudentModule,
+                      CourseEnrollment, UserProfile, CourseOverview]:
+            model.objects.all().delete()
+        get_user_model().objects.all().delete()
+        self.assertEqual(self.seed(), enrollments)
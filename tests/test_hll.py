@@ -0,0 +1,56 @@
+'''Tests figures.hll
+'''
+
+import pytest
+
+from figures.hll import HyperLogLog
+
+
+class TestHyperLogLog(object):
+
+    def test_empty(self):
+        assert HyperLogLog().count() == 0
+
+    @pytest.mark.parametrize('count', [1, 5, 100])
+    def test_small_counts_are_exact(self, count):
+        sketch = HyperLogLog().update(range(count))
+        assert sketch.count() == count
+
+    def test_duplicates_are_counted_once(self):
+        sketch = HyperLogLog().update([1, 2, 3] * 10)
+        assert sketch.count() == 3
+
+    def test_large_count_within_error(self):
+        sketch = HyperLogLog().update(range(50000))
+        assert abs(sketch.count() - 50000) < 50000 * 0.05
+
+    def test_merge_counts_union(self):
+        first = HyperLogLog().update(range(0, 3000))
+        second = HyperLogLog().update(range(2000, 5000))
+        merged = HyperLogLog.union([first, second])
+        assert merged.count() == HyperLogLog().update(range(5000)).count()
+        # The merged sketches are not changed
+        assert first.count() == HyperLogLog().update(range(3000)).count()
+
+    def test_merge_different_precisions(self):
+        with pytest.raises(ValueError):
+            HyperLogLog(precision=10).merge(HyperLogLog(precision=12))
+
+    @pytest.mark.parametrize('count', [0, 10, 20000])
+    def test_serialize(self, count):
+        sketch = HyperLogLog().update(range(count))
+        data = sketch.to_bytes()
+        restored = HyperLogLog.from_bytes(data)
+        assert restored.registers == sketch.registers
+        assert restored.precision == sketch.precision
+        assert restored.count() == sketch.count()
+
+    def test_sparse_is_compact(self):
+        sketch = HyperLogLog().update(range(10))
+        assert len(sketch.to_bytes()) == 2 + 3 * 10
+        dense = HyperLogLog().update(range(20000))
+        assert len(dense.to_bytes()) == 2 + dense.m
+
+    def test_from_bytes_not_a_sketch(self):
+        with pytest.raises(ValueError):
+            HyperLogLog.from_bytes(b'X\x0c')
@@ -14,7 +14,8 @@ from django.utils.timezone import utc
 
 from student.models import CourseEnrollment
 
-from figures.models import CourseDailyMetrics, SiteDailyMetrics
+from figures.models import CourseDailyMetrics, CourseMonthlyMetrics, SiteDailyMetrics
+from figures.pipeline.instrumentation import count_queries
 from figures.serializers import (
     CourseDailyMetricsSerializer,
     CourseDetailsSerializer,
@@ -131,6 +132,27 @@ class TestCourseDetailsSerializer(object):
         assert parse(data['end_date']) == self.course_overview.enrollment_end
         assert data['self_paced'] == self.course_overview.self_paced
 
+    def test_history_from_monthly_metrics(self):
+        month_for = datetime.datetime.utcnow().date().replace(day=1)
+        CourseMonthlyMetrics.objects.create(
+            course_id=str(self.course_overview.id),
+            month_for=month_for,
+            enrollment_count=12,
+            average_progress=0.25,
+            average_days_to_complete=9,
+            num_learners_completed=3)
+        serializer = CourseDetailsSerializer(instance=self.course_overview)
+        with count_queries() as counter:
+            assert serializer.get_learners_enrolled(
+                self.course_overview)['current_month'] == 12
+            assert serializer.get_average_progress(
+                self.course_overview)['current_month'] == 0.25
+            assert serializer.get_users_completed(
+                self.course_overview)['current_month'] == 3
+        # The monthly metrics, then one query for all of the fields for the
+        # six months without a record
+        assert counter.count == 2
+
     def test_get_staff_with_no_course(self):
         '''Create a serializer for a course with a different ID than for the
         data we set up. This simulates when there are no staff members for the
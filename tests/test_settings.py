@@ -22,6 +22,121 @@ def test_log_pipeline_errors_to_db_true(env_tokens, expected):
         assert figures_settings.log_pipeline_errors_to_db() == expected
 
 
+@pytest.mark.parametrize('env_tokens, expected ', [
+        ({}, False),
+        ({'INCREMENTAL_GRADES': True}, True),
+        ({'INCREMENTAL_GRADES': False}, False),
+    ])
+def test_incremental_grades(env_tokens, expected):
+    with mock.patch('figures.settings.env_tokens', env_tokens):
+        assert figures_settings.incremental_grades() == expected
+
+
+@pytest.mark.parametrize('env_tokens, expected ', [
+        ({}, 0),
+        ({'PIPELINE_GRADES_TIME_BUDGET': 0}, 0),
+        ({'PIPELINE_GRADES_TIME_BUDGET': 120}, 120),
+    ])
+def test_pipeline_grades_time_budget(env_tokens, expected):
+    with mock.patch('figures.settings.env_tokens', env_tokens):
+        assert figures_settings.pipeline_grades_time_budget() == expected
+
+
+@pytest.mark.parametrize('env_tokens, expected ', [
+        ({}, (figures_settings.DEFAULT_SAMPLED_PROGRESS_MIN_ENROLLMENTS,
+              figures_settings.DEFAULT_SAMPLED_PROGRESS_SAMPLE_SIZE,
+              figures_settings.DEFAULT_SAMPLED_PROGRESS_TARGET_ERROR,
+              figures_settings.DEFAULT_SAMPLED_PROGRESS_MAX_DAYS)),
+        ({'SAMPLED_PROGRESS_MIN_ENROLLMENTS': 100000,
+          'SAMPLED_PROGRESS_SAMPLE_SIZE': 500,
+          'SAMPLED_PROGRESS_TARGET_ERROR': 0.01,
+          'SAMPLED_PROGRESS_MAX_DAYS': 14}, (100000, 500, 0.01, 14)),
+    ])
+def test_sampled_progress_settings(env_tokens, expected):
+    with mock.patch('figures.settings.env_tokens', env_tokens):
+        assert (figures_settings.sampled_progress_min_enrollments(),
+                figures_settings.sampled_progress_sample_size(),
+                figures_settings.sampled_progress_target_error(),
+                figures_settings.sampled_progress_max_days()) == expected
+
+
+@pytest.mark.parametrize('env_tokens, expected ', [
+        ({}, (figures_settings.DEFAULT_BULK_WRITE_BATCH_SIZE,
+              figures_settings.DEFAULT_BULK_WRITE_TRANSACTION_SIZE)),
+        ({'BULK_WRITE_BATCH_SIZE': 10, 'BULK_WRITE_TRANSACTION_SIZE': 100},
+         (10, 100)),
+    ])
+def test_bulk_write_sizes(env_tokens, expected):
+    with mock.patch('figures.settings.env_tokens', env_tokens):
+        assert (figures_settings.bulk_write_batch_size(),
+                figures_settings.bulk_write_transaction_size()) == expected
+
+
+@pytest.mark.parametrize('env_tokens, expected ', [
+        ({}, (figures_settings.DEFAULT_GRADES_WORKER_COUNT,
+              figures_settings.DEFAULT_GRADES_CHUNK_SIZE)),
+        ({'GRADES_WORKER_COUNT': 4, 'GRADES_CHUNK_SIZE': 200}, (4, 200)),
+    ])
+def test_grades_pool_settings(env_tokens, expected):
+    with mock.patch('figures.settings.env_tokens', env_tokens):
+        assert (figures_settings.grades_worker_count(),
+                figures_settings.grades_chunk_size()) == expected
+
+
+@pytest.mark.parametrize('env_tokens, expected ', [
+        ({}, (figures_settings.DEFAULT_PIPELINE_COURSE_MAX_ATTEMPTS,
+              figures_settings.DEFAULT_PIPELINE_RETRY_BACKOFF,
+              figures_settings.DEFAULT_PIPELINE_COURSE_TIME_LIMIT,
+              figures_settings.DEFAULT_PIPELINE_RUN_TIMEOUT,
+              figures_settings.DEFAULT_PIPELINE_TASK_BATCH_SECONDS)),
+        ({'PIPELINE_COURSE_MAX_ATTEMPTS': 5,
+          'PIPELINE_RETRY_BACKOFF': 10,
+          'PIPELINE_COURSE_TIME_LIMIT': 300,
+          'PIPELINE_RUN_TIMEOUT': 3600,
+          'PIPELINE_TASK_BATCH_SECONDS': 30}, (5, 10, 300, 3600, 30)),
+    ])
+def test_parallel_pipeline_settings(env_tokens, expected):
+    with mock.patch('figures.settings.env_tokens', env_tokens):
+        assert (figures_settings.pipeline_course_max_attempts(),
+                figures_settings.pipeline_retry_backoff(),
+                figures_settings.pipeline_course_time_limit(),
+                figures_settings.pipeline_run_timeout(),
+                figures_settings.pipeline_task_batch_seconds()) == expected
+
+
+@pytest.mark.parametrize('env_tokens, expected ', [
+        ({}, None),
+        ({'PIPELINE_SPAN_LOG': '/tmp/figures-spans.jsonl'},
+         '/tmp/figures-spans.jsonl'),
+    ])
+def test_pipeline_span_log(env_tokens, expected):
+    with mock.patch('figures.settings.env_tokens', env_tokens):
+        assert figures_settings.pipeline_span_log() == expected
+
+
+@pytest.mark.parametrize('env_tokens, expected ', [
+        ({}, 'default'),
+        ({'METRICS_CACHE': 'figures'}, 'figures'),
+        ({'METRICS_CACHE': None}, None),
+    ])
+def test_metrics_cache(env_tokens, expected):
+    with mock.patch('figures.settings.env_tokens', env_tokens):
+        assert figures_settings.metrics_cache() == expected
+
+
+@pytest.mark.parametrize('figures_env_tokens, expected', [
+        (None, 'figures.tasks.populate_daily_metrics'),
+        ({'PARALLEL_DAILY_METRICS': True},
+         'figures.tasks.parallel_populate_daily_metrics'),
+    ])
+def test_update_celerybeat_schedule_task(figures_env_tokens, expected):
+    celerybeat_schedule_settings = {}
+    figures_settings.update_celerybeat_schedule(
+        celerybeat_schedule_settings, figures_env_tokens)
+    assert celerybeat_schedule_settings[
+        figures_settings.DAILY_METRICS_CELERY_TASK_LABEL]['task'] == expected
+
+
 class TestUpdateSettings(object):
     '''
     figures.settings.update_settings is a convenience method that wraps
@@ -0,0 +1,233 @@
+'''Tests the Figures Celery tasks
+
+The tasks are called directly. Queuing tasks is mocked
+'''
+
+import datetime
+import mock
+import pytest
+
+from django.utils.timezone import utc
+
+from figures.models import (
+    ActiveUsersSketch,
+    CourseDailyMetrics,
+    PipelineCourseRun,
+    PipelineRun,
+    SiteDailyMetrics,
+)
+from figures import tasks
+from figures.pipeline.instrumentation import count_queries
+
+from tests.factories import CourseEnrollmentFactory, CourseOverviewFactory
+
+
+@pytest.mark.django_db
+class TestPopulateDailyMetrics(object):
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        self.date_for = datetime.date(2018, 6, 1)
+        self.course_overviews = [CourseOverviewFactory() for i in range(3)]
+        for co in self.course_overviews:
+            CourseEnrollmentFactory(course_overview=co)
+
+    def test_records_run(self):
+        run_id = tasks.populate_daily_metrics(date_for=self.date_for)
+        run = PipelineRun.objects.get(id=run_id)
+        assert run.mode == PipelineRun.SERIAL
+        assert run.status == PipelineRun.COMPLETE
+        assert run.finished
+        assert 'site_daily_metrics' in run.stage_durations
+        assert run.course_runs.filter(
+            status=PipelineCourseRun.COMPLETE).count() == len(self.course_overviews)
+        assert sum(run.course_runs.values_list(
+            'learners_processed', flat=True)) == len(self.course_overviews)
+
+    def test_writes_site_sketch(self):
+        tasks.populate_daily_metrics(date_for=self.date_for)
+        assert ActiveUsersSketch.objects.filter(
+            date_for=self.date_for, course_id='').exists()
+
+    def test_failed_course_is_recorded(self):
+        failing_course_id = str(self.course_overviews[1].id)
+        real_load = tasks.runs.CourseDailyMetricsLoader.load
+
+        def load(loader, **kwargs):
+            if loader.course_id == failing_course_id:
+                raise Exception('boom')
+            return real_load(loader, **kwargs)
+
+        with mock.patch.object(tasks.runs.CourseDailyMetricsLoader, 'load', load):
+            run_id = tasks.populate_daily_metrics(date_for=self.date_for)
+        course_run = PipelineCourseRun.objects.get(
+            run_id=run_id, course_id=failing_course_id)
+        assert course_run.status == PipelineCourseRun.FAILED
+        assert course_run.attempts == 1
+        assert course_run.error == 'boom'
+        assert SiteDailyMetrics.objects.filter(date_for=self.date_for).exists()
+
+    def test_rerun_completed_day(self):
+        tasks.populate_daily_metrics(date_for=self.date_for)
+        with count_queries() as counter:
+            assert tasks.populate_daily_metrics(date_for=self.date_for) is None
+        # Course ids, existing course metrics and the site metrics check
+        assert counter.count == 3
+        assert PipelineRun.objects.count() == 1
+
+    def test_resume(self):
+        # A run that stopped after its first course
+        course_ids = [co.id for co in self.course_overviews]
+        run = tasks.runs.start_pipeline_run(
+            self.date_for, course_ids, mode=PipelineRun.SERIAL)
+        first_course_run = run.course_runs.order_by('id').first()
+        tasks.runs.run_course(first_course_run)
+
+        with mock.patch('figures.tasks.runs.run_course',
+                        wraps=tasks.runs.run_course) as mock_run_course:
+            run_id = tasks.populate_daily_metrics(date_for=self.date_for)
+        assert run_id == run.id
+        assert mock_run_course.call_count == len(course_ids) - 1
+        assert first_course_run.id not in [
+            call[0][0].id for call in mock_run_course.call_args_list]
+        run.refresh_from_db()
+        assert run.status == PipelineRun.COMPLETE
+
+
+@pytest.mark.django_db
+class TestParallelPopulateDailyMetrics(object):
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        self.date_for = datetime.date(2018, 6, 1)
+        self.course_overviews = [CourseOverviewFactory() for i in range(3)]
+        for co in self.course_overviews:
+            CourseEnrollmentFactory(course_overview=co)
+
+    def test_no_delay(self):
+        run_id = tasks.parallel_populate_daily_metrics(
+            date_for=self.date_for, delay=False)
+        run = PipelineRun.objects.get(id=run_id)
+        assert run.status == PipelineRun.COMPLETE
+        assert CourseDailyMetrics.objects.filter(
+            date_for=self.date_for).count() == len(self.course_overviews)
+        assert SiteDailyMetrics.objects.filter(date_for=self.date_for).exists()
+
+    def test_rerun(self):
+        tasks.parallel_populate_daily_metrics(date_for=self.date_for, delay=False)
+        assert tasks.parallel_populate_daily_metrics(
+            date_for=self.date_for, delay=False) is None
+        assert PipelineRun.objects.count() == 1
+        assert CourseDailyMetrics.objects.filter(
+            date_for=self.date_for).count() == len(self.course_overviews)
+        assert SiteDailyMetrics.objects.filter(date_for=self.date_for).count() == 1
+
+    def test_rerun_fills_gaps(self):
+        tasks.parallel_populate_daily_metrics(date_for=self.date_for, delay=False)
+        CourseDailyMetrics.objects.filter(
+            course_id=str(self.course_overviews[0].id)).delete()
+        run_id = tasks.parallel_populate_daily_metrics(
+            date_for=self.date_for, delay=False)
+        run = PipelineRun.objects.get(id=run_id)
+        assert run.status == PipelineRun.COMPLETE
+        assert list(run.course_runs.values_list('course_id', flat=True)) == [
+            str(self.course_overviews[0].id)]
+        assert CourseDailyMetrics.objects.filter(
+            date_for=self.date_for).count() == len(self.course_overviews)
+
+    def test_force_update_rerun(self):
+        tasks.parallel_populate_daily_metrics(date_for=self.date_for, delay=False)
+        run_id = tasks.parallel_populate_daily_metrics(
+            date_for=self.date_for, force_update=True, delay=False)
+        run = PipelineRun.objects.get(id=run_id)
+        assert run.course_runs.count() == len(self.course_overviews)
+
+    def test_failed_course_does_not_block_site_metrics(self):
+        failing_course_id = str(self.course_overviews[0].id)
+        real_load = tasks.runs.CourseDailyMetricsLoader.load
+
+        def load(loader, **kwargs):
+            if loader.course_id == failing_course_id:
+                raise Exception('boom')
+            return real_load(loader, **kwargs)
+
+        with mock.patch.object(tasks.runs.CourseDailyMetricsLoader, 'load', load):
+            run_id = tasks.parallel_populate_daily_metrics(
+                date_for=self.date_for, delay=False)
+        run = PipelineRun.objects.get(id=run_id)
+        assert run.status == PipelineRun.COMPLETE
+        course_run = run.course_runs.get(course_id=failing_course_id)
+        assert course_run.status == PipelineCourseRun.FAILED
+        assert course_run.attempts == 3
+        assert SiteDailyMetrics.objects.filter(date_for=self.date_for).exists()
+
+    @mock.patch('figures.tasks.check_pipeline_run.apply_async')
+    @mock.patch('figures.tasks.populate_course_runs.apply_async')
+    def test_delay_queues_course_tasks(self, mock_course_task, mock_check_task):
+        # Every course is small enough to share a task
+        run_id = tasks.parallel_populate_daily_metrics(date_for=self.date_for)
+        assert mock_course_task.call_count == 1
+        assert len(mock_course_task.call_args[1]['kwargs']['course_run_ids']) == (
+            len(self.course_overviews))
+        mock_check_task.assert_called_once_with(
+            args=(run_id,), countdown=mock.ANY)
+        assert PipelineRun.objects.get(id=run_id).status == PipelineRun.RUNNING
+
+    @mock.patch('figures.tasks.populate_course_run.apply_async')
+    @mock.patch('figures.pipeline.runs.CourseDailyMetricsLoader.load',
+                side_effect=Exception('boom'))
+    def test_retry_is_queued_with_backoff(self, mock_load, mock_apply_async):
+        run = tasks.runs.start_pipeline_run(
+            self.date_for, [self.course_overviews[0].id])
+        course_run = run.course_runs.get()
+        tasks.populate_course_run(course_run_id=course_run.id)
+        assert mock_apply_async.call_args[1]['countdown'] == (
+            tasks.runs.retry_countdown(1))
+        course_run.refresh_from_db()
+        assert course_run.status == PipelineCourseRun.PENDING
+
+    @mock.patch('figures.tasks.check_pipeline_run.apply_async')
+    @mock.patch('figures.tasks.populate_course_runs.apply_async')
+    def test_delay_queues_expensive_courses_first(self, mock_course_task,
+                                                  mock_check_task):
+        big_course = self.course_overviews[1]
+        for i in range(200):
+            CourseEnrollmentFactory(course_overview=big_course,
+                                    created=datetime.datetime(2018, 1, 1, tzinfo=utc))
+        tasks.parallel_populate_daily_metrics(date_for=self.date_for)
+        assert mock_course_task.call_count == 2
+        first_task = mock_course_task.call_args_list[0][1]['kwargs']
+        assert list(first_task['course_counts'].keys()) == [str(big_course.id)]
+
+    @mock.patch('figures.tasks.check_pipeline_run.apply_async')
+    @mock.patch('figures.tasks.populate_course_runs.apply_async')
+    def test_batch_time_limit(self, mock_course_task, mock_check_task):
+        with mock.patch('figures.settings.env_tokens',
+                        {'PIPELINE_COURSE_TIME_LIMIT': 600}):
+            tasks.parallel_populate_daily_metrics(date_for=self.date_for)
+        # The small courses are packed into one batch
+        assert mock_course_task.call_count == 1
+        call_kwargs = mock_course_task.call_args[1]
+        assert len(call_kwargs['kwargs']['course_run_ids']) == len(self.course_overviews)
+        assert call_kwargs['soft_time_limit'] == 600 * len(self.course_overviews)
+
+    @mock.patch('figures.tasks.populate_course_run.apply_async')
+    @mock.patch('figures.pipeline.runs.CourseDailyMetricsLoader.load',
+                side_effect=Exception('boom'))
+    def test_batch_retries_course_in_own_task(self, mock_load, mock_apply_async):
+        run = tasks.runs.start_pipeline_run(
+            self.date_for, [co.id for co in self.course_overviews])
+        course_run_ids = list(run.course_runs.values_list('id', flat=True))
+        tasks.populate_course_runs(course_run_ids=course_run_ids)
+        assert sorted(call[1]['kwargs']['course_run_id']
+                      for call in mock_apply_async.call_args_list) == sorted(course_run_ids)
+        run.refresh_from_db()
+        assert run.status == PipelineRun.RUNNING
+
+    def test_check_pipeline_run(self):
+        run = tasks.runs.start_pipeline_run(
+            self.date_for, [co.id for co in self.course_overviews])
+        tasks.check_pipeline_run(run.id)
+        run.refresh_from_db()
+        assert run.status == PipelineRun.COMPLETE
+        assert run.course_runs.filter(
+            status=PipelineCourseRun.FAILED).count() == len(self.course_overviews)
+        assert SiteDailyMetrics.objects.filter(date_for=self.date_for).exists()
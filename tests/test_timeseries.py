@@ -0,0 +1,90 @@
+'''Tests figures.timeseries and the metrics defined with it
+'''
+
+import datetime
+from decimal import Decimal
+import pytest
+
+from django.db.models import Avg, Max
+
+from figures import metrics
+from figures.helpers import as_datetime
+from figures.models import CourseDailyMetrics, SiteDailyMetrics
+from figures.pipeline.instrumentation import count_queries
+from figures.timeseries import AggregateMetric, evaluate_metrics
+
+from tests.factories import (
+    CourseDailyMetricsFactory,
+    SiteDailyMetricsFactory,
+    StudentModuleFactory,
+)
+
+COURSE_IDS = ['course-v1:FigX+A01+2018', 'course-v1:FigX+B01+2018']
+
+PERIODS = [
+    (datetime.date(2018, 1, 1), datetime.date(2018, 1, 31)),
+    (datetime.date(2018, 2, 1), datetime.date(2018, 2, 28)),
+    (datetime.date(2018, 3, 1), datetime.date(2018, 3, 31)),
+]
+
+
+@pytest.mark.django_db
+class TestAggregateMetric(object):
+
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        for day, total_user_count in [(5, 10), (20, 15), (35, 30)]:
+            SiteDailyMetricsFactory(
+                date_for=datetime.date(2018, 1, 1) + datetime.timedelta(days=day),
+                total_user_count=total_user_count,
+                course_count=day)
+        for course_id, average_progress in zip(COURSE_IDS, ['0.10', '0.50']):
+            CourseDailyMetricsFactory(
+                course_id=course_id,
+                date_for=datetime.date(2018, 2, 10),
+                average_progress=Decimal(average_progress))
+
+    def test_evaluate(self):
+        metric = AggregateMetric(SiteDailyMetrics, 'total_user_count', Max)
+        with count_queries() as counter:
+            assert metric.evaluate(PERIODS) == [15, 30, 0]
+        assert counter.count == 1
+
+    def test_value_and_filters(self):
+        metric = AggregateMetric(CourseDailyMetrics, 'average_progress', Avg,
+                                 value=metrics.as_progress, default=0.0)
+        assert metric.evaluate(PERIODS) == [0.0, 0.3, 0.0]
+        assert metric.evaluate(PERIODS, course_id=COURSE_IDS[1]) == [0.0, 0.5, 0.0]
+
+    def test_evaluate_metrics(self):
+        with count_queries() as counter:
+            actual = evaluate_metrics(
+                [metrics.TOTAL_SITE_USERS, metrics.TOTAL_SITE_COURSES], PERIODS)
+        assert counter.count == 1
+        assert actual == [[15, 30, 0], [20, 35, 0]]
+
+    def test_no_periods(self):
+        assert metrics.TOTAL_SITE_USERS.evaluate([]) == []
+
+
+@pytest.mark.django_db
+class TestActiveUsersMetric(object):
+
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        created = as_datetime(datetime.date(2018, 1, 2))
+        for day in [3, 4, 40]:
+            StudentModuleFactory(
+                created=created,
+                modified=as_datetime(datetime.date(2018, 1, 1) + datetime.timedelta(days=day)))
+
+    def test_raw_periods_in_one_query(self):
+        with count_queries() as counter:
+            actual = metrics.ACTIVE_USERS.evaluate(PERIODS)
+        # The sketches, then the StudentModule records
+        assert counter.count == 2
+        assert actual == [
+            metrics.get_active_users_for_time_period(start_date, end_date)
+            for start_date, end_date in PERIODS]
+        # Only records created in the period are counted
+        assert actual == [2, 0, 0]
@@ -11,6 +11,7 @@ from rest_framework.test import (
     force_authenticate,
     )
 
+from figures.cache import get_cache
 from figures.views import GeneralSiteMetricsView
 from tests.views.base import BaseViewTest
 
@@ -39,6 +40,7 @@ class TestGeneralSiteMetricsView(BaseViewTest):
     @pytest.fixture(autouse=True)
     def setup(self, db):
         super(TestGeneralSiteMetricsView, self).setup(db)
+        get_cache().clear()
         self.view_class.metrics_method = property(
             lambda self: mock_get_monthly_site_metrics)
 
@@ -0,0 +1,69 @@
+'''Tests Figures PipelineRunViewSet class
+'''
+
+import datetime
+import pytest
+
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from figures.models import PipelineCourseRun, PipelineRun
+from figures.pipeline import runs
+from figures.views import PipelineRunViewSet
+
+from tests.factories import CourseOverviewFactory
+from tests.views.base import BaseViewTest
+
+
+@pytest.mark.django_db
+class TestPipelineRunView(BaseViewTest):
+
+    request_path = 'api/pipeline-runs'
+    view_class = PipelineRunViewSet
+
+    @pytest.fixture(autouse=True)
+    def setup(self, db):
+        super(TestPipelineRunView, self).setup(db)
+        self.date_for = datetime.date(2018, 6, 1)
+        self.course_overviews = [CourseOverviewFactory() for i in range(3)]
+        self.run = runs.start_pipeline_run(
+            self.date_for, [co.id for co in self.course_overviews])
+        course_runs = list(self.run.course_runs.order_by('id'))
+        course_runs[0].status = PipelineCourseRun.COMPLETE
+        course_runs[0].learners_processed = 10
+        course_runs[0].query_count = 20
+        course_runs[0].save()
+        course_runs[1].status = PipelineCourseRun.FAILED
+        course_runs[1].error_count = 1
+        course_runs[1].save()
+        runs.start_pipeline_run(datetime.date(2018, 6, 2), [])
+
+    def get(self, path, action, **kwargs):
+        request = APIRequestFactory().get(path)
+        force_authenticate(request, user=self.staff_user)
+        view = self.view_class.as_view({'get': action})
+        return view(request, **kwargs)
+
+    def test_list(self):
+        response = self.get(
+            '{}?date_for={}'.format(self.request_path, self.date_for), 'list')
+        assert response.status_code == 200
+        assert response.data['count'] == 1
+        data = response.data['results'][0]
+        assert data['id'] == self.run.id
+        assert data['status'] == PipelineRun.RUNNING
+        assert data['course_count'] == 3
+        assert data['courses_complete'] == 1
+        assert data['courses_failed'] == 1
+        assert data['learners_processed'] == 10
+        assert data['error_count'] == 1
+        assert data['course_query_count'] == 20
+        assert 'course_runs' not in data
+
+    def test_retrieve(self):
+        response = self.get(
+            '{}/{}'.format(self.request_path, self.run.id), 'retrieve',
+            pk=self.run.id)
+        assert response.status_code == 200
+        assert response.data['course_count'] == 3
+        assert set(rec['course_id'] for rec in response.data['course_runs']) == set(
+            str(co.id) for co in self.course_overviews)